@@ -1,17 +1,25 @@
-import requests
-from typing import List, Dict, Optional
+import asyncio
+from typing import List, Dict, Optional, Tuple
 import json
 import os
 from dotenv import load_dotenv
 from backend.storage import Storage
+from backend.ai_client import AIHttpClient, AIClientError, extract_json
+from backend.insight_cache import InsightCache, insight_fingerprint
 
 # Загружаем переменные из .env
 load_dotenv()
 
+# Меняется вместе со смыслом промптов: старые ответы в кэше инсайтов перестают подходить
+PROMPT_VERSION = 1
+
 class CustomAIAnalyzer:
-    def __init__(self):
+    def __init__(self, client: Optional[AIHttpClient] = None, cache: Optional[InsightCache] = None):
         self.api_key = os.getenv('CUSTOM_AI_API_KEY')
-        self.url = "https://api.intelligence.io.solutions/api/v1/chat/completions"
+        # Адрес переопределяется, например, для локальной заглушки API в тестах
+        self.url = os.getenv('CUSTOM_AI_URL', "https://api.intelligence.io.solutions/api/v1/chat/completions")
+        self.client = client or AIHttpClient()
+        self.cache = cache
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
@@ -46,33 +54,63 @@ class CustomAIAnalyzer:
             "TERRAFORM_ERROR_RECOMMENDATION": """Ты эксперт по Terraform. 
             На основе следующей ошибки предоставь конкретные рекомендации по её устранению на русском языке:
 
-            Ошибка: """
+            Ошибка: """,
+
+            "TERRAFORM_SUMMARY_MERGE": """Ты эксперт по анализу логов Terraform.
+            Ниже резюме анализа отдельных частей одного и того же лога. Сведи их в одно общее резюме
+            на русском языке, без повторов, начиная с самого важного. Ответ - JSON:
+
+            {"summary": "Общее резюме"}
+
+            Резюме частей:"""
         }
 
-    def analyze_logs(self, logs: List[Dict]) -> Dict:
-        """Анализ логов с помощью ИИ"""
+    def prompt_key(self, prompt_type: str) -> str:
+        """Версия и текст промпта - часть ключа кэша инсайтов"""
+        return f"{PROMPT_VERSION}:{self._prompts[prompt_type]}"
+
+    async def complete_json(self, text: str, prompt_type: str = "TERRAFORM_LOG_ANALYSIS", client: Optional[AIHttpClient] = None) -> Dict:
+        """Ответ модели на готовый текст в виде JSON (для анализа по частям, см. ai_mapreduce);
+        AIClientError или ValueError, если ответа нет"""
+        response_data = await (client or self.client).post_json(self.url, self._build_payload(text, prompt_type), self.headers)
+        return extract_json(response_data['choices'][0]['message']['content'])
+
+    async def analyze_logs_async(self, logs: List[Dict], client: Optional[AIHttpClient] = None) -> Dict:
+        """Анализ логов с помощью ИИ; cache_hit - ответ взят из кэша инсайтов, без запроса к модели"""
         if not logs or not self.api_key:
-            return self._mock_analysis(logs)
-        
+            return dict(self._mock_analysis(logs), cache_hit=False)
+        if self.cache is None:
+            insights, _ = await self._request_analysis(logs, client)
+            return dict(insights, cache_hit=False)
+        key = insight_fingerprint(logs, self.model, self.prompt_key("TERRAFORM_LOG_ANALYSIS"))
+        insights, cached_at = await self.cache.get_or_compute(key, self.model, lambda: self._request_analysis(logs, client))
+        return dict(insights, cache_hit=cached_at is not None)
+
+    async def _request_analysis(self, logs: List[Dict], client: Optional[AIHttpClient] = None) -> Tuple[Dict, bool]:
+        """(ответ, получен ли он от модели); демо-ответ при ошибке API не кэшируется"""
         # Подготовка текста для анализа
         text_for_analysis = self._prepare_logs_text(logs)
 
         try:
             payload = self._build_payload(text_for_analysis, "TERRAFORM_LOG_ANALYSIS")
-            response = requests.post(
-                self.url,
-                json=payload,
-                headers=self.headers
-            )
-            if response.status_code == 200:
-                response_data = response.json()
-                return self._parse_response(response_data, logs)
-            else:
-                print(f"❌ API Error: {response.status_code} - {response.text}")
-                return self._mock_analysis(logs)
+            response_data = await (client or self.client).post_json(self.url, payload, self.headers)
+            return self._parse_response(response_data, logs), True
+        except AIClientError as e:
+            print(f"❌ API Error: {e}")
+            return self._mock_analysis(logs), False
         except Exception as e:
             print(f"❌ Error calling API: {e}")
-            return self._mock_analysis(logs)
+            return self._mock_analysis(logs), False
+
+    def analyze_logs(self, logs: List[Dict]) -> Dict:
+        """Синхронный анализ для скриптов (test_hf_api.py); сервер вызывает analyze_logs_async"""
+        async def run():
+            client = AIHttpClient()
+            try:
+                return await self.analyze_logs_async(logs, client)
+            finally:
+                await client.close()
+        return asyncio.run(run())
 
     def _prepare_logs_text(self, logs: List[Dict]) -> str:
         """Подготовка текста логов для анализа"""
@@ -177,9 +215,10 @@ class CustomAIAnalyzer:
             "confidence": 0.60
         }
 
-    def get_ai_insights(self, query: str = None, limit: int = 100) -> Dict:
+    async def get_ai_insights(self, query: str = None, limit: int = 100, store: Storage = None) -> Dict:
         """Получить ИИ-инсайты по логам из базы"""
-        store = Storage()
-        logs = store.search(q=query, limit=limit)
-        return self.analyze_logs(logs)
+        store = store or Storage()
+        # Запрос к SQLite блокирующий - в отдельном потоке, чтобы не держать event loop
+        logs = await asyncio.to_thread(store.search, q=query, limit=limit)
+        return await self.analyze_logs_async(logs)
     
\ No newline at end of file
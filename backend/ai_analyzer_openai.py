@@ -1,40 +1,81 @@
-import openai
+import asyncio
 import json
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 import os
 from dotenv import load_dotenv
 from backend.storage import Storage
+from backend.ai_client import AIHttpClient, extract_json
+from backend.insight_cache import InsightCache, insight_fingerprint
 
 # Загружаем переменные из .env
 load_dotenv()
 
+MODEL = "gpt-3.5-turbo"
+SYSTEM_PROMPT = "Ты эксперт по анализу логов Terraform. Отвечай на русском языке в формате JSON."
+MERGE_PROMPT = """Это резюме анализа нескольких частей одного лога Terraform. Объедини их в одно резюме
+        без повторов, самое важное - первым, и верни JSON вида {"summary": "..."}.
+
+        Резюме частей:"""
+# Меняется вместе со смыслом промпта: старые ответы в кэше инсайтов перестают подходить
+PROMPT_VERSION = 1
+
 class OpenAIAIAnalyzer:
-    def __init__(self):
+    def __init__(self, client: Optional[AIHttpClient] = None, cache: Optional[InsightCache] = None):
         self.api_key = os.getenv('OPENAI_API_KEY')
-        if self.api_key:
-            openai.api_key = self.api_key
-        else:
+        if not self.api_key:
             print("⚠️  OPENAI_API_KEY не найден в .env файле")
+        # Chat Completions REST API напрямую: у пакета openai 1.x+ нет openai.ChatCompletion
+        self.url = os.getenv('OPENAI_BASE_URL', "https://api.openai.com/v1").rstrip('/') + "/chat/completions"
+        self.client = client or AIHttpClient()
+        self.cache = cache
+        self.model = MODEL
+        self._prompts = {"TERRAFORM_LOG_ANALYSIS": self._prepare_context([]), "TERRAFORM_SUMMARY_MERGE": MERGE_PROMPT}
+
+    def prompt_key(self, prompt_type: str) -> str:
+        """Версия и текст промпта - часть ключа кэша инсайтов"""
+        return f"{PROMPT_VERSION}:{SYSTEM_PROMPT}:{self._prompts[prompt_type]}"
+
+    async def complete_json(self, text: str, prompt_type: str = "TERRAFORM_LOG_ANALYSIS", client: Optional[AIHttpClient] = None) -> Dict:
+        """Ответ модели на готовый текст в виде JSON (для анализа по частям, см. ai_mapreduce)"""
+        response = await (client or self.client).post_json(self.url, {
+            "model": MODEL,
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": self._prompts[prompt_type] + "\n\n" + text}
+            ],
+            "temperature": 0.3,
+            "max_tokens": 500
+        }, {"Authorization": f"Bearer {self.api_key}"})
+        return extract_json(response['choices'][0]['message']['content'])
     
-    def analyze_logs(self, logs: List[Dict]) -> Dict:
+    async def analyze_logs_async(self, logs: List[Dict], client: Optional[AIHttpClient] = None) -> Dict:
+        """Анализ логов; cache_hit - ответ взят из кэша инсайтов, без запроса к модели"""
         if not logs or not self.api_key:
-            return self._mock_analysis(logs)
-        
+            return dict(self._mock_analysis(logs), cache_hit=False)
+        if self.cache is None:
+            insights, _ = await self._request_analysis(logs, client)
+            return dict(insights, cache_hit=False)
+        key = insight_fingerprint(logs, MODEL, self.prompt_key("TERRAFORM_LOG_ANALYSIS"))
+        insights, cached_at = await self.cache.get_or_compute(key, MODEL, lambda: self._request_analysis(logs, client))
+        return dict(insights, cache_hit=cached_at is not None)
+
+    async def _request_analysis(self, logs: List[Dict], client: Optional[AIHttpClient] = None) -> Tuple[Dict, bool]:
+        """(ответ, получен ли он от модели); демо-ответ при ошибке API не кэшируется"""
         # Подготовка контекста для анализа
         context = self._prepare_context(logs)
         
         try:
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "Ты эксперт по анализу логов Terraform. Отвечай на русском языке в формате JSON."},
+            response = await (client or self.client).post_json(self.url, {
+                "model": MODEL,
+                "messages": [
+                    {"role": "system", "content": SYSTEM_PROMPT},
                     {"role": "user", "content": context}
                 ],
-                temperature=0.3,
-                max_tokens=500
-            )
+                "temperature": 0.3,
+                "max_tokens": 500
+            }, {"Authorization": f"Bearer {self.api_key}"})
             
-            result = response.choices[0].message.content
+            result = response['choices'][0]['message']['content']
             
             # Пытаемся распарсить JSON из ответа
             start = result.find('{')
@@ -44,14 +85,24 @@ class OpenAIAIAnalyzer:
                 parsed = json.loads(json_str)
                 parsed['ai_model'] = 'openai-gpt-3.5-turbo'
                 parsed['confidence'] = 0.9
-                return parsed
+                return parsed, True
             
             # Если JSON не найден, возвращаем структурированный ответ
-            return self._fallback_analysis(logs, result)
+            return self._fallback_analysis(logs, result), True
             
         except Exception as e:
             print(f"❌ OpenAI API error: {e}")
-            return self._mock_analysis(logs)
+            return self._mock_analysis(logs), False
+
+    def analyze_logs(self, logs: List[Dict]) -> Dict:
+        """Синхронный анализ для скриптов; сервер вызывает analyze_logs_async"""
+        async def run():
+            client = AIHttpClient()
+            try:
+                return await self.analyze_logs_async(logs, client)
+            finally:
+                await client.close()
+        return asyncio.run(run())
     
     def _prepare_context(self, logs: List[Dict]) -> str:
         context = """Проанализируй следующие логи Terraform и предоставь структурированный ответ на русском языке в формате JSON:
@@ -118,7 +169,7 @@ class OpenAIAIAnalyzer:
             "confidence": 0.60
         }
     
-    def get_ai_insights(self, query: str = None, limit: int = 100) -> Dict:
-        store = Storage()
-        logs = store.search(q=query, limit=limit)
-        return self.analyze_logs(logs)
\ No newline at end of file
+    async def get_ai_insights(self, query: str = None, limit: int = 100, store: Storage = None) -> Dict:
+        store = store or Storage()
+        logs = await asyncio.to_thread(store.search, q=query, limit=limit)
+        return await self.analyze_logs_async(logs)
\ No newline at end of file
@@ -0,0 +1,105 @@
+import os
+import json
+import random
+import asyncio
+from typing import Dict, Optional
+
+import aiohttp
+
+
+# Таймауты запроса к модели: весь запрос и установка соединения, секунд
+AI_TIMEOUT = float(os.getenv('AI_TIMEOUT', 60))
+AI_CONNECT_TIMEOUT = float(os.getenv('AI_CONNECT_TIMEOUT', 10))
+# Сколько запросов к моделям идет одновременно; остальные ждут очереди, не занимая соединений
+AI_CONCURRENCY = int(os.getenv('AI_CONCURRENCY', 4))
+# Открытых keep-alive соединений на все API
+AI_POOL_SIZE = int(os.getenv('AI_POOL_SIZE', 10))
+# Повторы при 429/5xx и сетевых ошибках, с экспоненциальной задержкой от AI_BACKOFF секунд
+AI_RETRIES = int(os.getenv('AI_RETRIES', 3))
+AI_BACKOFF = float(os.getenv('AI_BACKOFF', 0.5))
+AI_MAX_BACKOFF = 10.0
+
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+def extract_json(content: str) -> Dict:
+    """JSON-объект из текста ответа модели (модели часто окружают его пояснениями); ValueError, если его нет"""
+    start = content.find('{')
+    end = content.rfind('}') + 1
+    if start == -1 or end == 0:
+        raise ValueError("no JSON object in model response")
+    return json.loads(content[start:end])
+
+
+class AIClientError(Exception):
+    """Запрос к API модели не удался (после всех повторов)"""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class AIHttpClient:
+    """Общий асинхронный HTTP-клиент анализаторов.
+
+    Одна aiohttp-сессия с пулом keep-alive соединений на event loop; не больше concurrency
+    запросов одновременно; таймауты на каждый запрос и повторы с задержкой при перегрузке API.
+    """
+
+    def __init__(self, timeout: float = AI_TIMEOUT, connect_timeout: float = AI_CONNECT_TIMEOUT, concurrency: int = AI_CONCURRENCY, pool_size: int = AI_POOL_SIZE, retries: int = AI_RETRIES, backoff: float = AI_BACKOFF):
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self.concurrency = concurrency
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff = backoff
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            # Сессия привязана к event loop: при новом loop (asyncio.run в скриптах) создается заново
+            self._loop = loop
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60),
+                timeout=self.timeout,
+            )
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._session
+
+    def _delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), AI_MAX_BACKOFF)
+            except ValueError:
+                pass
+        # Случайная добавка, чтобы одновременные запросы не повторялись разом
+        return min(self.backoff * 2 ** attempt, AI_MAX_BACKOFF) * (0.5 + random.random() / 2)
+
+    async def post_json(self, url: str, payload: Dict, headers: Optional[Dict] = None) -> Dict:
+        """POST с JSON, ответ - разобранный JSON; AIClientError при ошибке"""
+        session = self._get_session()
+        async with self._semaphore:
+            for attempt in range(self.retries + 1):
+                last = attempt == self.retries
+                try:
+                    async with session.post(url, json=payload, headers=headers) as response:
+                        if response.status == 200:
+                            return await response.json(content_type=None)
+                        text = await response.text()
+                        if response.status not in RETRY_STATUSES or last:
+                            raise AIClientError(f"{response.status} - {text[:500]}", response.status)
+                        delay = self._delay(attempt, response.headers.get('Retry-After'))
+                        print(f"⚠️  AI API returned {response.status}, retry in {delay:.1f}s")
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if last:
+                        raise AIClientError(f"{type(e).__name__}: {e}") from e
+                    delay = self._delay(attempt)
+                    print(f"⚠️  AI API request failed ({type(e).__name__}), retry in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
@@ -0,0 +1,350 @@
+import os
+import time
+import asyncio
+from collections import Counter
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from backend.insight_cache import InsightCache, insight_fingerprint
+from backend.templates import WILDCARD, mask_message
+
+
+# Размер одной части в токенах (оценка: ~4 символа на токен) и предел числа частей
+AI_CHUNK_TOKENS = int(os.getenv('AI_CHUNK_TOKENS', 3000))
+AI_MAX_CHUNKS = int(os.getenv('AI_MAX_CHUNKS', 40))
+# Сколько частей анализируется одновременно и не чаще скольких запросов к модели в минуту
+AI_MAP_CONCURRENCY = int(os.getenv('AI_MAP_CONCURRENCY', 4))
+AI_REQUESTS_PER_MINUTE = float(os.getenv('AI_REQUESTS_PER_MINUTE', 60))
+# Предел времени всего анализа, секунд: недоделанные части пропускаются, ответ собирается из готовых
+AI_ANALYSIS_DEADLINE = float(os.getenv('AI_ANALYSIS_DEADLINE', 120))
+
+CHARS_PER_TOKEN = 4
+EXCERPT_CHARS = 200
+MAX_ISSUES = 20
+MAX_RECOMMENDATIONS = 10
+# Сколько ресурсов перечислять у группы, слитой с нескольких ресурсов
+MAX_RESOURCES = 5
+# Уровни строк по важности: в части и в пределы AI_MAX_CHUNKS сначала попадают ошибки
+LEVEL_PRIORITY = {'error': 0, 'warning': 1, 'info': 2, 'debug': 3, 'trace': 4}
+SEVERITY_RANK = {
+    'критический': 4, 'critical': 4,
+    'высокий': 3, 'high': 3, 'error': 3,
+    'средний': 2, 'medium': 2, 'warning': 2,
+    'низкий': 1, 'low': 1,
+    'информация': 0, 'info': 0,
+}
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class LogDigest:
+    """Выборка, сжатая до групп однотипных строк (уровень, ресурс, шаблон) с числом повторов.
+
+    Шаблон - template_id строки, а без него текст с замаскированными временем, числами и идентификаторами:
+    иначе строки различались бы уже по времени в начале. Для модели от группы берется первая строка.
+    Строки добавляются страницами, поэтому память зависит от числа разных шаблонов, а не от размера выборки.
+    Распределение по уровням считается точно по всем строкам, без модели.
+    """
+
+    def __init__(self):
+        self.lines = 0
+        self.levels = Counter()
+        self.groups: Dict[Tuple, List] = {}
+
+    def add(self, rows: List[Dict]):
+        for row in rows:
+            self.lines += 1
+            level = row.get('level') or 'unknown'
+            self.levels[level] += 1
+            excerpt = (row.get('text_excerpt') or '')[:EXCERPT_CHARS]
+            pattern = row.get('template_id')
+            if pattern is None:
+                # Как в TemplateMiner: оставшиеся слова с цифрами (id, op42) считаются параметрами
+                pattern = ' '.join(WILDCARD if any(c.isdigit() for c in token) else token for token in mask_message(excerpt))
+            key = (level, row.get('tf_resource') or '', pattern)
+            group = self.groups.get(key)
+            if group is None:
+                # [повторы, первое время, последнее время, порядок появления, пример строки]
+                self.groups[key] = [1, row.get('ts'), row.get('ts'), len(self.groups), excerpt]
+            else:
+                group[0] += 1
+                group[2] = row.get('ts') or group[2]
+
+    def prioritized(self, by_resource: bool = True) -> List[Tuple[str, int, str]]:
+        """Строки для модели ([уровень] xN текст (ресурс, время)), сколько строк лога каждая представляет и уровень.
+
+        by_resource=False сливает группы одного шаблона с разных ресурсов, ресурсы перечисляются в строке.
+        """
+        merged: Dict[Tuple, List] = {}
+        for (level, resource, pattern), (count, first_ts, last_ts, order, sample) in self.groups.items():
+            key = (level, resource, pattern) if by_resource else (level, pattern)
+            group = merged.get(key)
+            if group is None:
+                merged[key] = [count, first_ts, last_ts, order, sample, [resource] if resource else []]
+                continue
+            group[0] += count
+            if last_ts and (not group[2] or last_ts > group[2]):
+                group[2] = last_ts
+            if resource and resource not in group[5]:
+                group[5].append(resource)
+        ordered = sorted(merged.items(), key=lambda kv: (LEVEL_PRIORITY.get(kv[0][0], 5), kv[1][3]))
+        out = []
+        for key, (count, first_ts, last_ts, _, sample, resources) in ordered:
+            level = key[0]
+            line = f"[{level}]" + (f" x{count}" if count > 1 else "") + f" {sample}"
+            details = []
+            if len(resources) == 1:
+                details.append(f"ресурс: {resources[0]}")
+            elif resources:
+                details.append(f"ресурсы: {', '.join(resources[:MAX_RESOURCES])}" +
+                               (f" и еще {len(resources) - MAX_RESOURCES}" if len(resources) > MAX_RESOURCES else ""))
+            if first_ts:
+                details.append(f"время: {first_ts}" + (f" - {last_ts}" if count > 1 and last_ts != first_ts else ""))
+            if details:
+                line += f" ({', '.join(details)})"
+            out.append((line, count, level))
+        return out
+
+
+def make_chunks(lines: List[Tuple[str, int, str]], budget: int, max_chunks: int) -> Tuple[List[str], List[Tuple[str, int, str]]]:
+    """Части текста не больше budget токенов, не больше max_chunks; возвращает (части, не поместившиеся строки)"""
+    chunks, current, tokens = [], [], 0
+    for i, (line, _, _) in enumerate(lines):
+        cost = estimate_tokens(line) + 1
+        if current and tokens + cost > budget:
+            chunks.append("\n".join(current))
+            current, tokens = [], 0
+        if len(chunks) >= max_chunks:
+            return chunks, lines[i:]
+        current.append(line)
+        tokens += cost
+    if current:
+        chunks.append("\n".join(current))
+    return chunks, []
+
+
+def fold_rest(rest: List[Tuple[str, int, str]], budget: int) -> str:
+    """Последняя часть вместо отброшенных строк: сколько групп и строк осталось по уровням и самые частые из них"""
+    levels: Dict[str, List[int]] = {}
+    for _, count, level in rest:
+        stat = levels.setdefault(level, [0, 0])
+        stat[0] += 1
+        stat[1] += count
+    header = ["Остальные строки выборки не поместились в части и сведены здесь:"]
+    for level in sorted(levels, key=lambda lvl: LEVEL_PRIORITY.get(lvl, 5)):
+        groups, lines = levels[level]
+        header.append(f"[{level}] групп: {groups}, строк: {lines}")
+    header.append("Самые частые из них:")
+    tokens = sum(estimate_tokens(line) + 1 for line in header)
+    out = header
+    # Сначала важные уровни, внутри уровня - частые; rest уже упорядочен по уровню
+    for line, _, _ in sorted(rest, key=lambda r: (LEVEL_PRIORITY.get(r[2], 5), -r[1])):
+        cost = estimate_tokens(line) + 1
+        if tokens + cost > budget:
+            break
+        out.append(line)
+        tokens += cost
+    return "\n".join(out)
+
+
+def plan_chunks(digest: LogDigest, budget: int, max_chunks: int) -> Tuple[List[str], int]:
+    """Части для модели: строки не отбрасываются, а укрупняются, пока не поместятся в max_chunks.
+
+    Сначала группы по ресурсам, затем группы одного шаблона со всех ресурсов; если и их больше,
+    последняя часть сводит оставшиеся группы (fold_rest). Возвращает (части, число строк лога только в сводке).
+    """
+    chunks, rest = make_chunks(digest.prioritized(), budget, max_chunks)
+    if not rest:
+        return chunks, 0
+    chunks, rest = make_chunks(digest.prioritized(by_resource=False), budget, max_chunks)
+    if not rest or max_chunks < 1:
+        return chunks, sum(count for _, count, _ in rest)
+    chunks, rest = make_chunks(digest.prioritized(by_resource=False), budget, max_chunks - 1)
+    return chunks + [fold_rest(rest, budget)], sum(count for _, count, _ in rest)
+
+
+class RateLimiter:
+    """Не больше per_minute стартов запросов в минуту (равномерно)"""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def merge_partials(partials: List[Dict]) -> Dict:
+    """Сводит issues и recommendations ответов по частям: одинаковые проблемы суммируются, важность - максимальная"""
+    issues: Dict[str, Dict] = {}
+    recommendations = Counter()
+    first_seen: Dict[str, str] = {}
+    for part in partials:
+        for issue in part.get('issues') or []:
+            if not isinstance(issue, dict) or not issue.get('type'):
+                continue
+            key = str(issue['type']).strip().lower()
+            try:
+                count = int(issue.get('count') or 0)
+            except (TypeError, ValueError):
+                count = 0
+            merged = issues.setdefault(key, {'type': str(issue['type']).strip(), 'count': 0, 'severity': issue.get('severity')})
+            merged['count'] += count
+            severity = str(issue.get('severity') or '').strip().lower()
+            if SEVERITY_RANK.get(severity, -1) > SEVERITY_RANK.get(str(merged['severity'] or '').strip().lower(), -1):
+                merged['severity'] = issue.get('severity')
+        for rec in part.get('recommendations') or []:
+            key = str(rec).strip().rstrip('.').lower()
+            if key:
+                recommendations[key] += 1
+                first_seen.setdefault(key, str(rec).strip())
+    ordered = sorted(issues.values(), key=lambda i: (-SEVERITY_RANK.get(str(i['severity'] or '').strip().lower(), -1), -i['count']))
+    return {
+        'issues': ordered[:MAX_ISSUES],
+        'recommendations': [first_seen[k] for k, _ in recommendations.most_common(MAX_RECOMMENDATIONS)],
+    }
+
+
+class MapReduceAnalysis:
+    """Анализ выборки любого размера: строки сжимаются в группы (LogDigest), делятся на части по
+    AI_CHUNK_TOKENS, части анализируются моделью параллельно под ограничением частоты, ответы сводятся
+    в один (merge_partials), а резюме частей - в общее резюме иерархически, группами в пределах бюджета.
+
+    run() - асинхронный генератор событий прогресса (plan, chunk, reduce) и итогового result.
+    """
+
+    def __init__(self, analyzer, cache: Optional[InsightCache] = None, chunk_tokens: int = AI_CHUNK_TOKENS, max_chunks: int = AI_MAX_CHUNKS,
+                 concurrency: int = AI_MAP_CONCURRENCY, per_minute: float = AI_REQUESTS_PER_MINUTE, deadline: float = AI_ANALYSIS_DEADLINE):
+        self.analyzer = analyzer
+        self.cache = cache
+        self.chunk_tokens = chunk_tokens
+        self.max_chunks = max_chunks
+        self.concurrency = concurrency
+        self.deadline = deadline
+        self.limiter = RateLimiter(per_minute)
+
+    async def _ask(self, text: str, prompt_type: str) -> Tuple[Optional[Dict], bool]:
+        """(JSON-ответ модели или None при ошибке, взят ли он из кэша)"""
+        async def request():
+            await self.limiter.wait()
+            try:
+                return await self.analyzer.complete_json(text, prompt_type), True
+            except Exception as e:
+                print(f"❌ AI chunk analysis failed: {e}")
+                return None, False
+
+        if self.cache is None:
+            value, _ = await request()
+            return value, False
+        # Части кэшируются по своему тексту: повторный анализ той же выборки не обращается к модели
+        key = insight_fingerprint([], self.analyzer.model, f"{self.analyzer.prompt_key(prompt_type)}\n{text}")
+        value, cached_at = await self.cache.get_or_compute(key, self.analyzer.model, request)
+        return value, cached_at is not None
+
+    async def run(self, pages: AsyncIterator[List[Dict]]) -> AsyncIterator[Tuple[str, Dict]]:
+        started = time.monotonic()
+        digest = LogDigest()
+        async for rows in pages:
+            digest.add(rows)
+        chunks, folded = plan_chunks(digest, self.chunk_tokens, self.max_chunks)
+        base = {'mode': 'map_reduce', 'lines': digest.lines, 'groups': len(digest.groups), 'folded_lines': folded,
+                'severity_distribution': dict(digest.levels)}
+        yield 'plan', dict(base, chunks=len(chunks))
+
+        if not chunks or not getattr(self.analyzer, 'api_key', None):
+            yield 'result', dict(base, **self._local_result(digest), chunks={'total': len(chunks), 'done': 0, 'failed': 0, 'skipped': len(chunks)})
+            return
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def map_chunk(index: int, text: str):
+            async with semaphore:
+                header = f"Часть {index + 1} из {len(chunks)}. Одинаковые строки сгруппированы, xN - число повторов.\n\n"
+                return index, await self._ask(header + text, "TERRAFORM_LOG_ANALYSIS")
+
+        partials: Dict[int, Dict] = {}
+        failed = cached = 0
+        pending = {asyncio.create_task(map_chunk(i, text)) for i, text in enumerate(chunks)}
+        try:
+            while pending:
+                remaining = self.deadline - (time.monotonic() - started)
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    index, (value, hit) = task.result()
+                    if value is None:
+                        failed += 1
+                    else:
+                        partials[index] = value
+                        cached += hit
+                    yield 'chunk', {'index': index, 'status': 'failed' if value is None else ('cached' if hit else 'done'),
+                                    'completed': len(partials) + failed, 'total': len(chunks),
+                                    'issues': len(value.get('issues') or []) if value else 0}
+        finally:
+            for task in pending:
+                task.cancel()
+        skipped = len(pending)
+
+        ordered = [partials[i] for i in sorted(partials)]
+        merged = merge_partials(ordered)
+        summaries = [str(p['summary']) for p in ordered if p.get('summary')]
+        yield 'reduce', {'summaries': len(summaries)}
+        summary = await self._reduce_summaries(summaries, started) if summaries else self._local_result(digest)['summary']
+        stats = {'total': len(chunks), 'done': len(partials), 'cached': cached, 'failed': failed, 'skipped': skipped}
+        yield 'result', dict(base, summary=summary, **merged, chunks=stats, elapsed_sec=round(time.monotonic() - started, 3))
+
+    async def _reduce_summaries(self, summaries: List[str], started: float) -> str:
+        """Общее резюме из резюме частей: группы в пределах бюджета токенов сводятся моделью, пока не останется одно"""
+        try:
+            while len(summaries) > 1:
+                groups, current, tokens = [], [], 0
+                for text in summaries:
+                    cost = estimate_tokens(text) + 1
+                    if current and tokens + cost > self.chunk_tokens:
+                        groups.append(current)
+                        current, tokens = [], 0
+                    current.append(text)
+                    tokens += cost
+                groups.append(current)
+                if len(groups) == len(summaries):
+                    # Каждое резюме само занимает весь бюджет - сводить дальше нечем
+                    break
+                remaining = self.deadline - (time.monotonic() - started)
+                if remaining <= 0:
+                    break
+                results = await asyncio.wait_for(asyncio.gather(*(self._merge(group) for group in groups)), remaining)
+                summaries = [s for s in results if s]
+        except asyncio.TimeoutError:
+            pass
+        return summaries[0] if len(summaries) == 1 else " ".join(summaries[:3])
+
+    async def _merge(self, group: List[str]) -> Optional[str]:
+        if len(group) == 1:
+            return group[0]
+        text = "\n".join(f"{i + 1}. {s}" for i, s in enumerate(group))
+        value, _ = await self._ask(text, "TERRAFORM_SUMMARY_MERGE")
+        if value and value.get('summary'):
+            return str(value['summary'])
+        return " ".join(group[:3])
+
+    @staticmethod
+    def _local_result(digest: LogDigest) -> Dict:
+        """Сводка без модели (нет ключа API): самые частые группы ошибок и предупреждений"""
+        top = sorted(((key[0], group[4], group[0]) for key, group in digest.groups.items() if key[0] in ('error', 'warning')), key=lambda g: -g[2])[:MAX_ISSUES]
+        return {
+            'summary': f"Обработано {digest.lines} строк, {len(digest.groups)} уникальных. Анализ моделью недоступен (проблемы с API KEY), показаны частые ошибки и предупреждения."
+                       if digest.lines else "Нет строк для анализа.",
+            'issues': [{'type': excerpt[:120] or level, 'count': count, 'severity': 'высокий' if level == 'error' else 'средний'}
+                       for level, excerpt, count in top],
+            'recommendations': [],
+        }
@@ -1,36 +1,31 @@
 import json
+import zlib
 from pathlib import Path
 import sys
 import os
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse, FileResponse
+import asyncio
+
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
-from backend.storage import Storage
-from backend.parser import parse_line
+from starlette.concurrency import run_in_threadpool
+from backend.storage import Storage, parse_ts_filter
+from backend.ingest import shutdown_pool, INGEST_WORKERS
+from backend.jobs import JobManager, save_upload
+from backend.follow import Follower, FOLLOW_PATHS, FOLLOW_RUN
+from backend.runs import RunRegistry
+from backend.live import LiveHub, LiveFilter
+from backend.cache import ResultCache, cache_key
+from backend.plugin_client import PluginClient, PluginError, PLUGIN_BATCH
+from backend.ai_client import AIHttpClient
+from backend.insight_cache import InsightCache
 from backend.ai_analyzer import CustomAIAnalyzer
 from backend.ai_analyzer_openai import OpenAIAIAnalyzer
-from typing import List, Dict
-
-try:
-    import grpc
-    
-    plugins_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'plugins')
-    sys.path.insert(0, plugins_path)
-    
-    import plugin_pb2
-    import plugin_pb2_grpc
-    
-    sys.path.remove(plugins_path)
-    
-    GRPC_AVAILABLE = True
-except ImportError:
-    GRPC_AVAILABLE = False
-    print("gRPC not available - install grpcio and generate proto files")
-
-
+from backend.ai_mapreduce import MapReduceAnalysis
+from typing import AsyncIterator, Callable, Iterator, List, Dict, Optional, Tuple
 
 app = FastAPI(title="Terraform LogViewer")
 
@@ -38,42 +33,102 @@ app = FastAPI(title="Terraform LogViewer")
 app.mount("/static", StaticFiles(directory="frontend/static"), name="static")
 
 
+# База до появления прогонов - прогон 'default'; новые загрузки получают свои файлы в RUNS_DIR
 DB_PATH = "logs.db"
-store = Storage(DB_PATH)
+# Новые строки из любого соединения рассылаются подписчикам /live
+live = LiveHub()
 
-ai_analyzer = CustomAIAnalyzer()
-openai_ai_analyzer = OpenAIAIAnalyzer()
 
-def call_grpc_plugin(logs: List[Dict], filter_type: str = "default"):
-    try:
-        channel = grpc.insecure_channel('localhost:50051')
-        stub = plugin_pb2_grpc.LogProcessorStub(channel)
-        
-        request_logs = []
-        for log in logs:
-            entry = plugin_pb2.LogEntry(
-                id=log.get('id', 0),
-                raw_json=log.get('raw_json', ''),
-                ts=log.get('ts', ''),
-                level=log.get('level', ''),
-                tf_req_id=log.get('tf_req_id', ''),
-                tf_resource=log.get('tf_resource', ''),
-                section=log.get('section', ''),
-                text_excerpt=log.get('text_excerpt', '')
-            )
-            request_logs.append(entry)
-        
-        request = plugin_pb2.LogRequest(
-            logs=request_logs,
-            filter_type=filter_type
-        )
-        
-        response = stub.ProcessLogs(request)
-        return [{'id': entry.id, 'level': entry.level, 'text_excerpt': entry.text_excerpt} 
-                for entry in response.filtered_logs]
-    except Exception as e:
-        print(f"Plugin error: {e}")
-        return logs  # Возврат оригинальных данных при ошибке
+def open_store(run: Dict) -> Storage:
+    s = Storage(run['path'])
+    s.add_listener(lambda rows, run_id=run['id']: live.publish(run_id, rows))
+    return s
+
+
+runs = RunRegistry(default_path=DB_PATH, store_factory=open_store)
+
+
+def discard_run(run_id: int) -> bool:
+    """Удаляет прогон вместе с его ответами в кэше результатов; False, если прогона нет"""
+    if not runs.drop(run_id):
+        return False
+    results.drop_run(run_id)
+    return True
+
+
+# Фоновые загрузки пишут через собственные соединения, чтобы не делить транзакции с запросами API
+jobs = JobManager(runs.open, run_exists=lambda run_id: runs.get(run_id) is not None, discard_run=discard_run)
+# Слежение за растущими логами (FOLLOW_PATHS) запускается вместе с сервером и пишет в прогон FOLLOW_RUN
+follower = Follower(runs.open(runs.get_or_create(FOLLOW_RUN, 'follow')), FOLLOW_PATHS) if FOLLOW_PATHS else None
+
+
+def get_run(run: Optional[int]) -> Dict:
+    """Прогон по id, по умолчанию - последний; 404, если его нет"""
+    info = runs.get(run) if run is not None else runs.latest()
+    if info is None:
+        raise HTTPException(status_code=404, detail="run not found")
+    return info
+
+
+def get_store(run: Optional[int]) -> Storage:
+    return runs.store(get_run(run))
+
+
+async def store_call(run: Optional[int], method: str, *args, **kwargs):
+    """Вызов метода Storage прогона в пуле потоков: запросы к SQLite не блокируют event loop"""
+    def call():
+        return getattr(get_store(run), method)(*args, **kwargs)
+    return await run_in_threadpool(call)
+
+
+# Дашборд повторяет одни и те же запросы: пока данные прогона не менялись, ответ берется из кэша
+results = ResultCache()
+
+
+async def cached_json(namespace: str, run: Optional[int], params: Dict, compute: Callable[[Storage], object]) -> Response:
+    """JSON-ответ из кэша результатов или compute(store), посчитанный в пуле потоков и сохраненный в кэш"""
+    def resolve():
+        info = get_run(run)
+        return info, runs.store(info)
+    info, store = await run_in_threadpool(resolve)
+    key = cache_key(namespace, info['id'], **params)
+    # Поколение читается до запроса: если запись придет во время него, ответ сохранится как устаревший
+    generation = store.generation
+    body = results.get(key, generation)
+    status = 'hit'
+    if body is None:
+        status = 'miss'
+        body = JSONResponse(await run_in_threadpool(compute, store)).body
+        results.put(key, generation, body)
+    return Response(body, media_type='application/json', headers={'X-Cache': status})
+
+# Долгоживущие каналы к серверу плагинов (PLUGIN_TARGET) вместо нового канала на каждый вызов
+plugin = PluginClient()
+
+# Общий пул соединений и лимит одновременных запросов к API моделей для обоих анализаторов
+ai_client = AIHttpClient()
+# Ответы моделей по отпечатку выбранных строк (AI_INSIGHT_CACHE_DB - сохранять в SQLite)
+insights_cache = InsightCache()
+ai_analyzer = CustomAIAnalyzer(ai_client, insights_cache)
+openai_ai_analyzer = OpenAIAIAnalyzer(ai_client, insights_cache)
+
+
+@app.on_event("startup")
+async def startup():
+    live.attach(asyncio.get_running_loop())
+    if follower:
+        follower.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    if follower:
+        await run_in_threadpool(follower.stop)
+    await run_in_threadpool(jobs.shutdown)
+    shutdown_pool()
+    await plugin.close()
+    await ai_client.close()
+    insights_cache.close()
 
 
 @app.get("/ai/models")
@@ -132,15 +187,27 @@ async def get_ai_models():
 #     except Exception as e:
 #         return JSONResponse({"error": str(e), "recommendations": []})
 
-@app.get("/ai/analyze")
-async def ai_analyze(q: str = None, limit: int = 100, model: str = "custom"):
-    """ИИ анализ логов"""
+def full_analysis(store: Storage, q: Optional[str], model: str) -> Tuple[MapReduceAnalysis, AsyncIterator[List[Dict]]]:
+    """Анализ всех строк под q и их страницы, прочитанные в пуле потоков"""
+    analyzer = openai_ai_analyzer if model == "openai" else ai_analyzer
+    return MapReduceAnalysis(analyzer, insights_cache), iter_pages(store.iter_search(q=q or None))
 
+
+@app.get("/ai/analyze")
+async def ai_analyze(q: str = None, limit: int = 100, model: str = "custom", run: int = None, full: int = 0):
+    """ИИ анализ логов; full=1 - всех строк под q (частями, см. /ai/analyze/stream), а не первых limit"""
+    store = await run_in_threadpool(get_store, run)
+    analyzer = openai_ai_analyzer if model == "openai" else ai_analyzer
     try:
-        if model == "openai":
-            insights = openai_ai_analyzer.get_ai_insights(query=q, limit=limit)
+        if full:
+            analysis, pages = full_analysis(store, q, model)
+            insights = {}
+            async for event, data in analysis.run(pages):
+                if event == 'result':
+                    insights = data
         else:
-            insights = ai_analyzer.get_ai_insights(query=q, limit=limit)
+            # Повторный анализ тех же строк отдается из кэша инсайтов (cache_hit в ответе) без запроса к модели
+            insights = await analyzer.get_ai_insights(query=q, limit=limit, store=store)
         
         insights['selected_model'] = model
         return JSONResponse(insights)
@@ -154,6 +221,26 @@ async def ai_analyze(q: str = None, limit: int = 100, model: str = "custom"):
         }, status_code=500)
 
 
+@app.get("/ai/analyze/stream")
+async def ai_analyze_stream(q: str = None, model: str = "custom", run: int = None):
+    """Server-Sent Events с ходом анализа всех строк под q: event: plan - сколько строк и частей,
+    event: chunk - готова часть, event: reduce - сведение резюме, event: result - ответ как у /ai/analyze?full=1"""
+    store = await run_in_threadpool(get_store, run)
+    analysis, pages = full_analysis(store, q, model)
+
+    async def events():
+        try:
+            async for event, data in analysis.run(pages):
+                if event == 'result':
+                    data['selected_model'] = model
+                yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @app.post("/ai/recommend")
 async def ai_recommend(payload: dict):
     """Получить ИИ рекомендации по конкретной ошибке"""
@@ -183,58 +270,120 @@ async def root():
     return FileResponse("frontend/templates/index.html")
 
 
-@app.post("/upload")
-async def upload(file: UploadFile = File(...)):
-    content = await file.read()
-    lines = content.decode("utf-8", errors="ignore").splitlines()
-    inserted = 0
-    for line in lines:
-        if not line.strip(): 
-            continue
-        
-        try:
-            obj = json.loads(line)
-        except json.JSONDecodeError:
-            # Если JSON некорректный, сохраняем как raw
-            obj = {"raw": line}
-        
-        # Парсим строку в любом случае
-        parsed = parse_line(obj, raw_text=line)
-        
-        # Сохраняем в дб
-        raw_json = json.dumps(obj, ensure_ascii=False)
-        log_id = store.insert_log(
-            raw_json=raw_json,
-            ts=parsed.get("ts"),
-            level=parsed.get("level"),
-            tf_req_id=parsed.get("tf_req_id"),
-            tf_resource=parsed.get("tf_resource"),
-            section=parsed.get("section"),
-            text_excerpt=parsed.get("excerpt"),
-        )
-        
-        # Сохраняем JSON
-        for body_type, body in parsed.get("bodies", []):
-            try:
-                store.insert_json_body(log_id, body_type, json.dumps(body, ensure_ascii=False))
-            except Exception:
-                store.insert_json_body(log_id, body_type, str(body))
-        
-        inserted += 1
-    
-    return {"inserted": inserted}
+@app.post("/upload", status_code=202)
+async def upload(file: UploadFile = File(...), parallel: int = None, run: int = None):
+    """Ставит файл в очередь на загрузку и сразу возвращает id задачи; ход загрузки - в /jobs/{id}.
+    Каждая загрузка - новый прогон, если не передан run для дописывания в существующий"""
+    # parallel=1 - парсить в пуле процессов, parallel=0 - в текущем процессе, без параметра - по размеру файла
+    workers = None if parallel is None else (INGEST_WORKERS if parallel else 1)
+    target = get_run(run) if run is not None else None
+    # Копия нужна задаче после ответа: файл загрузки закрывается вместе с запросом
+    path, size = await run_in_threadpool(save_upload, file.file, Path(file.filename or '').suffix)
+    created = target is None
+    if created:
+        target = runs.create(file.filename or 'upload')
+    try:
+        job = jobs.submit(path, file.filename, size, target, workers=workers, created_run=created)
+    except LookupError:
+        # Прогон удалили, пока сохранялся файл
+        os.remove(path)
+        raise HTTPException(status_code=404, detail="run not found")
+    return {"job_id": job.id, "run_id": target['id'], "status": job.status}
+
+
+@app.get("/runs")
+async def list_runs():
+    """Прогоны, сначала новые; запросы без run работают с первым из них"""
+    return runs.list()
+
+
+@app.delete("/runs/{run_id}")
+async def drop_run(run_id: int):
+    """Удаление прогона целиком - удаляется его файл базы"""
+    if follower and follower.store.path == get_run(run_id)['path']:
+        raise HTTPException(status_code=409, detail="run is being written")
+    # Проверка занятости и удаление - одним шагом с постановкой задач в очередь
+    dropped = jobs.drop_run(run_id, discard_run)
+    if dropped is None:
+        raise HTTPException(status_code=409, detail="run is being written")
+    if not dropped:
+        raise HTTPException(status_code=404, detail="run not found")
+    return {"status": "ok"}
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Заполнение кэша результатов и попадания/промахи по эндпоинтам; ai_insights - кэш ответов моделей"""
+    return dict(results.stats(), ai_insights=insights_cache.stats())
+
+
+@app.get("/jobs")
+async def list_jobs():
+    return [job.to_dict() for job in jobs.list()]
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return job.to_dict()
 
 
 @app.get("/search")
-async def search(q: str = None, level: str = None, tf_resource: str = None, tf_req_id: str = None, ts_from: str = None, ts_to: str = None, section: str = None, unread: int = 0, limit: int = 500):
-    rows = store.search(q=q, level=level, resource=tf_resource, tf_req_id=tf_req_id, ts_from=ts_from, ts_to=ts_to, section=section, unread_only=bool(unread), limit=limit)
-    return rows
+async def search(q: str = None, level: str = None, tf_resource: str = None, tf_req_id: str = None, ts_from: str = None, ts_to: str = None, section: str = None, unread: int = 0, limit: int = 500, order: str = "ts", cursor: str = None, raw: int = 0, run: int = None, template_id: int = None):
+    """Страница логов прогона run (по умолчанию последнего): {"items": [...], "next_cursor": ...}; next_cursor передается в cursor для следующей страницы.
+    raw_json в строках только при raw=1, иначе его можно получить через /logs/{id}/raw; template_id - строки одного шаблона из /patterns"""
+    params = dict(q=q, level=level, resource=tf_resource, tf_req_id=tf_req_id, ts_from=ts_from, ts_to=ts_to, section=section, unread_only=bool(unread), limit=limit, order=order, cursor=cursor, include_raw=bool(raw), template_id=template_id)
+    try:
+        return await cached_json('search', run, params, lambda store: store.search_page(**params))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/live")
+async def live_logs(request: Request, q: str = None, level: str = None, tf_resource: str = None, tf_req_id: str = None, ts_from: str = None, ts_to: str = None, section: str = None, run: int = None, template_id: int = None):
+    """Server-Sent Events с новыми строками, подходящими под фильтры /search.
+    event: logs - JSON-массив строк, event: overflow - клиент отстал, выдачу нужно перечитать через /search"""
+    try:
+        live_filter = LiveFilter(get_run(run)['id'], q=q, level=level, resource=tf_resource, tf_req_id=tf_req_id, ts_from=ts_from, ts_to=ts_to, section=section, template_id=template_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    client = live.connect(live_filter)
+    if client is None:
+        raise HTTPException(status_code=503, detail="too many live subscribers")
+    return StreamingResponse(live.stream(client, request.is_disconnected), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.get("/sections")
-async def get_sections():
+async def get_sections(run: int = None):
     """Получить сводку по секциям (plan/apply)"""
-    sections = store.get_sections_summary()
-    return JSONResponse(sections)
+    return await cached_json('sections', run, {}, lambda store: store.get_sections_summary())
+
+@app.get("/requests")
+async def get_requests(tf_req_id: str = None, limit: int = 500, run: int = None):
+    """Сводка по tf_req_id: число строк, первое/последнее время и счетчики уровней"""
+    return await cached_json('requests', run, {'tf_req_id': tf_req_id, 'limit': limit},
+                             lambda store: store.get_requests_summary(tf_req_id=tf_req_id, limit=limit))
+
+@app.get("/traces")
+async def get_traces(failed: int = 0, min_duration_ms: float = None, max_duration_ms: float = None, tf_resource: str = None, http_status: int = None, order: str = "duration", limit: int = 100, run: int = None):
+    """Индекс запросов по tf_req_id: начало/конец, длительность, число строк, старший уровень, ресурс и код HTTP.
+    failed=1 - только с ошибками; order: duration (по умолчанию), start, count, errors; строки запроса - /search?tf_req_id=..."""
+    params = dict(failed=bool(failed), min_duration_ms=min_duration_ms, max_duration_ms=max_duration_ms, resource=tf_resource, http_status=http_status, order=order, limit=limit)
+    try:
+        return await cached_json('traces', run, params, lambda store: store.get_traces(**params))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/patterns")
+async def get_patterns(q: str = None, order: str = "count", limit: int = 500, run: int = None):
+    """Шаблоны строк прогона: текст с <*> на месте параметров, число строк, первое/последнее время.
+    order: count (по умолчанию), last_seen, first_seen; строки шаблона - /search?template_id=..."""
+    try:
+        return await cached_json('patterns', run, {'q': q, 'order': order, 'limit': limit},
+                                 lambda store: store.get_patterns(q=q, order=order, limit=limit))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/mark_read")
 async def mark_read(payload: dict):
@@ -243,34 +392,118 @@ async def mark_read(payload: dict):
         raise HTTPException(status_code=400, detail="ids required")
     if isinstance(ids, int):
         ids = [ids]
-    store.mark_read(ids)
+    await store_call(payload.get("run"), 'mark_read', ids)
     return {"status": "ok"}
 
 
 @app.get("/json_bodies/{log_id}")
-async def json_bodies(log_id: int):
-    bodies = store.get_json_bodies_for_log(log_id)
+async def json_bodies(log_id: int, run: int = None):
+    bodies = await store_call(run, 'get_json_bodies_for_log', log_id)
     return JSONResponse(bodies)
 
 
+@app.get("/logs/{log_id}/raw")
+async def log_raw(log_id: int, run: int = None):
+    raw_json = await store_call(run, 'get_raw', log_id)
+    if raw_json is None:
+        raise HTTPException(status_code=404, detail="log not found")
+    return {"id": log_id, "raw_json": raw_json}
+
+
+def export_chunks(pages, compress: bool):
+    """raw_json найденных строк в формате JSONL, по странице на кусок ответа; при compress - gzip"""
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    for rows in pages:
+        data = "".join(r['raw_json'] + "\n" for r in rows).encode("utf-8")
+        if gz:
+            data = gz.compress(data)
+        if data:
+            yield data
+    if gz:
+        yield gz.flush()
+
+
 @app.get("/export")
-async def export(q: str = None, level: str = None, tf_req_id: str = None):
-    rows = store.search(q=q, level=level, tf_req_id=tf_req_id, limit=10000)
-    path = Path("export.jsonl")
-    with path.open("w", encoding="utf-8") as f:
-        for r in rows:
-            f.write(r['raw_json'] + "\n")
-    return FileResponse(str(path), media_type='application/octet-stream', filename='export.jsonl')
+async def export(q: str = None, level: str = None, tf_resource: str = None, tf_req_id: str = None, ts_from: str = None, ts_to: str = None, section: str = None, unread: int = 0, gzip: int = 0, run: int = None, template_id: int = None):
+    """Все строки под фильтрами /search в JSONL (сначала новые), потоком без лимита; gzip=1 - сжатый поток"""
+    try:
+        # Ошибку в фильтре нужно вернуть до начала потока, пока статус ответа еще не отправлен
+        for name, value in [('ts_from', ts_from), ('ts_to', ts_to)]:
+            if value:
+                parse_ts_filter(value, name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    store = await run_in_threadpool(get_store, run)
+    pages = store.iter_search(q=q, level=level, resource=tf_resource, tf_req_id=tf_req_id, ts_from=ts_from, ts_to=ts_to, section=section, unread_only=bool(unread), include_raw=True, template_id=template_id)
+    filename = 'export.jsonl.gz' if gzip else 'export.jsonl'
+    # Синхронный генератор StreamingResponse читает в пуле потоков, не блокируя event loop
+    return StreamingResponse(export_chunks(pages, bool(gzip)), media_type='application/gzip' if gzip else 'application/x-ndjson',
+                             headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
+async def iter_pages(pages: Iterator[List[Dict]]):
+    """Страницы синхронного генератора Storage (iter_search), прочитанные в пуле потоков"""
+    while True:
+        rows = await run_in_threadpool(next, pages, None)
+        if rows is None:
+            return
+        yield rows
+
+
+async def plugin_results(store: Storage, payload: dict):
+    """Плагин над всеми строками прогона под search_query, без лимита: страницы читаются из базы,
+    пока плагин их принимает, и содержат только поля, которые он запросил в Describe"""
+    filter_type = payload.get('filter_type', 'default')
+    fields = await plugin.describe(filter_type)
+    pages = store.iter_search(q=payload.get('search_query') or None, include_raw=fields is None or 'raw_json' in fields, page_size=PLUGIN_BATCH)
+    async for processed, summary in plugin.stream(iter_pages(pages), filter_type, fields=fields):
+        yield processed, summary
 
 
 @app.post("/plugin/process")
 async def process_with_plugin(payload: dict):
-    # Получаем логи из базы
-    q = payload.get('search_query', '')
-    logs = store.search(q=q, limit=1000)
-    
-    # Обрабатываем через плагин
+    """Число строк после плагина; при сбое плагина - сколько успело обработаться, error и "fallback": true"""
     filter_type = payload.get('filter_type', 'default')
-    processed_logs = call_grpc_plugin(logs, filter_type)
+    store = await run_in_threadpool(get_store, payload.get('run'))
+    processed_count = 0
+    try:
+        async for processed, _ in plugin_results(store, payload):
+            processed_count += len(processed)
+    except PluginError as e:
+        print(f"Plugin error: {e}")
+        return {"processed_count": processed_count, "summary": f"Plugin {filter_type} failed", "error": str(e), "fallback": True}
     
-    return {"processed_count": len(processed_logs), "summary": f"Applied {filter_type}"}
\ No newline at end of file
+    return {"processed_count": processed_count, "summary": f"Applied {filter_type}", "fallback": False}
+
+
+@app.post("/plugin/stream")
+async def stream_with_plugin(payload: dict):
+    """Результаты плагина по мере обработки, в формате JSONL: {"logs": [...]} на каждый ответ плагина,
+    в конце {"summary": ..., "processed_count": ...}; при сбое плагина последняя строка - {"error": ..., "fallback": true}"""
+    store = await run_in_threadpool(get_store, payload.get('run'))
+
+    async def lines():
+        count = 0
+        try:
+            async for processed, summary in plugin_results(store, payload):
+                count += len(processed)
+                if processed:
+                    yield json.dumps({"logs": processed}, ensure_ascii=False) + "\n"
+                if summary:
+                    yield json.dumps({"summary": summary, "processed_count": count}, ensure_ascii=False) + "\n"
+        except PluginError as e:
+            print(f"Plugin error: {e}")
+            yield json.dumps({"error": str(e), "processed_count": count, "fallback": True}) + "\n"
+
+    return StreamingResponse(lines(), media_type='application/x-ndjson')
+
+
+@app.get("/plugin/status")
+async def plugin_status():
+    """Адрес сервера плагинов, состояние автомата отключения (closed/open/half_open) и процессов сервера"""
+    status = plugin.status()
+    try:
+        status['workers'] = await plugin.health()
+    except PluginError as e:
+        status['workers'], status['error'] = None, str(e)
+    return status
\ No newline at end of file
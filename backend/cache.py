@@ -0,0 +1,98 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+# Сколько ответов держать в кэше результатов и сколько памяти они могут занять
+RESULT_CACHE_ENTRIES = int(os.getenv('RESULT_CACHE_ENTRIES', 512))
+RESULT_CACHE_BYTES = int(os.getenv('RESULT_CACHE_MB', 64)) * 1024 * 1024
+
+
+def cache_key(namespace: str, run_id: int, **params) -> Tuple:
+    """Ключ запроса: пустые параметры отбрасываются, остальные сортируются по имени,
+    поэтому ?level=error&q= и ?q=&level=error попадают в одну запись"""
+    items = tuple(sorted((k, v) for k, v in params.items() if v is not None and v != ''))
+    return (namespace, run_id, items)
+
+
+class ResultCache:
+    """LRU-кэш готовых ответов (тела JSON) с ограничением по числу записей и по байтам.
+
+    Запись хранит поколение данных (Storage.generation), при котором ответ посчитан:
+    после записи строк или mark_read (в том числе другим процессом) поколение меняется,
+    и старый ответ считается промахом.
+    """
+
+    def __init__(self, max_entries: int = RESULT_CACHE_ENTRIES, max_bytes: int = RESULT_CACHE_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[Tuple, Tuple[Hashable, bytes]]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self.evictions = 0
+
+    def _count(self, namespace: str, name: str):
+        stats = self._stats.setdefault(namespace, {'hits': 0, 'misses': 0, 'stale': 0})
+        stats[name] += 1
+
+    def get(self, key: Tuple, generation: Hashable) -> Optional[bytes]:
+        """Тело ответа, если оно посчитано при том же поколении данных; иначе None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._count(key[0], 'misses')
+                return None
+            if entry[0] != generation:
+                # Данные изменились - запись больше не нужна
+                self._remove(key)
+                self._count(key[0], 'misses')
+                self._count(key[0], 'stale')
+                return None
+            self._entries.move_to_end(key)
+            self._count(key[0], 'hits')
+            return entry[1]
+
+    def put(self, key: Tuple, generation: Hashable, body: bytes):
+        if self.max_entries <= 0 or len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (generation, body)
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: Hashable):
+        _, body = self._entries.pop(key)
+        self._bytes -= len(body)
+
+    def drop_run(self, run_id: int):
+        """Забывает ответы удаленного прогона"""
+        with self._lock:
+            for key in [k for k in self._entries if k[1] == run_id]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = sum(s['hits'] for s in self._stats.values())
+            misses = sum(s['misses'] for s in self._stats.values())
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None,
+                'evictions': self.evictions,
+                'endpoints': {name: dict(s) for name, s in self._stats.items()},
+            }
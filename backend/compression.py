@@ -0,0 +1,116 @@
+import os
+import zlib
+import struct
+import threading
+from typing import Callable, Dict, List, Optional, Union
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+
+# Режим хранения raw_json и json_bodies.body_json: none, zlib, zstd, zstd-dict
+COMPRESSION = os.getenv('DB_COMPRESSION', 'none').lower()
+COMPRESSION_MODES = {'none', 'zlib', 'zstd', 'zstd-dict'}
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+# Словарь zstd обучается на первой пачке, в которой хватает образцов
+DICT_SIZE = 112 * 1024
+DICT_MIN_SAMPLES = 1000
+
+# Первый байт сжатого значения - кодек; несжатые значения остаются TEXT
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+CODEC_ZSTD_DICT = 3
+
+
+class Codec:
+    """Сжатие текстовых колонок в BLOB с однобайтовым заголовком кодека.
+
+    decode понимает любой из кодеков (и обычные строки) независимо от текущего режима,
+    поэтому режим можно менять на живой базе.
+    """
+
+    def __init__(self, mode: str = COMPRESSION):
+        if mode not in COMPRESSION_MODES:
+            raise ValueError(f"Unknown compression mode: {mode}")
+        if mode.startswith('zstd') and not ZSTD_AVAILABLE:
+            raise ValueError(f"Compression mode '{mode}' requires the zstandard package")
+        self.mode = mode
+        self.dict_id: Optional[int] = None
+        self._dicts: Dict[int, bytes] = {}
+        self._compressor = None
+        self._local = threading.local()
+        # Загрузка словаря по id, если его обучило другое соединение уже после открытия базы
+        self.dict_loader: Optional[Callable[[int], Optional[bytes]]] = None
+        if mode == 'zstd':
+            self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+
+    @property
+    def needs_dict(self) -> bool:
+        return self.mode == 'zstd-dict' and self.dict_id is None
+
+    def add_dict(self, dict_id: int, data: bytes, use: bool = False):
+        """Регистрирует словарь из базы; use=True - сжимать им новые значения"""
+        self._dicts[dict_id] = data
+        if use and self.mode == 'zstd-dict':
+            self.dict_id = dict_id
+            self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=zstandard.ZstdCompressionDict(data))
+
+    def train(self, samples: List[str]) -> Optional[bytes]:
+        """Обучение словаря на образцах; None, если образцов мало или обучение не удалось"""
+        if len(samples) < DICT_MIN_SAMPLES:
+            return None
+        try:
+            return zstandard.train_dictionary(DICT_SIZE, [s.encode('utf-8') for s in samples]).as_bytes()
+        except zstandard.ZstdError as e:
+            print(f"⚠️  zstd dictionary training failed: {e}")
+            return None
+
+    def encode(self, text: Optional[str]) -> Union[str, bytes, None]:
+        if text is None or self.mode == 'none':
+            return text
+        data = text.encode('utf-8')
+        if self.mode == 'zlib':
+            return bytes([CODEC_ZLIB]) + zlib.compress(data, ZLIB_LEVEL)
+        if self.dict_id is not None:
+            return bytes([CODEC_ZSTD_DICT]) + struct.pack('<I', self.dict_id) + self._compressor.compress(data)
+        if self._compressor is None:
+            # zstd-dict до обучения словаря
+            self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+        return bytes([CODEC_ZSTD]) + self._compressor.compress(data)
+
+    def decode(self, value: Union[str, bytes, None]) -> Optional[str]:
+        if value is None or isinstance(value, str):
+            return value
+        codec = value[0]
+        if codec == CODEC_ZLIB:
+            return zlib.decompress(value[1:]).decode('utf-8')
+        if codec == CODEC_ZSTD:
+            return self._decompressor(None).decompress(value[1:]).decode('utf-8')
+        if codec == CODEC_ZSTD_DICT:
+            dict_id = struct.unpack('<I', value[1:5])[0]
+            return self._decompressor(dict_id).decompress(value[5:]).decode('utf-8')
+        raise ValueError(f"Unknown codec {codec}")
+
+    def _decompressor(self, dict_id: Optional[int]):
+        # Декомпрессоры zstd не потокобезопасны - держим свои в каждом потоке
+        cache = getattr(self._local, 'decompressors', None)
+        if cache is None:
+            cache = self._local.decompressors = {}
+        if dict_id not in cache:
+            if not ZSTD_AVAILABLE:
+                raise ValueError("zstd-compressed value requires the zstandard package")
+            if dict_id is None:
+                cache[dict_id] = zstandard.ZstdDecompressor()
+            else:
+                if dict_id not in self._dicts and self.dict_loader:
+                    data = self.dict_loader(dict_id)
+                    if data is not None:
+                        self._dicts[dict_id] = data
+                if dict_id not in self._dicts:
+                    raise ValueError(f"Unknown compression dictionary {dict_id}")
+                cache[dict_id] = zstandard.ZstdDecompressor(dict_data=zstandard.ZstdCompressionDict(self._dicts[dict_id]))
+        return cache[dict_id]
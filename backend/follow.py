@@ -0,0 +1,219 @@
+import os
+import sys
+import time
+import fnmatch
+import hashlib
+import argparse
+import threading
+from typing import Dict, List, Optional, Tuple
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from backend.ingest import parse_chunk
+from backend.storage import Storage
+from backend.runs import RunRegistry
+
+
+# Пути для фонового слежения из app: файлы или каталоги через os.pathsep
+FOLLOW_PATHS = [p for p in os.getenv('FOLLOW_PATHS', '').split(os.pathsep) if p]
+# Прогон, в который пишет слежение, запущенное из app
+FOLLOW_RUN = os.getenv('FOLLOW_RUN', 'follow')
+# Как часто проверять файлы на новые строки, секунд
+FOLLOW_INTERVAL = float(os.getenv('FOLLOW_INTERVAL', 1.0))
+# Какие файлы каталога отслеживаются; ротированные копии (apply.log.1, *.gz) не подходят
+FOLLOW_PATTERNS = os.getenv('FOLLOW_PATTERNS', '*.log,*.json,*.jsonl,*.txt').split(',')
+# Сколько новых байт файла читается и записывается одной транзакцией
+FOLLOW_READ_SIZE = int(os.getenv('FOLLOW_READ_SIZE', 1024 * 1024))
+# По началу файла отличаем его от нового файла, получившего тот же inode
+HEAD_BYTES = 1024
+
+
+class TailedFile:
+    """Открытый отслеживаемый файл и позиция после последней записанной строки"""
+
+    def __init__(self, path: str, fh, dev: int, ino: int, offset: int):
+        self.path = path
+        self.fh = fh
+        self.dev = dev
+        self.ino = ino
+        self.offset = offset
+
+    def head(self, length: int) -> Tuple[int, bytes]:
+        data = os.pread(self.fh.fileno(), length, 0)
+        return len(data), hashlib.blake2b(data, digest_size=16).digest()
+
+    def checkpoint(self) -> Dict:
+        head_len, head_hash = self.head(min(self.offset, HEAD_BYTES))
+        return {'dev': self.dev, 'ino': self.ino, 'path': self.path, 'offset': self.offset,
+                'head_len': head_len, 'head_hash': head_hash}
+
+
+class Follower:
+    """Дозагрузка растущих логов (tail -f) в Storage.
+
+    Читает только байты, дописанные после сохраненной позиции, и только целые строки.
+    Позиция хранится в follow_offsets по идентичности файла (st_dev, st_ino) и пишется
+    в одной транзакции со строками, поэтому перезапуск продолжает с того же места.
+    Ротация: переименованный файл дочитывается до конца через открытый дескриптор,
+    новый файл по тому же пути читается с начала; усеченный файл (copytruncate) - тоже.
+    """
+
+    def __init__(self, store, paths: List[str], interval: float = FOLLOW_INTERVAL, patterns: List[str] = FOLLOW_PATTERNS, read_size: int = FOLLOW_READ_SIZE):
+        self.store = store
+        self.paths = paths
+        self.interval = interval
+        self.patterns = patterns
+        self.read_size = read_size
+        self.files: Dict[Tuple[int, int], TailedFile] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Слежение в фоновом потоке (для app)"""
+        self._thread = threading.Thread(target=self.run, name='follow', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"❌ Follow error: {e}")
+            self._stop.wait(self.interval)
+        self.close()
+
+    def close(self):
+        for tailed in self.files.values():
+            tailed.fh.close()
+        self.files = {}
+
+    def poll(self) -> int:
+        """Один проход по всем файлам; возвращает число записанных строк"""
+        present = set()
+        for path in self._candidates():
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            ident = (st.st_dev, st.st_ino)
+            present.add(ident)
+            tailed = self.files.get(ident)
+            if tailed is None:
+                tailed = self._open(path, ident)
+                if tailed is None:
+                    continue
+                self.files[ident] = tailed
+            tailed.path = path
+
+        inserted = 0
+        for ident, tailed in list(self.files.items()):
+            rotated = ident not in present
+            inserted += self._read_new(tailed, final=rotated)
+            if rotated:
+                # Файл переименован или удален и дочитан - больше в него не пишут
+                tailed.fh.close()
+                del self.files[ident]
+        return inserted
+
+    def _candidates(self) -> List[str]:
+        out = []
+        for path in self.paths:
+            if os.path.isdir(path):
+                for name in sorted(os.listdir(path)):
+                    full = os.path.join(path, name)
+                    if any(fnmatch.fnmatch(name, p) for p in self.patterns) and os.path.isfile(full):
+                        out.append(full)
+            else:
+                out.append(path)
+        return out
+
+    def _open(self, path: str, ident: Tuple[int, int]) -> Optional[TailedFile]:
+        try:
+            fh = open(path, 'rb')
+        except OSError as e:
+            print(f"⚠️  Cannot follow {path}: {e}")
+            return None
+        tailed = TailedFile(path, fh, ident[0], ident[1], 0)
+        saved = self.store.get_follow_offset(*ident)
+        if saved and tailed.head(saved['head_len']) == (saved['head_len'], saved['head_hash']):
+            tailed.offset = saved['offset']
+        elif saved:
+            # inode достался другому файлу - читаем его с начала
+            print(f"File {path} was replaced, reading from the start")
+        return tailed
+
+    def _read_new(self, tailed: TailedFile, final: bool = False) -> int:
+        """Записывает целые строки, дописанные после tailed.offset.
+
+        final=True - файл больше не растет (ротирован): последняя строка без перевода строки тоже пишется.
+        """
+        size = os.fstat(tailed.fh.fileno()).st_size
+        if size < tailed.offset:
+            print(f"File {tailed.path} was truncated, reading from the start")
+            tailed.offset = 0
+        inserted = 0
+        while tailed.offset < size:
+            tailed.fh.seek(tailed.offset)
+            block = tailed.fh.read(self.read_size)
+            nl = block.rfind(b'\n')
+            # Строка длиннее read_size - дочитываем до ее конца
+            while nl == -1 and tailed.offset + len(block) < size:
+                more = tailed.fh.read(self.read_size)
+                if not more:
+                    break
+                nl = more.rfind(b'\n')
+                if nl != -1:
+                    nl += len(block)
+                block += more
+            if nl == -1 and not final:
+                # Строка еще дописывается
+                break
+            if nl != -1:
+                block = block[:nl + 1]
+            if not block:
+                break
+            tailed.offset += len(block)
+            records = parse_chunk(block)
+            self.store.insert_batch(records, checkpoint=tailed.checkpoint())
+            inserted += len(records)
+        return inserted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Follow growing Terraform log files and ingest new lines")
+    parser.add_argument('paths', nargs='+', help="log files or directories with TF_LOG outputs")
+    parser.add_argument('--db', default='logs.db', help="database path (default: logs.db)")
+    parser.add_argument('--run', help="write into the named run of the run registry instead of --db")
+    parser.add_argument('--interval', type=float, default=FOLLOW_INTERVAL, help="poll interval, seconds")
+    parser.add_argument('--once', action='store_true', help="ingest what is there and exit")
+    args = parser.parse_args()
+
+    if args.run:
+        registry = RunRegistry()
+        store = registry.open(registry.get_or_create(args.run, 'follow'))
+    else:
+        store = Storage(args.db)
+    follower = Follower(store, args.paths, interval=args.interval)
+    if args.once:
+        print(f"Inserted {follower.poll()} lines")
+        follower.close()
+        return
+    print(f"Following {', '.join(args.paths)} (Ctrl+C to stop)")
+    try:
+        while True:
+            inserted = follower.poll()
+            if inserted:
+                print(f"Inserted {inserted} lines")
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        follower.close()
+
+
+if __name__ == '__main__':
+    main()
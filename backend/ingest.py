@@ -0,0 +1,136 @@
+import os
+import gzip
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional
+
+from backend.parser import parse_lines
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+
+# Размер блока, который уходит в один процесс-парсер (режется по границе строки)
+CHUNK_SIZE = int(os.getenv('INGEST_CHUNK_SIZE', 4 * 1024 * 1024))
+# Сколько процессов парсят параллельно; 1 - парсинг в текущем процессе
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', os.cpu_count() or 1))
+# Файлы меньше этого размера дешевле распарсить в текущем процессе
+PARALLEL_MIN_BYTES = int(os.getenv('INGEST_PARALLEL_MIN_BYTES', 8 * 1024 * 1024))
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# Ошибки чтения/распаковки входного файла (битый архив и т.п.)
+INPUT_ERRORS = (ValueError, OSError, EOFError) + ((zstandard.ZstdError,) if ZSTD_AVAILABLE else ())
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+
+
+def open_decompressed(fileobj: BinaryIO) -> BinaryIO:
+    """Поток с распакованным содержимым: gzip и zstd определяются по сигнатуре"""
+    head = fileobj.read(4)
+    fileobj.seek(0)
+    if head.startswith(GZIP_MAGIC):
+        return gzip.GzipFile(fileobj=fileobj, mode='rb')
+    if head.startswith(ZSTD_MAGIC):
+        if not ZSTD_AVAILABLE:
+            raise ValueError("zstd-compressed upload requires the zstandard package")
+        return zstandard.ZstdDecompressor().stream_reader(fileobj, read_across_frames=True)
+    return fileobj
+
+
+def iter_blocks(stream: BinaryIO, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Чтение потока блоками, выровненными по концу строки.
+
+    Недочитанный хвост последней строки переносится в следующий блок, поэтому
+    в памяти одновременно лежит не больше одного блока и одной строки.
+    """
+    tail = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        nl = chunk.rfind(b'\n')
+        if nl == -1:
+            tail += chunk
+            continue
+        yield tail + chunk[:nl + 1]
+        tail = chunk[nl + 1:]
+    if tail:
+        yield tail
+
+
+def parse_chunk(chunk: bytes) -> List[Dict]:
+    """Парсинг одного блока; выполняется в процессе пула"""
+    return list(parse_lines(chunk.decode('utf-8', errors='ignore').splitlines()))
+
+
+def get_pool(workers: int) -> ProcessPoolExecutor:
+    """Общий пул процессов-парсеров, создается при первом обращении"""
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        # spawn, а не fork: родитель - многопоточный uvicorn с открытым sqlite
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        _pool_workers = workers
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+
+
+def parse_chunks(chunks: Iterable[bytes], workers: int = 1) -> Iterator[List[Dict]]:
+    """Парсинг блоков с сохранением исходного порядка.
+
+    При workers > 1 блоки парсятся в пуле процессов; в работе держится не больше
+    2 * workers блоков, чтобы не копить результаты в памяти.
+    """
+    if workers <= 1:
+        for chunk in chunks:
+            yield parse_chunk(chunk)
+        return
+
+    pool = get_pool(workers)
+    window = deque()
+    for chunk in chunks:
+        window.append(pool.submit(parse_chunk, chunk))
+        if len(window) >= workers * 2:
+            yield window.popleft().result()
+    while window:
+        yield window.popleft().result()
+
+
+def write_records(store, records: Iterable[Dict]) -> int:
+    """Единственный писатель: сохраняет распарсенные записи в Storage по порядку, пачками"""
+    return store.insert_records(records)
+
+
+def ingest_stream(store, fileobj: BinaryIO, workers: Optional[int] = None, size: Optional[int] = None, progress: Optional[Callable[[int], None]] = None) -> int:
+    """Потоковая загрузка файла в Storage: чтение блока -> строки -> парсинг -> запись.
+
+    Пиковая память зависит от размера блока и числа процессов, а не от размера файла.
+    size - размер файла, если известен: по нему выбирается параллельный режим.
+    progress(lines) вызывается после записи каждого блока с числом уже записанных строк.
+    """
+    stream = open_decompressed(fileobj)
+    if stream is not fileobj:
+        # Для сжатого файла размер на входе ничего не говорит об объеме строк
+        size = None
+    if workers is None:
+        workers = INGEST_WORKERS if size is None or size >= PARALLEL_MIN_BYTES else 1
+    inserted = 0
+    for records in parse_chunks(iter_blocks(stream), workers):
+        inserted += write_records(store, records)
+        if progress:
+            progress(inserted)
+    return inserted
@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+
+# Сколько живет ответ модели и сколько ответов держать в памяти
+AI_INSIGHT_TTL = float(os.getenv('AI_INSIGHT_TTL', 24 * 3600))
+AI_INSIGHT_CACHE_SIZE = int(os.getenv('AI_INSIGHT_CACHE_SIZE', 256))
+# Файл SQLite, чтобы ответы переживали перезапуск; пусто - кэш только в памяти
+AI_INSIGHT_CACHE_DB = os.getenv('AI_INSIGHT_CACHE_DB', '')
+# Сколько ответов хранить в файле
+AI_INSIGHT_DB_ROWS = int(os.getenv('AI_INSIGHT_DB_ROWS', 10000))
+
+# Поля строки, которые попадают в промпт и в подсчеты анализаторов; id и read_flag на ответ не влияют
+FINGERPRINT_FIELDS = ['level', 'ts', 'tf_resource', 'text_excerpt']
+
+INSIGHT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ai_insights (
+    fingerprint TEXT PRIMARY KEY,
+    model TEXT,
+    insights TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_ai_insights_last_used ON ai_insights(last_used);
+"""
+
+
+def insight_fingerprint(logs: Iterable[Dict], model: str, prompt: str) -> str:
+    """Отпечаток запроса к модели: содержимое выбранных строк, модель и текст/версия промпта"""
+    h = hashlib.blake2b(digest_size=20)
+    h.update(json.dumps([model, prompt], ensure_ascii=False).encode('utf-8'))
+    for log in logs:
+        h.update(json.dumps([log.get(f) for f in FINGERPRINT_FIELDS], ensure_ascii=False).encode('utf-8'))
+    return h.hexdigest()
+
+
+class _LeaderCancelled(Exception):
+    """Запрос, который считал ответ для ожидающих, отменен (клиент отключился) - ожидающие считают сами"""
+
+
+class InsightCache:
+    """Ответы моделей по отпечатку выбранных логов: TTL + LRU в памяти и, если задан path, в SQLite.
+
+    Одинаковые запросы, пришедшие одновременно, ждут один вызов модели.
+    """
+
+    def __init__(self, ttl: float = AI_INSIGHT_TTL, size: int = AI_INSIGHT_CACHE_SIZE, path: str = AI_INSIGHT_CACHE_DB, db_rows: int = AI_INSIGHT_DB_ROWS):
+        self.ttl = ttl
+        self.size = size
+        self.path = path or None
+        self.db_rows = db_rows
+        self._entries: 'OrderedDict[str, Tuple[float, Dict]]' = OrderedDict()
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.conn = None
+        if self.path:
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.executescript(INSIGHT_SCHEMA)
+
+    def _get(self, key: str) -> Optional[Tuple[float, Dict]]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[0] < self.ttl:
+                    self._entries.move_to_end(key)
+                    return entry
+                del self._entries[key]
+            if self.conn is None:
+                return None
+            row = self.conn.execute("SELECT created_at, insights FROM ai_insights WHERE fingerprint = ? AND created_at > ?",
+                                    (key, now - self.ttl)).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE ai_insights SET last_used = ? WHERE fingerprint = ?", (now, key))
+            self.conn.commit()
+            entry = (row[0], json.loads(row[1]))
+            self._remember(key, entry)
+            return entry
+
+    def _remember(self, key: str, entry: Tuple[float, Dict]):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def _put(self, key: str, model: str, value: Dict):
+        now = time.time()
+        with self._lock:
+            self._remember(key, (now, value))
+            if self.conn is None:
+                return
+            self.conn.execute("INSERT OR REPLACE INTO ai_insights(fingerprint, model, insights, created_at, last_used) VALUES (?,?,?,?,?)",
+                              (key, model, json.dumps(value, ensure_ascii=False), now, now))
+            # Просроченные и самые давно не нужные сверх db_rows
+            self.conn.execute("DELETE FROM ai_insights WHERE created_at <= ?", (now - self.ttl,))
+            self.conn.execute("DELETE FROM ai_insights WHERE fingerprint IN (SELECT fingerprint FROM ai_insights ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.db_rows,))
+            self.conn.commit()
+
+    async def get_or_compute(self, key: str, model: str, compute: Callable[[], Awaitable[Tuple[Dict, bool]]]) -> Tuple[Dict, Optional[float]]:
+        """(ответ, время его получения, если он взят из кэша, иначе None).
+
+        compute() возвращает (ответ, можно ли его кэшировать): демо-ответы без ключа и ответы при ошибках API не кэшируются.
+        """
+        while True:
+            # Чтение файла кэша блокирующее - в отдельном потоке
+            entry = await asyncio.to_thread(self._get, key) if self.conn is not None else self._get(key)
+            if entry is not None:
+                self.hits += 1
+                return entry[1], entry[0]
+            pending = self._pending.get(key)
+            if pending is None:
+                break
+            try:
+                value, cacheable = await asyncio.shield(pending)
+            except _LeaderCancelled:
+                # Один из ожидающих становится новым ведущим, остальные ждут уже его
+                continue
+            if cacheable:
+                self.hits += 1
+                return value, time.time()
+            self.misses += 1
+            return value, None
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            value, cacheable = await compute()
+            if cacheable:
+                if self.conn is not None:
+                    await asyncio.to_thread(self._put, key, model, value)
+                else:
+                    self._put(key, model, value)
+            future.set_result((value, cacheable))
+            return value, None
+        except asyncio.CancelledError:
+            # Отмена относится только к этому запросу: ожидающие клиенты подключены и должны получить ответ
+            future.set_exception(_LeaderCancelled())
+            future.exception()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Ожидающих может не быть - помечаем исключение полученным
+            future.exception()
+            raise
+        finally:
+            del self._pending[key]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            rows = self.conn.execute("SELECT COUNT(*) FROM ai_insights").fetchone()[0] if self.conn is not None else None
+            return {'entries': len(self._entries), 'stored': rows, 'hits': self.hits, 'misses': self.misses,
+                    'ttl_sec': self.ttl, 'path': self.path}
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
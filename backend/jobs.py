@@ -0,0 +1,193 @@
+import os
+import time
+import uuid
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple
+
+from backend.ingest import ingest_stream, INPUT_ERRORS
+
+
+# Сколько загрузок обрабатывается одновременно (запись в SQLite все равно идет по одной)
+JOB_WORKERS = int(os.getenv('INGEST_JOB_WORKERS', 1))
+# Сколько завершенных задач помнить для /jobs
+JOB_HISTORY = int(os.getenv('INGEST_JOB_HISTORY', 100))
+# Каталог для копий загруженных файлов, пока задача не обработана; по умолчанию системный temp
+UPLOAD_DIR = os.getenv('INGEST_UPLOAD_DIR') or None
+COPY_BUFFER = 1024 * 1024
+
+
+def save_upload(fileobj: BinaryIO, suffix: str = '') -> Tuple[str, int]:
+    """Копирует загрузку во временный файл, который живет до конца задачи; возвращает (путь, размер)"""
+    fd, path = tempfile.mkstemp(prefix='upload-', suffix=suffix, dir=UPLOAD_DIR)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            shutil.copyfileobj(fileobj, out, COPY_BUFFER)
+    except Exception:
+        os.remove(path)
+        raise
+    return path, os.path.getsize(path)
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    if ts is None:
+        return None
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+class IngestJob:
+    """Состояние одной фоновой загрузки: queued -> running -> done | failed"""
+
+    def __init__(self, path: str, filename: str, size: int, run: Dict, workers: Optional[int] = None, created_run: bool = False):
+        self.id = uuid.uuid4().hex
+        self.run = run
+        # Прогон заведен под эту загрузку: при ошибке он удаляется, а не остается пустым
+        self.created_run = created_run
+        self.path = path
+        self.filename = filename
+        self.size = size
+        self.workers = workers
+        self.status = 'queued'
+        self.lines = 0
+        self.bytes_read = 0
+        self.errors: List[str] = []
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('done', 'failed')
+
+    def to_dict(self) -> Dict:
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'run_id': self.run['id'],
+            'status': self.status,
+            'lines': self.lines,
+            'bytes_read': self.bytes_read,
+            'size': self.size,
+            # Доля прочитанного входного файла (для сжатых - по сжатым байтам)
+            'progress': round(self.bytes_read / self.size, 4) if self.size else None,
+            'elapsed_sec': round(elapsed, 3) if elapsed is not None else None,
+            'lines_per_sec': round(self.lines / elapsed, 1) if elapsed else None,
+            'errors': self.errors,
+            'created_at': _iso(self.created_at),
+            'started_at': _iso(self.started_at),
+            'finished_at': _iso(self.finished_at),
+        }
+
+
+class JobManager:
+    """Очередь фоновых загрузок.
+
+    Файлы обрабатываются в собственных потоках, вне event loop. Каждая задача пишет
+    через свой Storage (отдельное соединение с базой прогона), открытый store_factory(run).
+    run_exists(run_id) проверяется при постановке в очередь под той же блокировкой, что и drop_run:
+    задача не запишет строки в файл уже удаленного прогона. discard_run(run_id) удаляет прогон,
+    заведенный под упавшую загрузку, иначе пустой или недописанный прогон стал бы последним.
+    """
+
+    def __init__(self, store_factory: Callable[[Dict], object], workers: int = JOB_WORKERS, history: int = JOB_HISTORY,
+                 run_exists: Optional[Callable[[int], bool]] = None, discard_run: Optional[Callable[[int], bool]] = None):
+        self.store_factory = store_factory
+        self.run_exists = run_exists
+        self.discard_run = discard_run
+        self.history = history
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ingest-job')
+        self._jobs: 'OrderedDict[str, IngestJob]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, path: str, filename: str, size: int, run: Dict, workers: Optional[int] = None, created_run: bool = False) -> IngestJob:
+        """Ставит в очередь уже сохраненный файл (см. save_upload) для записи в прогон run; файл удаляется после обработки.
+        created_run - прогон заведен под эту загрузку и удаляется, если она упадет.
+        LookupError - прогон удален (пока сохранялся файл); файл тогда остается вызывающему"""
+        job = IngestJob(path, filename, size, run, workers, created_run)
+        with self._lock:
+            if self.run_exists is not None and not self.run_exists(run['id']):
+                raise LookupError(f"run {run['id']} not found")
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[IngestJob]:
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+    def busy_runs(self) -> set:
+        """id прогонов, в которые сейчас идет или ожидает запись"""
+        with self._lock:
+            return self._busy()
+
+    def drop_run(self, run_id: int, drop: Callable[[int], bool]) -> Optional[bool]:
+        """drop(run_id), если в прогон не идет запись; None - прогон занят.
+        Проверка и удаление идут под блокировкой submit, поэтому новая задача не встанет между ними"""
+        with self._lock:
+            if run_id in self._busy():
+                return None
+            return drop(run_id)
+
+    def _busy(self) -> set:
+        return {job.run['id'] for job in self._jobs.values() if not job.finished}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def _prune(self):
+        # Забываем самые старые завершенные задачи сверх лимита истории
+        excess = len(self._jobs) - self.history
+        for job_id in [j.id for j in self._jobs.values() if j.finished][:max(excess, 0)]:
+            del self._jobs[job_id]
+
+    def _run(self, job: IngestJob):
+        job.status = 'running'
+        job.started_at = time.time()
+        store = None
+        try:
+            store = self.store_factory(job.run)
+            with open(job.path, 'rb') as f:
+                def progress(lines: int):
+                    job.lines = lines
+                    job.bytes_read = f.tell()
+
+                job.lines = ingest_stream(store, f, workers=job.workers, size=job.size, progress=progress)
+                job.bytes_read = job.size
+            job.status = 'done'
+        except INPUT_ERRORS as e:
+            job.errors.append(f"Cannot read upload: {e}")
+            job.status = 'failed'
+        except Exception as e:
+            print(f"❌ Ingest job {job.id} failed: {e}")
+            job.errors.append(f"{type(e).__name__}: {e}")
+            job.status = 'failed'
+        finally:
+            if store is not None:
+                store.close()
+            if job.status == 'failed' and job.created_run and self.discard_run is not None:
+                self._discard(job)
+            job.finished_at = time.time()
+            try:
+                os.remove(job.path)
+            except OSError:
+                pass
+
+    def _discard(self, job: IngestJob):
+        try:
+            # None - в прогон уже пишет другая задача (upload?run=), тогда он остается
+            if self.drop_run(job.run['id'], self.discard_run):
+                job.errors.append(f"Run {job.run['id']} was removed")
+        except Exception as e:
+            print(f"⚠️  Cannot remove run {job.run['id']} of failed job {job.id}: {e}")
@@ -0,0 +1,148 @@
+import os
+import json
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from backend.storage import parse_ts_filter
+
+
+# Сколько строк может ждать отправки одному клиенту; при переполнении буфер сбрасывается
+LIVE_CLIENT_BUFFER = int(os.getenv('LIVE_CLIENT_BUFFER', 5000))
+# Максимум одновременных подписчиков /live
+LIVE_MAX_CLIENTS = int(os.getenv('LIVE_MAX_CLIENTS', 100))
+# Сколько строк уходит одним событием
+LIVE_BATCH = int(os.getenv('LIVE_BATCH', 500))
+# Интервал комментария-пинга, если новых строк нет, секунд
+LIVE_HEARTBEAT = float(os.getenv('LIVE_HEARTBEAT', 15))
+
+
+class LiveFilter:
+    """Те же фильтры, что у /search, но проверяются на уже записанных строках в памяти"""
+
+    def __init__(self, run_id: int, q: str = None, level: str = None, resource: str = None, tf_req_id: str = None, ts_from: str = None, ts_to: str = None, section: str = None, template_id: int = None):
+        self.run_id = run_id
+        # LIKE и FTS в /search регистронезависимы - здесь тоже
+        self.q = q.lower() if q else None
+        self.level = level
+        self.resource = resource.lower() if resource else None
+        self.tf_req_id = tf_req_id
+        self.section = section
+        self.template_id = template_id
+        self.ts_from = parse_ts_filter(ts_from, 'ts_from') if ts_from else None
+        self.ts_to = parse_ts_filter(ts_to, 'ts_to') if ts_to else None
+
+    def matches(self, row: Dict) -> bool:
+        if self.level and row['level'] != self.level:
+            return False
+        if self.tf_req_id and row['tf_req_id'] != self.tf_req_id:
+            return False
+        if self.section and row['section'] != self.section:
+            return False
+        if self.template_id is not None and row['template_id'] != self.template_id:
+            return False
+        if self.resource and self.resource not in str(row['tf_resource'] or '').lower():
+            return False
+        if self.ts_from is not None and (row['ts_us'] is None or row['ts_us'] < self.ts_from):
+            return False
+        if self.ts_to is not None and (row['ts_us'] is None or row['ts_us'] > self.ts_to):
+            return False
+        if self.q and self.q not in row['raw_json'].lower():
+            return False
+        return True
+
+
+class LiveClient:
+    """Подписчик со своим ограниченным буфером строк"""
+
+    def __init__(self, live_filter: LiveFilter, limit: int):
+        self.filter = live_filter
+        self.limit = limit
+        self.pending = deque()
+        self.dropped = 0
+        self.ready = asyncio.Event()
+
+    def push(self, rows: List[Dict]):
+        if len(self.pending) + len(rows) > self.limit:
+            # Клиент не успевает читать: вместо роста памяти сбрасываем буфер,
+            # а клиент по событию overflow перечитывает выдачу через /search
+            self.dropped += len(self.pending) + len(rows)
+            self.pending.clear()
+        else:
+            self.pending.extend(rows)
+        self.ready.set()
+
+    def take(self, n: int) -> Tuple[List[Dict], int]:
+        rows = [self.pending.popleft() for _ in range(min(n, len(self.pending)))]
+        dropped, self.dropped = self.dropped, 0
+        if not self.pending:
+            self.ready.clear()
+        return rows, dropped
+
+
+class LiveHub:
+    """Рассылка только что записанных строк подписчикам /live (Server-Sent Events).
+
+    publish(run_id, rows) подключается к Storage.add_listener и вызывается из потоков записи;
+    раздача по клиентам идет в event loop.
+    """
+
+    def __init__(self, client_buffer: int = LIVE_CLIENT_BUFFER, max_clients: int = LIVE_MAX_CLIENTS, batch: int = LIVE_BATCH, heartbeat: float = LIVE_HEARTBEAT):
+        self.client_buffer = client_buffer
+        self.max_clients = max_clients
+        self.batch = batch
+        self.heartbeat = heartbeat
+        self.clients: List[LiveClient] = []
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def attach(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+
+    def publish(self, run_id: int, rows: List[Dict]):
+        if self.loop is None or not self.clients:
+            return
+        self.loop.call_soon_threadsafe(self._dispatch, run_id, rows)
+
+    def _dispatch(self, run_id: int, rows: List[Dict]):
+        for client in self.clients:
+            if client.filter.run_id != run_id:
+                continue
+            matched = [self._public(r) for r in rows if client.filter.matches(r)]
+            if matched:
+                client.push(matched)
+
+    @staticmethod
+    def _public(row: Dict) -> Dict:
+        return {k: v for k, v in row.items() if k != 'raw_json'}
+
+    def connect(self, live_filter: LiveFilter) -> Optional[LiveClient]:
+        """Новый подписчик; None, если достигнут LIVE_MAX_CLIENTS"""
+        if len(self.clients) >= self.max_clients:
+            return None
+        client = LiveClient(live_filter, self.client_buffer)
+        self.clients.append(client)
+        return client
+
+    def disconnect(self, client: LiveClient):
+        if client in self.clients:
+            self.clients.remove(client)
+
+    async def stream(self, client: LiveClient, is_disconnected: Callable[[], Awaitable[bool]]):
+        """Поток SSE: событие logs - пачка новых строк, overflow - часть строк потеряна, нужно перечитать выдачу"""
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    await asyncio.wait_for(client.ready.wait(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    if await is_disconnected():
+                        break
+                    yield ": ping\n\n"
+                    continue
+                rows, dropped = client.take(self.batch)
+                if dropped:
+                    yield f"event: overflow\ndata: {json.dumps({'dropped': dropped})}\n\n"
+                if rows:
+                    yield f"event: logs\ndata: {json.dumps(rows, ensure_ascii=False)}\n\n"
+        finally:
+            self.disconnect(client)
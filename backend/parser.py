@@ -1,6 +1,7 @@
 import re
 import json
-from typing import Dict, List, Tuple, Optional
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, Tuple, Optional
 
 
 # шаблоны timestamp
@@ -17,12 +18,6 @@ class ParseState:
         self.section_start_ts = None
         self.section_end_ts = None
 
-TS_PATTERNS = [
-    r"(?P<ts>\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d+Z)",
-    r"(?P<ts>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})",
-    r"(?P<ts>\d{2}/\d{2}/\d{4} \d{2}:\d{2}:\d{2})",
-]
-
 LEVEL_KEYWORDS = {
     'error': ['error', 'failed', 'panic', 'exception', 'traceback', 'failure'],
     'warning': ['warning', 'deprecated', 'deprecation', 'warn'],
@@ -30,15 +25,68 @@ LEVEL_KEYWORDS = {
     'debug': ['debug', 'verbose', 'trace']
 }
 
+# Предкомпилированные матчеры: порядок важен, поэтому храним списками
+_TS_REGEXES = [re.compile(p) for p in TS_PATTERNS]
+_LEVEL_MATCHERS = [(w, lvl) for lvl in ['error', 'warning', 'info', 'debug'] for w in LEVEL_KEYWORDS[lvl]]
+_REQ_ID_REGEXES = [
+    re.compile(r"tf_req_id[:=\s]([A-Za-z0-9_\-:.]+)"),
+    re.compile(r"request_id[:=\s]([A-Za-z0-9_\-:.]+)"),
+]
+_JSON_SUBSTRING_RE = re.compile(r"(\{.*\})", re.S)
+_DECODER = json.JSONDecoder()
+REQ_ID_FIELDS = ['tf_req_id', 'req_id', 'request_id', 'tf_request_id', 'correlation_id']
+BODY_FIELDS = ['tf_http_req_body', 'tf_http_res_body', 'http_request_body', 'http_response_body', 'request_body', 'response_body']
+EXCERPT_LEN = 400
+# Поля с текстом сообщения - по нему строятся шаблоны строк (backend/templates.py)
+MESSAGE_FIELDS = ['@message', 'message', 'msg', 'raw']
+# Код ответа HTTP: поля строки, затем поля тела ответа (для индекса запросов по tf_req_id)
+HTTP_STATUS_FIELDS = ['tf_http_res_status_code', 'http_status_code', 'http_status', 'status_code']
+RESPONSE_BODY_FIELDS = ['tf_http_res_body', 'http_response_body', 'response_body']
+BODY_STATUS_FIELDS = ['status_code', 'statusCode', 'status']
+
 def extract_timestamp(s: str) -> Optional[str]:
     if not s:
         return None
-    for p in TS_PATTERNS:
-        m = re.search(p, s)
+    for rx in _TS_REGEXES:
+        m = rx.search(s)
         if m:
             return m.group('ts')
     return None
 
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+# Форматы, которые не понимает datetime.fromisoformat
+_TS_FORMATS = ['%d/%m/%Y %H:%M:%S']
+
+def normalize_ts(ts) -> Optional[int]:
+    """Время лога в микросекундах от эпохи (UTC); None, если формат не распознан.
+
+    Понимает ISO 8601 (с Z, смещением или без зоны), YYYY-MM-DD HH:MM:SS, DD/MM/YYYY HH:MM:SS
+    и числа (секунды или миллисекунды эпохи). Время без зоны считается UTC.
+    """
+    if ts is None or ts == '' or isinstance(ts, bool):
+        return None
+    if isinstance(ts, (int, float)):
+        # 1e11 секунд - это 5138 год, значит больше - уже миллисекунды
+        return int(ts * 1000) if abs(ts) >= 1e11 else int(ts * 1000000)
+    if not isinstance(ts, str):
+        return None
+    try:
+        dt = datetime.fromisoformat(ts)
+    except ValueError:
+        dt = None
+        for fmt in _TS_FORMATS:
+            try:
+                dt = datetime.strptime(ts, fmt)
+                break
+            except ValueError:
+                continue
+        if dt is None:
+            return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return (dt - _EPOCH) // _MICROSECOND
+
 def extract_level_from_obj(obj: Dict) -> Optional[str]:
     """Извлечение уровня лога из разных форматов"""
     # Проверяем стандартные поля для уровня
@@ -64,19 +112,26 @@ def extract_level_from_obj(obj: Dict) -> Optional[str]:
 def guess_level(s: str) -> Optional[str]:
     if not s:
         return None
-    low = s.lower()
-    for lvl in ['error', 'warning', 'info', 'debug']:
-        for w in LEVEL_KEYWORDS.get(lvl, []):
-            if w in low:
-                return lvl
+    return _guess_level_lower(s.lower())
+
+def _guess_level_lower(low: str) -> Optional[str]:
+    # Один проход по плоскому списку (слово, уровень) в порядке приоритета уровней.
+    # Подстрочный поиск str.__contains__ на C быстрее, чем общий regex из всех слов
+    for w, lvl in _LEVEL_MATCHERS:
+        if w in low:
+            return lvl
     return None
 
 def detect_section_from_text(s: str) -> Optional[str]:
     """Определение секции из текста"""
     if not s:
         return None
-    low = s.lower()
-    
+    return _detect_section_lower(s.lower())
+
+def _detect_section_lower(low: str) -> Optional[str]:
+    # Все признаки ниже содержат plan/apply/refreshing state - большинство строк отсекаем за три проверки
+    if 'plan' not in low and 'apply' not in low and 'refreshing state' not in low:
+        return None
     # План
     if 'terraform plan' in low or 'plan:' in low or 'plan operation' in low:
         return 'plan'
@@ -94,42 +149,83 @@ def detect_section_from_text(s: str) -> Optional[str]:
     return None
 
 def extract_tf_req_id(obj: Dict, text: str) -> Optional[str]:
-    for k in ['tf_req_id', 'req_id', 'request_id', 'tf_request_id', 'correlation_id']:
+    for k in REQ_ID_FIELDS:
         if k in obj:
             return obj[k]
         if text:
-            m = re.search(r"tf_req_id[:=\s]([A-Za-z0-9_\-:.]+)", text)
-            if m:
-                return m.group(1)
-            m = re.search(r"request_id[:=\s]([A-Za-z0-9_\-:.]+)", text)
-            if m:
-                return m.group(1)
+            for rx in _REQ_ID_REGEXES:
+                m = rx.search(text)
+                if m:
+                    return m.group(1)
     return None
 
 def extract_json_bodies(obj: Dict) -> List[Tuple[str, object]]:
+    return [(key, body) for key, body, _ in _extract_bodies(obj)]
+
+def _extract_bodies(obj: Dict) -> List[Tuple[str, object, Optional[str]]]:
+    """Тела вместе с исходным JSON-текстом (если он был), чтобы не сериализовать их повторно"""
     out = []
-    for key in ['tf_http_req_body', 'tf_http_res_body', 'http_request_body', 'http_response_body', 'request_body', 'response_body']:
+    for key in BODY_FIELDS:
         if key in obj and obj[key]:
             val = obj[key]
             if isinstance(val, str):
                 try:
                     j = json.loads(val)
-                    out.append((key, j))
+                    out.append((key, j, val))
                 except Exception:
                     # try to find JSON substring
-                    m = re.search(r"(\{.*\})", val, re.S)
+                    m = _JSON_SUBSTRING_RE.search(val)
                     if m:
                         try:
                             j = json.loads(m.group(1))
-                            out.append((key, j))
+                            out.append((key, j, m.group(1)))
                         except Exception:
-                            out.append((key, val))
+                            out.append((key, val, None))
                     else:
-                        out.append((key, val))
+                        out.append((key, val, None))
             else:
-                out.append((key, val))
+                out.append((key, val, None))
     return out
 
+def dump_body(body: object) -> str:
+    """Сериализация тела для json_bodies.body_json"""
+    try:
+        return json.dumps(body, ensure_ascii=False)
+    except Exception:
+        return str(body)
+
+def extract_message(obj: Dict) -> Optional[str]:
+    """Текст сообщения строки без служебных полей (начало, не длиннее EXCERPT_LEN)"""
+    for field in MESSAGE_FIELDS:
+        value = obj.get(field)
+        if isinstance(value, str) and value:
+            return value[:EXCERPT_LEN]
+    return None
+
+def _http_status(value) -> Optional[int]:
+    if isinstance(value, bool):
+        return None
+    try:
+        code = int(value)
+    except (TypeError, ValueError):
+        return None
+    return code if 100 <= code <= 599 else None
+
+def extract_http_status(obj: Dict, bodies: Optional[List[Tuple[str, object]]] = None) -> Optional[int]:
+    """Код ответа HTTP из полей строки или из извлеченного тела ответа (bodies - результат extract_json_bodies)"""
+    for field in HTTP_STATUS_FIELDS:
+        if field in obj:
+            code = _http_status(obj[field])
+            if code:
+                return code
+    for key, body in (extract_json_bodies(obj) if bodies is None else bodies):
+        if key in RESPONSE_BODY_FIELDS and isinstance(body, dict):
+            for field in BODY_STATUS_FIELDS:
+                code = _http_status(body.get(field))
+                if code:
+                    return code
+    return None
+
 def extract_tf_resource(obj: Dict) -> Optional[str]:
     """Извлечение terraform ресурса из объекта"""
     resource_fields = ['tf_resource', 'resource', 'tf_resource_type', 'type', 'resource_type']
@@ -159,14 +255,86 @@ def parse_line(obj: Dict, raw_text: str = "") -> Dict:
     tf_req_id = extract_tf_req_id(obj, text) or extract_tf_req_id(obj, raw_text)
     tf_resource = extract_tf_resource(obj) or obj.get('resource') or None
     bodies = extract_json_bodies(obj)
-    excerpt = (text[:400] + '...') if len(text) > 400 else text
+    excerpt = (text[:EXCERPT_LEN] + '...') if len(text) > EXCERPT_LEN else text
+    message = extract_message(obj)
     
     return {
         'ts': ts,
+        'ts_us': normalize_ts(ts),
+        'level': level,
+        'section': section,
+        'tf_req_id': tf_req_id,
+        'tf_resource': tf_resource,
+        'bodies': bodies,
+        'excerpt': excerpt,
+        'message': message,
+        'http_status': extract_http_status(obj, bodies),
+    }
+
+
+def _parse_decoded(obj: Dict, line: str) -> Dict:
+    """parse_line для уже декодированного объекта: все текстовые проверки по исходной строке"""
+    low = line.lower()
+    ts = obj.get('timestamp') or obj.get('@timestamp') or extract_timestamp(line)
+    level = extract_level_from_obj(obj) or _guess_level_lower(low)
+
+    section = _detect_section_lower(low)
+    if not section and obj.get('type') == 'change_summary':
+        section = 'plan_summary'
+    elif not section and obj.get('type') == 'apply':
+        section = 'apply_summary'
+
+    tf_req_id = extract_tf_req_id(obj, line)
+    tf_resource = extract_tf_resource(obj) or obj.get('resource') or None
+    extracted = _extract_bodies(obj)
+    bodies = [(key, body) for key, body, _ in extracted]
+    excerpt = (line[:EXCERPT_LEN] + '...') if len(line) > EXCERPT_LEN else line
+
+    return {
+        'ts': ts,
+        'ts_us': normalize_ts(ts),
         'level': level,
         'section': section,
         'tf_req_id': tf_req_id,
         'tf_resource': tf_resource,
         'bodies': bodies,
+        'bodies_json': [(key, src if src is not None else dump_body(body)) for key, body, src in extracted],
         'excerpt': excerpt,
-    }
\ No newline at end of file
+        'message': extract_message(obj),
+        'http_status': extract_http_status(obj, bodies),
+    }
+
+def parse_lines(lines: Iterable[str]) -> Iterator[Dict]:
+    """Пакетный парсинг сырых строк лога.
+
+    Отдает те же поля, что и parse_line, плюс raw_json и bodies_json (тела, уже готовые
+    для json_bodies.body_json) для записи в БД. Пустые строки пропускаются.
+    JSON-строки не сериализуются заново: в raw_json уходит сама строка, а поиск уровня,
+    секции и timestamp идет по ней один раз. Строки, которые не являются JSON-объектом,
+    сохраняются как {"raw": line}, как и раньше в /upload.
+    """
+    # raw_decode без обертки json.loads: строка уже обрезана, хвост проверяем сами
+    raw_decode = _DECODER.raw_decode
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if not line or line.isspace():
+            continue
+
+        obj = None
+        stripped = line if line[0] == '{' and line[-1] == '}' else line.strip()
+        if stripped[0] == '{':
+            try:
+                obj, end = raw_decode(stripped)
+                if end != len(stripped):
+                    obj = None
+            except ValueError:
+                obj = None
+
+        if isinstance(obj, dict):
+            parsed = _parse_decoded(obj, stripped)
+            parsed['raw_json'] = stripped
+        else:
+            obj = {"raw": line}
+            parsed = _parse_decoded(obj, line)
+            parsed['raw_json'] = json.dumps(obj, ensure_ascii=False)
+        yield parsed
@@ -0,0 +1,278 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import itertools
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+try:
+    import grpc
+    import grpc.aio
+
+    plugins_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'plugins')
+    sys.path.insert(0, plugins_path)
+
+    import plugin_pb2
+    import plugin_pb2_grpc
+
+    sys.path.remove(plugins_path)
+
+    GRPC_AVAILABLE = True
+except ImportError:
+    GRPC_AVAILABLE = False
+    print("gRPC not available - install grpcio and generate proto files")
+
+
+# Адрес сервера плагинов (в docker-compose - plugin:50051)
+PLUGIN_TARGET = os.getenv('PLUGIN_TARGET', 'localhost:50051')
+# Сколько долгоживущих каналов держать; вызовы распределяются по ним по кругу
+PLUGIN_CHANNELS = int(os.getenv('PLUGIN_CHANNELS', 2))
+# Дедлайн одного вызова вместе с повторами, секунд
+PLUGIN_TIMEOUT = float(os.getenv('PLUGIN_TIMEOUT', 10))
+# Сколько раз повторять вызов, если сервер недоступен (повторы делает сам gRPC по service config)
+PLUGIN_RETRIES = int(os.getenv('PLUGIN_RETRIES', 2))
+# Автомат отключения: после стольких сбоев подряд вызовы не идут на сервер PLUGIN_BREAKER_RESET секунд
+PLUGIN_BREAKER_FAILURES = int(os.getenv('PLUGIN_BREAKER_FAILURES', 5))
+PLUGIN_BREAKER_RESET = float(os.getenv('PLUGIN_BREAKER_RESET', 30))
+# 1000 строк с raw_json не помещаются в стандартные 4 МБ сообщения gRPC
+PLUGIN_MAX_MESSAGE = int(os.getenv('PLUGIN_MAX_MESSAGE_MB', 64)) * 1024 * 1024
+PLUGIN_KEEPALIVE_MS = int(os.getenv('PLUGIN_KEEPALIVE_MS', 30000))
+# Строк в одной пачке потока ProcessLogStream и дедлайн всего потока, секунд
+PLUGIN_BATCH = int(os.getenv('PLUGIN_BATCH', 500))
+PLUGIN_STREAM_TIMEOUT = float(os.getenv('PLUGIN_STREAM_TIMEOUT', 600))
+
+LOG_FIELDS = ['id', 'raw_json', 'ts', 'level', 'tf_req_id', 'tf_resource', 'section', 'text_excerpt']
+
+# Эти ошибки говорят о проблеме сервера и считаются автоматом отключения; остальные - ошибки запроса
+BREAKER_CODES = {'UNAVAILABLE', 'DEADLINE_EXCEEDED', 'RESOURCE_EXHAUSTED', 'INTERNAL', 'UNKNOWN'}
+
+
+class PluginError(Exception):
+    """Плагин не ответил; вызывающий код возвращает данные без обработки"""
+
+
+class CircuitBreaker:
+    """closed - вызовы идут; open - сервер считается упавшим, вызовы сразу отклоняются;
+    half_open - после reset_timeout пропускается один пробный вызов"""
+
+    def __init__(self, failures: int = PLUGIN_BREAKER_FAILURES, reset_timeout: float = PLUGIN_BREAKER_RESET):
+        self.max_failures = failures
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == 'closed':
+            return True
+        if state == 'half_open' and not self._probe:
+            self._probe = True
+            return True
+        return False
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probe = False
+
+    def cancel(self):
+        # Пробный вызов отменен до ответа - следующий вызов снова может стать пробой
+        self._probe = False
+
+    def failure(self):
+        self.failures += 1
+        self._probe = False
+        if self.opened_at is not None or self.failures >= self.max_failures:
+            # Неудачная проба снова открывает автомат на reset_timeout
+            self.opened_at = time.monotonic()
+
+
+def _service_config(retries: int) -> str:
+    if retries <= 0:
+        return json.dumps({})
+    return json.dumps({'methodConfig': [{
+        'name': [{'service': 'plugin.LogProcessor'}],
+        'retryPolicy': {
+            'maxAttempts': retries + 1,
+            'initialBackoff': '0.1s',
+            'maxBackoff': '1s',
+            'backoffMultiplier': 2,
+            'retryableStatusCodes': ['UNAVAILABLE'],
+        },
+    }]})
+
+
+class PluginClient:
+    """Асинхронный клиент сервера плагинов на пуле долгоживущих каналов grpc.aio.
+
+    Каналы создаются при первом вызове в event loop сервера и живут до close().
+    Каждый вызов ограничен дедлайном timeout; недоступность сервера gRPC повторяет сам,
+    а после серии сбоев автомат отключения перестает слать вызовы до reset_timeout.
+    """
+
+    def __init__(self, target: str = PLUGIN_TARGET, channels: int = PLUGIN_CHANNELS, timeout: float = PLUGIN_TIMEOUT, retries: int = PLUGIN_RETRIES, breaker: Optional[CircuitBreaker] = None):
+        self.target = target
+        self.size = max(channels, 1)
+        self.timeout = timeout
+        self.retries = retries
+        self.breaker = breaker or CircuitBreaker()
+        self._channels: List = []
+        self._stubs: List = []
+        self._next = itertools.count()
+        # Ответы Describe по filter_type; забываются после сбоя (сервер мог смениться)
+        self._fields: Dict[str, Optional[List[str]]] = {}
+
+    def _options(self) -> List[Tuple[str, object]]:
+        return [
+            ('grpc.keepalive_time_ms', PLUGIN_KEEPALIVE_MS),
+            ('grpc.keepalive_timeout_ms', 10000),
+            ('grpc.keepalive_permit_without_calls', 1),
+            ('grpc.http2.max_pings_without_data', 0),
+            ('grpc.max_send_message_length', PLUGIN_MAX_MESSAGE),
+            ('grpc.max_receive_message_length', PLUGIN_MAX_MESSAGE),
+            ('grpc.enable_retries', 1 if self.retries > 0 else 0),
+            ('grpc.service_config', _service_config(self.retries)),
+            # Без этой опции gRPC склеивает каналы с одинаковыми настройками в одно соединение
+            ('grpc.use_local_subchannel_pool', 1),
+        ]
+
+    def _stub(self):
+        if not self._stubs:
+            for _ in range(self.size):
+                channel = grpc.aio.insecure_channel(self.target, options=self._options())
+                self._channels.append(channel)
+                self._stubs.append(plugin_pb2_grpc.LogProcessorStub(channel))
+        return self._stubs[next(self._next) % len(self._stubs)]
+
+    @staticmethod
+    def _entry(log: Dict, fields: Optional[List[str]] = None):
+        # Незаданные поля proto3 не сериализуются: строка весит только то, что нужно плагину
+        return plugin_pb2.LogEntry(**{f: log.get(f) or (0 if f == 'id' else '') for f in fields or LOG_FIELDS})
+
+    @staticmethod
+    def _result(entry) -> Dict:
+        return {'id': entry.id, 'level': entry.level, 'text_excerpt': entry.text_excerpt}
+
+    def _failed(self, e: Exception) -> PluginError:
+        if not isinstance(e, grpc.aio.AioRpcError):
+            self.breaker.failure()
+            self._fields.clear()
+            return PluginError(str(e))
+        if e.code().name in BREAKER_CODES:
+            self.breaker.failure()
+            self._fields.clear()
+        else:
+            self.breaker.success()
+        return PluginError(f"{e.code().name}: {e.details()}")
+
+    def _check(self):
+        if not GRPC_AVAILABLE:
+            raise PluginError("gRPC not available")
+        if not self.breaker.allow():
+            raise PluginError(f"plugin {self.target} is unavailable, retry in {self.breaker.reset_timeout:.0f}s")
+
+    async def describe(self, filter_type: str) -> Optional[List[str]]:
+        """Поля, которые нужны фильтру (LOG_FIELDS, если плагин не ограничивает);
+        None - сервер старый, без Describe и ProcessLogStream"""
+        if filter_type in self._fields:
+            return self._fields[filter_type]
+        self._check()
+        try:
+            info = await self._stub().Describe(plugin_pb2.DescribeRequest(filter_type=filter_type), timeout=self.timeout)
+            fields = [f for f in LOG_FIELDS if f in info.fields] or list(LOG_FIELDS)
+        except grpc.aio.AioRpcError as e:
+            if e.code() != grpc.StatusCode.UNIMPLEMENTED:
+                raise self._failed(e) from e
+            fields = None
+        except asyncio.CancelledError:
+            self.breaker.cancel()
+            raise
+        except Exception as e:
+            raise self._failed(e) from e
+        self.breaker.success()
+        self._fields[filter_type] = fields
+        return fields
+
+    async def process(self, logs: List[Dict], filter_type: str = "default", parameters: Optional[Dict[str, str]] = None) -> Tuple[List[Dict], str]:
+        """Строки после плагина и его summary; PluginError, если плагин недоступен или ответил ошибкой"""
+        self._check()
+        try:
+            request = plugin_pb2.LogRequest(logs=[self._entry(log) for log in logs], filter_type=filter_type, parameters=parameters or {})
+            response = await self._stub().ProcessLogs(request, timeout=self.timeout, wait_for_ready=False)
+        except asyncio.CancelledError:
+            self.breaker.cancel()
+            raise
+        except Exception as e:
+            raise self._failed(e) from e
+        self.breaker.success()
+        return [self._result(entry) for entry in response.filtered_logs], response.summary
+
+    async def stream(self, batches: AsyncIterator[List[Dict]], filter_type: str = "default", parameters: Optional[Dict[str, str]] = None, fields: Optional[List[str]] = LOG_FIELDS) -> AsyncIterator[Tuple[List[Dict], Optional[str]]]:
+        """Обработка потока пачек строк: отдает (отфильтрованные строки, None) по мере ответов плагина
+        и в конце ([], summary). В пачках достаточно полей fields (см. describe);
+        fields=None - сервер без ProcessLogStream, каждая пачка уходит отдельным ProcessLogs"""
+        if fields is None:
+            total = returned = 0
+            async for rows in batches:
+                processed, _ = await self.process(rows, filter_type, parameters)
+                total += len(rows)
+                returned += len(processed)
+                if processed:
+                    yield processed, None
+            yield [], f"Processed {total} logs, returned {returned} (filter: {filter_type})"
+            return
+
+        self._check()
+
+        async def requests():
+            first = True
+            async for rows in batches:
+                batch = plugin_pb2.LogBatch(logs=[self._entry(log, fields) for log in rows])
+                if first:
+                    batch.filter_type = filter_type
+                    batch.parameters.update(parameters or {})
+                    first = False
+                yield batch
+
+        call = self._stub().ProcessLogStream(requests(), timeout=PLUGIN_STREAM_TIMEOUT)
+        try:
+            async for response in call:
+                yield [self._result(entry) for entry in response.filtered_logs], response.summary or None
+        except (asyncio.CancelledError, GeneratorExit):
+            self.breaker.cancel()
+            raise
+        except Exception as e:
+            raise self._failed(e) from e
+        finally:
+            # Потребитель ушел раньше (клиент HTTP отключился) - поток на сервере закрывается
+            call.cancel()
+        self.breaker.success()
+
+    def status(self) -> Dict:
+        return {'target': self.target, 'available': GRPC_AVAILABLE, 'channels': len(self._channels),
+                'breaker': self.breaker.state, 'failures': self.breaker.failures}
+
+    async def health(self) -> List[Dict]:
+        """Состояние процессов сервера плагинов; не учитывается автоматом отключения"""
+        if not GRPC_AVAILABLE:
+            raise PluginError("gRPC not available")
+        try:
+            response = await self._stub().Health(plugin_pb2.HealthRequest(), timeout=self.timeout)
+        except grpc.aio.AioRpcError as e:
+            raise PluginError(f"{e.code().name}: {e.details()}") from e
+        return [{'worker': w.worker, 'pid': w.pid, 'status': w.status, 'requests': w.requests, 'errors': w.errors,
+                 'uptime_sec': w.uptime_sec, 'heartbeat_age_sec': w.heartbeat_age_sec} for w in response.workers]
+
+    async def close(self):
+        channels, self._channels, self._stubs = self._channels, [], []
+        await asyncio.gather(*(channel.close() for channel in channels), return_exceptions=True)
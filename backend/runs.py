@@ -0,0 +1,174 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from backend.storage import Storage
+
+
+# Каталог с базами прогонов (по файлу на прогон) и реестром runs.db
+RUNS_DIR = os.getenv('RUNS_DIR', 'runs')
+# Сколько баз прогонов держать открытыми для чтения одновременно
+RUN_CACHE_SIZE = int(os.getenv('RUN_CACHE_SIZE', 16))
+
+REGISTRY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT,
+    path TEXT,
+    source TEXT,
+    created_at TEXT,
+    lines INTEGER NOT NULL DEFAULT 0
+);
+"""
+RUN_COLUMNS = ['id', 'name', 'path', 'source', 'created_at', 'lines']
+
+
+class RunRegistry:
+    """Прогоны (загрузки, слежение) и их базы.
+
+    Каждый прогон хранится в своем файле SQLite, поэтому запросы идут только по его строкам,
+    а удаление прогона - это удаление файла, а не DELETE по общей таблице.
+    Базу, созданную до появления прогонов (default_path), реестр заводит как прогон 'default'.
+    """
+
+    def __init__(self, runs_dir: str = RUNS_DIR, default_path: Optional[str] = None, store_factory: Callable[[Dict], Storage] = None, cache_size: int = RUN_CACHE_SIZE):
+        self.runs_dir = runs_dir
+        self.default_path = default_path
+        # store_factory(run) открывает Storage прогона; app подключает через нее live-рассылку
+        self.store_factory = store_factory or (lambda run: Storage(run['path']))
+        self.cache_size = cache_size
+        self._stores: 'OrderedDict[int, Storage]' = OrderedDict()
+        self._lock = threading.RLock()
+        os.makedirs(runs_dir, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(runs_dir, 'runs.db'), check_same_thread=False)
+        self.conn.executescript(REGISTRY_SCHEMA)
+        self._ensure_default()
+
+
+    def _ensure_default(self):
+        # Без прогонов запросам не из чего читать: держим хотя бы прогон default
+        if self.default_path and not self.list():
+            run = self._insert('default', self.default_path, 'default')
+            self.add_lines(run['id'], self._count_lines(self.default_path))
+
+
+    @staticmethod
+    def _count_lines(path: str) -> int:
+        if not os.path.exists(path):
+            return 0
+        try:
+            conn = sqlite3.connect(path)
+            try:
+                return conn.execute("SELECT COUNT(*) FROM logs").fetchone()[0]
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return 0
+
+
+    def _insert(self, name: str, path: Optional[str], source: str) -> Dict:
+        with self._lock:
+            cur = self.conn.cursor()
+            cur.execute("INSERT INTO runs(name, path, source, created_at) VALUES (?,?,?,?)",
+                        (name, path, source, datetime.now(timezone.utc).isoformat()))
+            run_id = cur.lastrowid
+            if path is None:
+                path = os.path.join(self.runs_dir, f'run-{run_id}.db')
+                cur.execute("UPDATE runs SET path = ? WHERE id = ?", (path, run_id))
+            self.conn.commit()
+        return self.get(run_id)
+
+
+    def create(self, name: str, source: str = 'upload') -> Dict:
+        """Новый прогон со своим файлом базы"""
+        return self._insert(name, None, source)
+
+
+    def get_or_create(self, name: str, source: str) -> Dict:
+        """Последний прогон с таким именем и источником (для слежения) или новый"""
+        with self._lock:
+            cur = self.conn.cursor()
+            cur.execute(f"SELECT {', '.join(RUN_COLUMNS)} FROM runs WHERE name = ? AND source = ? ORDER BY id DESC LIMIT 1", (name, source))
+            row = cur.fetchone()
+        return dict(zip(RUN_COLUMNS, row)) if row else self.create(name, source)
+
+
+    def get(self, run_id: int) -> Optional[Dict]:
+        with self._lock:
+            cur = self.conn.cursor()
+            cur.execute(f"SELECT {', '.join(RUN_COLUMNS)} FROM runs WHERE id = ?", (run_id,))
+            row = cur.fetchone()
+        return dict(zip(RUN_COLUMNS, row)) if row else None
+
+
+    def latest(self) -> Optional[Dict]:
+        runs = self.list(limit=1)
+        return runs[0] if runs else None
+
+
+    def list(self, limit: int = None) -> List[Dict]:
+        """Прогоны, сначала новые"""
+        with self._lock:
+            cur = self.conn.cursor()
+            cur.execute(f"SELECT {', '.join(RUN_COLUMNS)} FROM runs ORDER BY id DESC LIMIT ?", (limit if limit else -1,))
+            rows = cur.fetchall()
+        return [dict(zip(RUN_COLUMNS, r)) for r in rows]
+
+
+    def add_lines(self, run_id: int, lines: int):
+        with self._lock:
+            self.conn.execute("UPDATE runs SET lines = lines + ? WHERE id = ?", (lines, run_id))
+            self.conn.commit()
+
+
+    def open(self, run: Dict) -> Storage:
+        """Новое соединение с базой прогона (для писателей: загрузки, слежения)"""
+        store = self.store_factory(run)
+        store.add_listener(lambda rows, run_id=run['id']: self.add_lines(run_id, len(rows)))
+        return store
+
+
+    def store(self, run: Dict) -> Storage:
+        """Общее соединение для чтения; последние RUN_CACHE_SIZE прогонов держатся открытыми"""
+        with self._lock:
+            store = self._stores.get(run['id'])
+            if store is not None:
+                self._stores.move_to_end(run['id'])
+                return store
+        opened = self.open(run)
+        evicted = []
+        with self._lock:
+            store = self._stores.setdefault(run['id'], opened)
+            self._stores.move_to_end(run['id'])
+            while len(self._stores) > self.cache_size:
+                evicted.append(self._stores.popitem(last=False)[1])
+        if store is not opened:
+            # Другой поток успел открыть этот прогон раньше
+            evicted.append(opened)
+        # Читатели, занятые запросами, закроются, когда запросы их вернут (см. Storage.close)
+        for old in evicted:
+            old.close()
+        return store
+
+
+    def drop(self, run_id: int) -> bool:
+        """Удаляет прогон вместе с файлом базы; False, если прогона нет"""
+        run = self.get(run_id)
+        if run is None:
+            return False
+        with self._lock:
+            store = self._stores.pop(run_id, None)
+            self.conn.execute("DELETE FROM runs WHERE id = ?", (run_id,))
+            self.conn.commit()
+        if store is not None:
+            store.close()
+        for suffix in ['', '-wal', '-shm']:
+            try:
+                os.remove(run['path'] + suffix)
+            except FileNotFoundError:
+                pass
+        self._ensure_default()
+        return True
@@ -1,70 +1,905 @@
+import os
+import json
+import base64
+import queue
+import hashlib
+import itertools
 import sqlite3
-from typing import List, Dict, Optional
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from datetime import datetime, timezone
+from typing import Callable, Iterable, Iterator, List, Dict, Optional, Tuple
 
+from backend.parser import normalize_ts, extract_message, extract_http_status
+from backend.compression import Codec, COMPRESSION
+from backend.templates import TemplateMiner
+
+
+# Настройки записи: размер пачки для insert_records и режимы журнала/синхронизации SQLite
+BATCH_SIZE = int(os.getenv('DB_BATCH_SIZE', 2000))
+JOURNAL_MODE = os.getenv('DB_JOURNAL_MODE', 'WAL').upper()
+SYNCHRONOUS = os.getenv('DB_SYNCHRONOUS', 'NORMAL').upper()
+# Сколько read-only соединений держит один Storage для параллельных запросов чтения
+READ_POOL_SIZE = int(os.getenv('DB_READ_POOL_SIZE', 4))
+
+# Токенизатор полнотекстового индекса: trigram ищет подстроки (как LIKE), unicode61 - слова
+FTS_TOKENIZE = os.getenv('DB_FTS_TOKENIZE', 'trigram')
+# trigram не находит запросы короче трех символов - для них остается LIKE
+FTS_MIN_QUERY = 3
+
+JOURNAL_MODES = {'WAL', 'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'OFF'}
+SYNCHRONOUS_MODES = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
 
 SCHEMA = """
-PRAGMA journal_mode=WAL;
 CREATE TABLE IF NOT EXISTS logs (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     raw_json TEXT NOT NULL,
     ts TEXT,
+    ts_us INTEGER,
     level TEXT,
     tf_req_id TEXT,
     tf_resource TEXT,
     section TEXT,
     text_excerpt TEXT,
-    read_flag INTEGER DEFAULT 0
+    read_flag INTEGER DEFAULT 0,
+    template_id INTEGER
 );
 CREATE TABLE IF NOT EXISTS json_bodies (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     log_id INTEGER,
     body_type TEXT,
-    body_json TEXT
+    body_json TEXT,
+    body_hash BLOB
+);
+CREATE TABLE IF NOT EXISTS json_blobs (
+    hash BLOB PRIMARY KEY,
+    body_json TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS follow_offsets (
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    path TEXT,
+    offset INTEGER NOT NULL,
+    head_len INTEGER NOT NULL,
+    head_hash BLOB,
+    updated_at TEXT,
+    PRIMARY KEY (dev, ino)
+);
+CREATE TABLE IF NOT EXISTS compression_dicts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    dict BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS log_templates (
+    id INTEGER PRIMARY KEY,
+    template TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    first_us INTEGER,
+    last_us INTEGER
 );
 CREATE INDEX IF NOT EXISTS idx_logs_tf_req_id ON logs(tf_req_id);
-CREATE INDEX IF NOT EXISTS idx_logs_ts ON logs(ts);
 CREATE INDEX IF NOT EXISTS idx_logs_level ON logs(level);
 CREATE INDEX IF NOT EXISTS idx_logs_tf_resource ON logs(tf_resource);
 CREATE INDEX IF NOT EXISTS idx_logs_section ON logs(section);
 """
 
+# Выполняется после миграций: в старых базах колонка ts_us появляется только в _migrate
+POST_MIGRATION_SCHEMA = """
+DROP INDEX IF EXISTS idx_logs_ts;
+CREATE INDEX IF NOT EXISTS idx_logs_ts_us ON logs(ts_us);
+CREATE INDEX IF NOT EXISTS idx_json_bodies_log_id ON json_bodies(log_id);
+CREATE INDEX IF NOT EXISTS idx_logs_template_id ON logs(template_id, ts_us);
+"""
+
+# Индекс без копии данных (content=''): текст уже лежит в logs, в FTS хранится только индекс.
+# Индексируется только raw_json - text_excerpt это его начало, а trigram-индекс занимает
+# в несколько раз больше самих данных
+FTS_SCHEMA = "CREATE VIRTUAL TABLE logs_fts USING fts5(raw_json, content='', tokenize='{tokenize}')"
+
+# Сводки, которые обновляются при записи: /sections и /requests читают их вместо GROUP BY по logs
+SUMMARY_LEVELS = ['error', 'warning', 'info', 'debug']
+SUMMARY_TABLES = {'section_summary': 'section', 'request_summary': 'tf_req_id'}
+SUMMARY_SCHEMA = """
+CREATE TABLE {table} (
+    {key} TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    start_us INTEGER,
+    end_us INTEGER,
+    error_count INTEGER NOT NULL DEFAULT 0,
+    warning_count INTEGER NOT NULL DEFAULT 0,
+    info_count INTEGER NOT NULL DEFAULT 0,
+    debug_count INTEGER NOT NULL DEFAULT 0,
+    other_count INTEGER NOT NULL DEFAULT 0{extra_columns}
+)
+"""
+SUMMARY_COUNTS = [f"{lvl}_count" for lvl in SUMMARY_LEVELS] + ['other_count']
+# Дополнительные колонки сводки: (колонка, тип, какое значение группы хранится - первое или последнее непустое)
+SUMMARY_EXTRAS = {
+    'section_summary': [],
+    'request_summary': [('tf_resource', 'TEXT', 'first'), ('http_status', 'INTEGER', 'last')],
+}
+EXTRA_UPDATES = {'first': '{c} = COALESCE({c}, excluded.{c})', 'last': '{c} = COALESCE(excluded.{c}, {c})'}
+# MIN/MAX с COALESCE: у группы или у пачки времени может не быть (NULL)
+SUMMARY_UPSERT = """
+INSERT INTO {table}({key}, count, start_us, end_us, {counts}) VALUES (?, ?, ?, ?, {count_params})
+ON CONFLICT({key}) DO UPDATE SET
+    count = count + excluded.count,
+    start_us = MIN(COALESCE(start_us, excluded.start_us), COALESCE(excluded.start_us, start_us)),
+    end_us = MAX(COALESCE(end_us, excluded.end_us), COALESCE(excluded.end_us, end_us)),
+    {count_updates}
+"""
+# Индекс запросов по tf_req_id для /traces: сортировка по длительности и по времени начала без просмотра всей сводки
+TRACE_SCHEMA = [
+    "CREATE INDEX IF NOT EXISTS idx_request_summary_duration ON request_summary((end_us - start_us))",
+    "CREATE INDEX IF NOT EXISTS idx_request_summary_start ON request_summary(start_us)",
+]
+DURATION_SQL = "(end_us - start_us)"
+# В SQLite NULL меньше любых значений, поэтому при DESC запросы без времени и кода идут последними
+TRACE_ORDERS = {
+    'duration': f"{DURATION_SQL} DESC",
+    'start': "start_us DESC",
+    'count': "count DESC",
+    'errors': "error_count DESC, http_status DESC",
+}
+TRACE_FAILED_SQL = "(error_count > 0 OR http_status >= 400)"
+SUMMARY_BACKFILL = """
+INSERT INTO {table}({key}, count, start_us, end_us, {counts})
+SELECT {key}, COUNT(*), MIN(ts_us), MAX(ts_us), {count_exprs}
+FROM logs WHERE {key} IS NOT NULL GROUP BY {key}
+"""
+
+# Шаблоны строк (см. backend/templates.py): текст шаблона может обобщаться, поэтому обновляется вместе со счетчиками
+TEMPLATE_UPSERT = """
+INSERT INTO log_templates(id, template, count, first_us, last_us) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT(id) DO UPDATE SET
+    template = excluded.template,
+    count = count + excluded.count,
+    first_us = MIN(COALESCE(first_us, excluded.first_us), COALESCE(excluded.first_us, first_us)),
+    last_us = MAX(COALESCE(last_us, excluded.last_us), COALESCE(excluded.last_us, last_us))
+"""
+PATTERN_ORDERS = {
+    'count': 'count DESC, id',
+    'last_seen': 'last_us IS NULL, last_us DESC, id',
+    'first_seen': 'first_us IS NULL, first_us, id',
+}
+
+# raw_json в списках не отдается: он может быть сжат и нужен только по запросу (include_raw / get_raw)
+LOG_COLUMNS = "logs.id, logs.ts, logs.ts_us, logs.level, logs.tf_req_id, logs.tf_resource, logs.section, logs.text_excerpt, logs.read_flag, logs.template_id"
+# raw_text() распаковывает только сжатые (BLOB) значения
+RAW_TEXT_SQL = "CASE WHEN typeof(logs.raw_json) = 'blob' THEN raw_text(logs.raw_json) ELSE logs.raw_json END"
+
+# Ссылки json_bodies -> json_blobs: тело хранится один раз на уникальное содержимое.
+# В старых строках body_json лежит прямо в json_bodies, а body_hash пустой
+BODY_SQL = "SELECT json_bodies.id, json_bodies.body_type, COALESCE(json_blobs.body_json, json_bodies.body_json) FROM json_bodies LEFT JOIN json_blobs ON json_blobs.hash = json_bodies.body_hash"
+# Сколько хешей проверять одним запросом IN (...)
+HASH_LOOKUP_CHUNK = 500
+
+# Поколение данных каждой базы в этом процессе; растет с каждым коммитом, меняющим выдачу.
+# Ключ - абсолютный путь: все Storage одного файла (загрузки, слежение, запросы API) видят общий счетчик
+_generations: Dict[str, int] = {}
+_generations_lock = threading.Lock()
+# Номер экземпляра Storage для версии данных (id() может повториться после сборки мусора)
+_store_numbers = itertools.count(1)
+
+
+def body_hash(body_json: str) -> bytes:
+    """Адрес тела в json_blobs: 128-битный blake2b от текста"""
+    return hashlib.blake2b(body_json.encode('utf-8'), digest_size=16).digest()
+
+
+def encode_cursor(ts_us: Optional[int], log_id: int) -> str:
+    """Непрозрачный курсор страницы: позиция (ts_us, id) последней отданной строки"""
+    return base64.urlsafe_b64encode(json.dumps([ts_us, log_id]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[int], int]:
+    try:
+        ts_us, log_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("invalid cursor")
+    if not isinstance(log_id, int) or not (ts_us is None or isinstance(ts_us, int)):
+        raise ValueError("invalid cursor")
+    return ts_us, log_id
+
+
+def format_ts_us(ts_us: Optional[int]) -> Optional[str]:
+    """ts_us -> ISO 8601 в UTC для ответов API"""
+    if ts_us is None:
+        return None
+    return datetime.fromtimestamp(ts_us / 1000000, tz=timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+def _raw_object(raw_json: str) -> Optional[Dict]:
+    try:
+        obj = json.loads(raw_json)
+    except ValueError:
+        return None
+    return obj if isinstance(obj, dict) else None
+
+
+def raw_message(raw_json: str) -> Optional[str]:
+    """Текст сообщения из сохраненной строки лога (для строк, записанных без разбора parse_lines)"""
+    obj = _raw_object(raw_json)
+    return extract_message(obj) if obj is not None else None
+
+
+def raw_http_status(raw_json: str) -> Optional[int]:
+    """Код ответа HTTP из сохраненной строки лога"""
+    obj = _raw_object(raw_json)
+    return extract_http_status(obj) if obj is not None else None
+
+
+def parse_ts_filter(value: str, name: str) -> int:
+    ts_us = normalize_ts(value)
+    if ts_us is None:
+        raise ValueError(f"invalid {name}: {value}")
+    return ts_us
+
+
 class Storage:
-    def __init__(self, path: str = 'logs.db'):
+    """Доступ к базе логов.
+
+    self.conn - единственный писатель (записи идут под _write_lock), чтение - через пул
+    read-only соединений (_reader), поэтому в WAL запросы не ждут друг друга и идущую загрузку.
+    Методы блокирующие: из async-обработчиков их нужно вызывать в пуле потоков.
+    """
+
+    def __init__(self, path: str = 'logs.db', batch_size: int = BATCH_SIZE, journal_mode: str = JOURNAL_MODE, synchronous: str = SYNCHRONOUS, compression: str = COMPRESSION, read_pool_size: int = READ_POOL_SIZE):
+        if journal_mode not in JOURNAL_MODES:
+            raise ValueError(f"Unknown journal_mode: {journal_mode}")
+        if synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError(f"Unknown synchronous mode: {synchronous}")
+        self.path = path
+        self._generation_key = f':memory:{id(self)}' if path == ':memory:' else os.path.abspath(path)
+        self.batch_size = batch_size
+        self.read_pool_size = read_pool_size
+        self._readers = queue.LifoQueue()
+        self._reader_count = 0
+        self._pool_lock = threading.Lock()
+        self._closed = False
+        self._number = next(_store_numbers)
+        self._write_lock = threading.RLock()
+        # Подписчики на записанные строки (live-рассылка), см. add_listener
+        self.listeners: List[Callable[[List[Dict]], None]] = []
+        self.codec = Codec(compression)
         self.conn = sqlite3.connect(path, check_same_thread=False)
         self.conn.execute('PRAGMA foreign_keys = ON')
+        self.conn.execute(f'PRAGMA journal_mode={journal_mode}')
+        self.conn.execute(f'PRAGMA synchronous={synchronous}')
+        self.conn.create_function('raw_text', 1, self.codec.decode, deterministic=True)
+        self.codec.dict_loader = self._fetch_dict
         self.conn.executescript(SCHEMA)
+        # Словари нужны миграциям, чтобы читать уже сжатые значения
+        self._load_dicts()
+        self._migrate()
+        self.conn.executescript(POST_MIGRATION_SCHEMA)
+        self._init_summaries()
+        self.templates = TemplateMiner()
+        self._init_templates()
+        self.fts_tokenize = self._init_fts(FTS_TOKENIZE)
 
 
-    def insert_log(self, raw_json: str, ts: str = None, level: str = None, tf_req_id: str = None, tf_resource: str = None, section: str = None, text_excerpt: str = None) -> int:
+    def _load_dicts(self):
         cur = self.conn.cursor()
-        cur.execute(
-            "INSERT INTO logs(raw_json, ts, level, tf_req_id, tf_resource, section, text_excerpt) VALUES (?,?,?,?,?,?,?)",
-            (raw_json, ts, level, tf_req_id, tf_resource, section, text_excerpt)
-        )
-        self.conn.commit()
-        return cur.lastrowid
+        cur.execute("SELECT id, dict FROM compression_dicts ORDER BY id")
+        rows = cur.fetchall()
+        for i, (dict_id, data) in enumerate(rows):
+            self.codec.add_dict(dict_id, data, use=i == len(rows) - 1)
+
+
+    def close(self):
+        """Закрывает соединения. Читатели, занятые запросами, закрываются, когда запрос их вернет"""
+        with self._pool_lock:
+            self._closed = True
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._write_lock:
+            self.conn.close()
+
+
+    def _open_reader(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(Path(self.path).absolute().as_uri() + '?mode=ro', uri=True, check_same_thread=False)
+        conn.create_function('raw_text', 1, self.codec.decode, deterministic=True)
+        return conn
+
+
+    @contextmanager
+    def _reader(self):
+        """Соединение для чтения из пула; пул растет до read_pool_size, дальше запросы ждут свободное"""
+        if self.path == ':memory:' or self.read_pool_size <= 0:
+            # У базы в памяти нет второго соединения - читаем через писателя
+            with self._write_lock:
+                yield self.conn
+            return
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            with self._pool_lock:
+                create = self._reader_count < self.read_pool_size
+                if create:
+                    self._reader_count += 1
+            if create:
+                try:
+                    conn = self._open_reader()
+                except Exception:
+                    with self._pool_lock:
+                        self._reader_count -= 1
+                    raise
+            else:
+                conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            with self._pool_lock:
+                if self._closed:
+                    self._reader_count -= 1
+                else:
+                    self._readers.put(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+
+
+    @property
+    def generation(self) -> Tuple:
+        """Версия данных: меняется после записи строк и mark_read (для кэша результатов запросов).
+
+        Счетчик видит коммиты этого процесса; PRAGMA data_version - коммиты других процессов
+        (python -m backend.follow --run). data_version у каждого соединения свое, поэтому в версию
+        входит и номер этого Storage: ответ, посчитанный через другое соединение, просто станет промахом.
+        """
+        counter = _generations.get(self._generation_key, 0)
+        with self._write_lock:
+            if self._closed:
+                return (counter, self._number, None)
+            return (counter, self._number, self.conn.execute("PRAGMA data_version").fetchone()[0])
+
+
+    def _bump_generation(self):
+        with _generations_lock:
+            _generations[self._generation_key] = _generations.get(self._generation_key, 0) + 1
+
+
+    def add_listener(self, listener: Callable[[List[Dict]], None]):
+        """listener(rows) вызывается после каждого коммита новых строк.
+
+        rows - строки в формате search (без read_flag) плюс raw_json для фильтрации.
+        Вызов идет в потоке записи, поэтому listener должен быть быстрым.
+        """
+        self.listeners.append(listener)
+
+
+    def _notify(self, ids: List[int], records: List[Dict]):
+        rows = [{'id': log_id, 'ts': r.get('ts'), 'ts_us': r.get('ts_us'), 'level': r.get('level'), 'tf_req_id': r.get('tf_req_id'),
+                 'tf_resource': r.get('tf_resource'), 'section': r.get('section'), 'text_excerpt': r.get('excerpt'),
+                 'read_flag': 0, 'template_id': r.get('template_id'), 'raw_json': r['raw_json']}
+                for log_id, r in zip(ids, records)]
+        for listener in self.listeners:
+            try:
+                listener(rows)
+            except Exception as e:
+                print(f"⚠️  Storage listener failed: {e}")
+
+
+    def _fetch_dict(self, dict_id: int) -> Optional[bytes]:
+        cur = self.conn.cursor()
+        cur.execute("SELECT dict FROM compression_dicts WHERE id = ?", (dict_id,))
+        row = cur.fetchone()
+        return row[0] if row else None
+
+
+    def _migrate(self):
+        """Доводит схему базы, созданной старой версией, до текущей"""
+        cur = self.conn.cursor()
+        cur.execute("PRAGMA table_info(logs)")
+        columns = {r[1] for r in cur.fetchall()}
+        if 'ts_us' not in columns:
+            cur.execute("ALTER TABLE logs ADD COLUMN ts_us INTEGER")
+            cur.execute("SELECT id, ts FROM logs WHERE ts IS NOT NULL")
+            updates = [(normalize_ts(ts), log_id) for log_id, ts in cur.fetchall()]
+            print(f"Normalizing timestamps for {len(updates)} existing logs...")
+            cur.executemany("UPDATE logs SET ts_us = ? WHERE id = ?", updates)
+            self.conn.commit()
+
+        cur.execute("PRAGMA table_info(json_bodies)")
+        columns = {r[1] for r in cur.fetchall()}
+        if 'body_hash' not in columns:
+            cur.execute("ALTER TABLE json_bodies ADD COLUMN body_hash BLOB")
+            cur.execute("SELECT id, body_json FROM json_bodies WHERE body_json IS NOT NULL")
+            rows = cur.fetchall()
+            print(f"Deduplicating {len(rows)} existing JSON bodies...")
+            # Значение переносится как есть (возможно сжатое), хеш - от распакованного текста
+            refs = [(body_hash(self.codec.decode(value)), value, body_id) for body_id, value in rows]
+            cur.executemany("INSERT OR IGNORE INTO json_blobs(hash, body_json) VALUES (?,?)", [(h, value) for h, value, _ in refs])
+            cur.executemany("UPDATE json_bodies SET body_hash = ?, body_json = NULL WHERE id = ?", [(h, body_id) for h, _, body_id in refs])
+            self.conn.commit()
+
+        cur.execute("PRAGMA table_info(logs)")
+        if 'template_id' not in {r[1] for r in cur.fetchall()}:
+            # Шаблоны старых строк заполняет _init_templates
+            cur.execute("ALTER TABLE logs ADD COLUMN template_id INTEGER")
+            self.conn.commit()
+
+
+    def _init_summaries(self):
+        """Создает таблицы сводок; в существующей базе заполняет их один раз по logs"""
+        cur = self.conn.cursor()
+        counts = ", ".join(SUMMARY_COUNTS)
+        count_exprs = ", ".join([f"SUM(level = '{lvl}')" for lvl in SUMMARY_LEVELS] +
+                                [f"SUM(level IS NULL OR level NOT IN ({', '.join(repr(lvl) for lvl in SUMMARY_LEVELS)}))"])
+        # Новую базу прогона одновременно открывают API и задача загрузки: проверка и создание - под блокировкой записи
+        cur.execute('BEGIN IMMEDIATE')
+        try:
+            self._create_summaries(cur, counts, count_exprs)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+
+    def _create_summaries(self, cur: sqlite3.Cursor, counts: str, count_exprs: str):
+        for table, key in SUMMARY_TABLES.items():
+            extras = SUMMARY_EXTRAS[table]
+            cur.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (table,))
+            if cur.fetchone():
+                # Сводка создана старой версией - не хватает дополнительных колонок
+                cur.execute(f"PRAGMA table_info({table})")
+                columns = {r[1] for r in cur.fetchall()}
+                missing = [(c, t) for c, t, _ in extras if c not in columns]
+                for column, column_type in missing:
+                    cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+                if missing:
+                    self._backfill_summary_extras(cur, table, key)
+                continue
+            extra_columns = "".join(f",\n    {c} {t}" for c, t, _ in extras)
+            cur.execute(SUMMARY_SCHEMA.format(table=table, key=key, extra_columns=extra_columns))
+            cur.execute(SUMMARY_BACKFILL.format(table=table, key=key, counts=counts, count_exprs=count_exprs))
+            if cur.rowcount > 0:
+                print(f"Built {table} for {cur.rowcount} existing groups")
+                if extras:
+                    self._backfill_summary_extras(cur, table, key)
+        for statement in TRACE_SCHEMA:
+            cur.execute(statement)
+
+
+    def _backfill_summary_extras(self, cur: sqlite3.Cursor, table: str, key: str):
+        """Заполняет дополнительные колонки сводки по уже записанным строкам (разбирая raw_json)"""
+        extras = SUMMARY_EXTRAS[table]
+        groups = {}
+        last_id = 0
+        while True:
+            cur.execute(f"SELECT id, raw_json, {key}, tf_resource FROM logs WHERE {key} IS NOT NULL AND id > ? ORDER BY id LIMIT ?", (last_id, self.batch_size))
+            rows = cur.fetchall()
+            if not rows:
+                break
+            for _, raw, group, tf_resource in rows:
+                self._merge_extras(groups.setdefault(group, [None] * len(extras)), 0, extras,
+                                   {'tf_resource': tf_resource, 'http_status': raw_http_status(self.codec.decode(raw))})
+            last_id = rows[-1][0]
+        if groups:
+            print(f"Filling {', '.join(c for c, _, _ in extras)} for {len(groups)} groups in {table}")
+            cur.executemany(f"UPDATE {table} SET {', '.join(f'{c} = ?' for c, _, _ in extras)} WHERE {key} = ?",
+                            [values + [group] for group, values in groups.items()])
+
+
+    @staticmethod
+    def _merge_extras(values: List, offset: int, extras: List[Tuple[str, str, str]], record: Dict):
+        """Значения дополнительных колонок группы (values[offset:]) с учетом строки record"""
+        for i, (column, _, keep) in enumerate(extras, offset):
+            value = record.get(column)
+            if value is not None and (keep == 'last' or values[i] is None):
+                values[i] = value
+
+
+    def _update_summaries(self, cur: sqlite3.Cursor, records: List[Dict]):
+        """Добавляет пачку записанных строк в сводки по секциям и tf_req_id (в текущей транзакции)"""
+        counts = ", ".join(SUMMARY_COUNTS)
+        count_params = ", ".join("?" * len(SUMMARY_COUNTS))
+        level_index = {lvl: i for i, lvl in enumerate(SUMMARY_LEVELS)}
+        for table, key in SUMMARY_TABLES.items():
+            extras = SUMMARY_EXTRAS[table]
+            count_updates = ",\n    ".join([f"{c} = {c} + excluded.{c}" for c in SUMMARY_COUNTS] +
+                                         [EXTRA_UPDATES[keep].format(c=c) for c, _, keep in extras])
+            groups = {}
+            for r in records:
+                group = r.get(key)
+                if group is None:
+                    continue
+                # [count, start_us, end_us, error, warning, info, debug, other, *extras]
+                g = groups.get(group)
+                if g is None:
+                    g = groups[group] = [0, None, None] + [0] * len(SUMMARY_COUNTS) + [None] * len(extras)
+                g[0] += 1
+                ts_us = r.get('ts_us')
+                if ts_us is not None:
+                    if g[1] is None or ts_us < g[1]:
+                        g[1] = ts_us
+                    if g[2] is None or ts_us > g[2]:
+                        g[2] = ts_us
+                g[3 + level_index.get(r.get('level'), len(SUMMARY_LEVELS))] += 1
+                if extras:
+                    self._merge_extras(g, 3 + len(SUMMARY_COUNTS), extras, r)
+            if groups:
+                columns = counts + "".join(f", {c}" for c, _, _ in extras)
+                params = count_params + ", ?" * len(extras)
+                cur.executemany(
+                    SUMMARY_UPSERT.format(table=table, key=key, counts=columns, count_params=params, count_updates=count_updates),
+                    [[group] + g for group, g in groups.items()]
+                )
+
+
+    def _init_templates(self):
+        """Загружает шаблоны строк; строкам без шаблона (база старой версии) назначает их один раз"""
+        self._load_templates()
+        cur = self.conn.cursor()
+        cur.execute("SELECT COUNT(*) FROM logs WHERE template_id IS NULL")
+        pending = cur.fetchone()[0]
+        if not pending:
+            return
+        print(f"Mining templates for {pending} existing logs...")
+        last_id = 0
+        while True:
+            cur.execute('BEGIN IMMEDIATE')
+            try:
+                self._sync_templates(cur)
+                cur.execute("SELECT id, raw_json, ts_us, text_excerpt FROM logs WHERE template_id IS NULL AND id > ? ORDER BY id LIMIT ?", (last_id, self.batch_size))
+                rows = cur.fetchall()
+                if rows:
+                    records = [{'ts_us': ts_us, 'message': raw_message(self.codec.decode(raw)), 'excerpt': excerpt} for _, raw, ts_us, excerpt in rows]
+                    self._assign_templates(cur, records)
+                    cur.executemany("UPDATE logs SET template_id = ? WHERE id = ?", [(r['template_id'], row[0]) for r, row in zip(records, rows)])
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                self._load_templates()
+                raise
+            if not rows:
+                break
+            last_id = rows[-1][0]
+        print(f"Built {len(self.templates.templates)} log templates")
+
+
+    def _load_templates(self):
+        self.templates.load(self.conn.execute("SELECT id, template FROM log_templates ORDER BY id").fetchall())
+        self._templates_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+
+    def _sync_templates(self, cur: sqlite3.Cursor):
+        """Перечитывает шаблоны, если базу менял другой процесс; вызывать после BEGIN IMMEDIATE.
+
+        В один файл прогона могут писать несколько Storage (API и задача загрузки): без этого
+        они выдали бы одинаковые новые id разным шаблонам и UPSERT склеил бы их.
+        data_version меняется только от чужих коммитов, свои записи перечитывания не вызывают.
+        """
+        cur.execute("PRAGMA data_version")
+        if cur.fetchone()[0] != self._templates_version:
+            self._load_templates()
+
+
+    def _assign_templates(self, cur: sqlite3.Cursor, records: List[Dict]):
+        """Назначает строкам пачки template_id и обновляет счетчики шаблонов (в текущей транзакции)"""
+        stats = {}
+        for r in records:
+            template_id = r['template_id'] = self.templates.add(r.get('message') or r.get('excerpt') or '')
+            # [count, first_us, last_us]
+            g = stats.get(template_id)
+            if g is None:
+                g = stats[template_id] = [0, None, None]
+            g[0] += 1
+            ts_us = r.get('ts_us')
+            if ts_us is not None:
+                if g[1] is None or ts_us < g[1]:
+                    g[1] = ts_us
+                if g[2] is None or ts_us > g[2]:
+                    g[2] = ts_us
+        cur.executemany(TEMPLATE_UPSERT, [[template_id, self.templates.template(template_id)] + g for template_id, g in stats.items()])
+
+
+    def _init_fts(self, tokenize: str) -> Optional[str]:
+        """Создает logs_fts и индексирует уже существующие строки; None - FTS5 недоступен"""
+        cur = self.conn.cursor()
+        # Под блокировкой записи: иначе второй процесс, открывающий новую базу, увидит "table already exists"
+        # и останется без индекса (поиск через LIKE)
+        cur.execute('BEGIN IMMEDIATE')
+        try:
+            tokenize = self._create_fts(cur, tokenize)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return tokenize
+
+
+    def _create_fts(self, cur: sqlite3.Cursor, tokenize: str) -> Optional[str]:
+        cur.execute("SELECT sql FROM sqlite_master WHERE name = 'logs_fts'")
+        row = cur.fetchone()
+        if row and 'text_excerpt' not in row[0]:
+            return 'trigram' if 'trigram' in row[0] else 'unicode61'
+        if row:
+            # Ранняя версия индекса с отдельной колонкой text_excerpt - перестраиваем
+            cur.execute("DROP TABLE logs_fts")
+
+        for candidate in [tokenize, 'unicode61']:
+            try:
+                cur.execute(FTS_SCHEMA.format(tokenize=candidate))
+                break
+            except sqlite3.OperationalError as e:
+                # нет FTS5 или trigram (SQLite < 3.34)
+                print(f"⚠️  FTS5 tokenizer '{candidate}' unavailable: {e}")
+        else:
+            return None
+
+        # База создана до появления индекса: переносим в него старые строки один раз
+        cur.execute("SELECT COUNT(*) FROM logs")
+        existing = cur.fetchone()[0]
+        if existing:
+            print(f"Building full-text index for {existing} existing logs...")
+            cur.execute("INSERT INTO logs_fts(rowid, raw_json) SELECT id, raw_text(raw_json) FROM logs")
+        return candidate
+
+
+    def _fts_match(self, q: str) -> Optional[str]:
+        """FTS-запрос для подстроки q или None, если искать нужно через LIKE"""
+        if not self.fts_tokenize:
+            return None
+        if self.fts_tokenize == 'trigram' and len(q) < FTS_MIN_QUERY:
+            return None
+        # Вся строка - одна фраза: спецсимволы синтаксиса MATCH не интерпретируются
+        return '"' + q.replace('"', '""') + '"'
+
+
+    def insert_log(self, raw_json: str, ts: str = None, level: str = None, tf_req_id: str = None, tf_resource: str = None, section: str = None, text_excerpt: str = None) -> int:
+        record = {'raw_json': raw_json, 'ts': ts, 'ts_us': normalize_ts(ts), 'level': level, 'tf_req_id': tf_req_id,
+                  'tf_resource': tf_resource, 'section': section, 'excerpt': text_excerpt, 'message': raw_message(raw_json),
+                  'http_status': raw_http_status(raw_json)}
+        with self._write_lock:
+            cur = self.conn.cursor()
+            cur.execute('BEGIN IMMEDIATE')
+            try:
+                self._sync_templates(cur)
+                self._assign_templates(cur, [record])
+                cur.execute(
+                    "INSERT INTO logs(raw_json, ts, ts_us, level, tf_req_id, tf_resource, section, text_excerpt, template_id) VALUES (?,?,?,?,?,?,?,?,?)",
+                    (self.codec.encode(raw_json), ts, record['ts_us'], level, tf_req_id, tf_resource, section, text_excerpt, record['template_id'])
+                )
+                log_id = cur.lastrowid
+                if self.fts_tokenize:
+                    cur.execute("INSERT INTO logs_fts(rowid, raw_json) VALUES (?,?)", (log_id, raw_json))
+                self._update_summaries(cur, [record])
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                self._load_templates()
+                raise
+            self._bump_generation()
+        if self.listeners:
+            self._notify([log_id], [record])
+        return log_id
 
 
     def insert_json_body(self, log_id: int, body_type: str, body_json: str):
+        h = body_hash(body_json)
+        with self._write_lock:
+            cur = self.conn.cursor()
+            cur.execute("INSERT OR IGNORE INTO json_blobs(hash, body_json) VALUES (?,?)", (h, self.codec.encode(body_json)))
+            cur.execute("INSERT INTO json_bodies(log_id, body_type, body_hash) VALUES (?,?,?)", (log_id, body_type, h))
+            self.conn.commit()
+            self._bump_generation()
+
+
+    def insert_batch(self, records: List[Dict], checkpoint: Optional[Dict] = None) -> List[int]:
+        """Запись пачки строк (формат parse_lines) вместе с их JSON-телами одной транзакцией.
+
+        checkpoint - позиция в отслеживаемом файле (см. save_follow_offset), сохраняется
+        в той же транзакции: после перезапуска строки не потеряются и не задублируются.
+        """
+        if not records and not checkpoint:
+            return []
+        with self._write_lock:
+            ids = self._write_batch(records, checkpoint)
+        if self.listeners and ids:
+            self._notify(ids, records)
+        return ids
+
+
+    def _write_batch(self, records: List[Dict], checkpoint: Optional[Dict]) -> List[int]:
         cur = self.conn.cursor()
-        cur.execute("INSERT INTO json_bodies(log_id, body_type, body_json) VALUES (?,?,?)", (log_id, body_type, body_json))
-        self.conn.commit()
+        # IMMEDIATE сразу берет блокировку записи: id ниже не займет никто другой
+        cur.execute('BEGIN IMMEDIATE')
+        try:
+            cur.execute("SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'logs'), 0)")
+            first_id = cur.fetchone()[0] + 1
+            ids = list(range(first_id, first_id + len(records)))
+            if self.codec.needs_dict:
+                self._train_dict(cur, [r['raw_json'] for r in records])
+            if records:
+                self._sync_templates(cur)
+                self._assign_templates(cur, records)
+            encode = self.codec.encode
+            cur.executemany(
+                "INSERT INTO logs(id, raw_json, ts, ts_us, level, tf_req_id, tf_resource, section, text_excerpt, template_id) VALUES (?,?,?,?,?,?,?,?,?,?)",
+                [(log_id, encode(r['raw_json']), r.get('ts'), r.get('ts_us'), r.get('level'), r.get('tf_req_id'), r.get('tf_resource'), r.get('section'), r.get('excerpt'), r['template_id'])
+                 for log_id, r in zip(ids, records)]
+            )
+            if self.fts_tokenize:
+                cur.executemany(
+                    "INSERT INTO logs_fts(rowid, raw_json) VALUES (?,?)",
+                    [(log_id, r['raw_json']) for log_id, r in zip(ids, records)]
+                )
+            refs = []
+            blobs = {}
+            for log_id, r in zip(ids, records):
+                for body_type, body_json in r.get('bodies_json', []):
+                    h = body_hash(body_json)
+                    refs.append((log_id, body_type, h))
+                    blobs[h] = body_json
+            if blobs:
+                self._insert_blobs(cur, blobs)
+                cur.executemany("INSERT INTO json_bodies(log_id, body_type, body_hash) VALUES (?,?,?)", refs)
+            self._update_summaries(cur, records)
+            if checkpoint:
+                self._save_follow_offset(cur, checkpoint)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            # Шаблоны в памяти могли измениться вместе с откаченной пачкой
+            self._load_templates()
+            raise
+        if records:
+            self._bump_generation()
+        return ids
+
+
+    def _insert_blobs(self, cur: sqlite3.Cursor, blobs: Dict[bytes, str]):
+        """Сохраняет тела, которых еще нет в json_blobs; уже известные не сжимаются повторно"""
+        hashes = list(blobs)
+        for i in range(0, len(hashes), HASH_LOOKUP_CHUNK):
+            chunk = hashes[i:i + HASH_LOOKUP_CHUNK]
+            cur.execute(f"SELECT hash FROM json_blobs WHERE hash IN ({','.join('?' * len(chunk))})", chunk)
+            for (h,) in cur.fetchall():
+                del blobs[h]
+        encode = self.codec.encode
+        cur.executemany("INSERT INTO json_blobs(hash, body_json) VALUES (?,?)", [(h, encode(text)) for h, text in blobs.items()])
+
+
+    def _train_dict(self, cur: sqlite3.Cursor, samples: List[str]):
+        """Обучает словарь zstd на строках пачки и сохраняет его в текущей транзакции"""
+        data = self.codec.train(samples)
+        if data is None:
+            return
+        cur.execute("INSERT INTO compression_dicts(dict) VALUES (?)", (data,))
+        self.codec.add_dict(cur.lastrowid, data, use=True)
+
+
+    def insert_records(self, records: Iterable[Dict]) -> int:
+        """Запись потока строк пачками по batch_size; возвращает число записанных строк"""
+        inserted = 0
+        batch = []
+        for r in records:
+            batch.append(r)
+            if len(batch) >= self.batch_size:
+                inserted += len(self.insert_batch(batch))
+                batch = []
+        if batch:
+            inserted += len(self.insert_batch(batch))
+        return inserted
+
+
+    def get_follow_offset(self, dev: int, ino: int) -> Optional[Dict]:
+        """Сохраненная позиция чтения файла с идентичностью (st_dev, st_ino)"""
+        with self._reader() as conn:
+            row = conn.execute("SELECT dev, ino, path, offset, head_len, head_hash FROM follow_offsets WHERE dev = ? AND ino = ?", (dev, ino)).fetchone()
+        if not row:
+            return None
+        return dict(zip(['dev', 'ino', 'path', 'offset', 'head_len', 'head_hash'], row))
+
+
+    def save_follow_offset(self, checkpoint: Dict):
+        with self._write_lock:
+            self._save_follow_offset(self.conn.cursor(), checkpoint)
+            self.conn.commit()
+
+
+    def _save_follow_offset(self, cur: sqlite3.Cursor, checkpoint: Dict):
+        cur.execute(
+            "INSERT OR REPLACE INTO follow_offsets(dev, ino, path, offset, head_len, head_hash, updated_at) VALUES (?,?,?,?,?,?,?)",
+            (checkpoint['dev'], checkpoint['ino'], checkpoint['path'], checkpoint['offset'], checkpoint['head_len'], checkpoint['head_hash'],
+             datetime.now(timezone.utc).isoformat())
+        )
 
 
     def get_json_bodies_for_log(self, log_id: int) -> List[Dict]:
-        cur = self.conn.cursor()
-        cur.execute("SELECT id, body_type, body_json FROM json_bodies WHERE log_id = ?", (log_id,))
-        rows = cur.fetchall()
-        return [{'id': r[0], 'body_type': r[1], 'body_json': r[2]} for r in rows]
+        with self._reader() as conn:
+            rows = conn.execute(BODY_SQL + " WHERE json_bodies.log_id = ? ORDER BY json_bodies.id", (log_id,)).fetchall()
+        return [{'id': r[0], 'body_type': r[1], 'body_json': self.codec.decode(r[2])} for r in rows]
+
+
+    def get_raw(self, log_id: int) -> Optional[str]:
+        """Исходная строка лога (raw_json), распакованная при необходимости"""
+        with self._reader() as conn:
+            row = conn.execute("SELECT raw_json FROM logs WHERE id = ?", (log_id,)).fetchone()
+        return self.codec.decode(row[0]) if row else None
+
+
+    def search(self, q: str = None, level: str = None, resource: str = None, tf_req_id: str = None, ts_from: str = None, ts_to: str = None, unread_only: bool = False, section: str = None, limit: int = 500, order: str = 'ts', include_raw: bool = False, template_id: int = None) -> List[Dict]:
+        """Поиск логов по фильтрам (первая страница search_page).
+
+        order='ts' - сначала новые, order='rank' - по релевантности q (если q ищется через FTS).
+        include_raw=True добавляет в строки raw_json (с распаковкой).
+        """
+        return self.search_page(q=q, level=level, resource=resource, tf_req_id=tf_req_id, ts_from=ts_from, ts_to=ts_to,
+                                unread_only=unread_only, section=section, limit=limit, order=order, include_raw=include_raw, template_id=template_id)['items']
+
+
+    def search_page(self, q: str = None, level: str = None, resource: str = None, tf_req_id: str = None, ts_from: str = None, ts_to: str = None, unread_only: bool = False, section: str = None, limit: int = 500, order: str = 'ts', cursor: str = None, include_raw: bool = False, template_id: int = None) -> Dict:
+        """Страница результатов поиска с курсором на следующую.
+
+        Страницы листаются по ключу (ts_us, id), а не через OFFSET: следующая страница
+        начинается поиском по индексу сразу после последней строки предыдущей, поэтому
+        глубокие страницы стоят столько же, сколько первая. Возвращает
+        {'items': [...], 'next_cursor': str | None}.
+        """
+        sql, where, params, ranked = self._search_query(q, level, resource, tf_req_id, ts_from, ts_to, unread_only, section, order, include_raw, template_id)
+        if ranked:
+            if cursor:
+                raise ValueError("cursor is not supported for order=rank")
+            with self._reader() as conn:
+                return {'items': self._fetch(conn, sql, where, params, "logs_fts.rank", limit), 'next_cursor': None}
+
+        after = decode_cursor(cursor) if cursor else None
+        # NULLS LAST: сначала строки с ts_us по убыванию (ts_us, id), затем строки без времени по убыванию id.
+        # Две части вместо одного OR, чтобы каждая шла поиском по idx_logs_ts_us
+        items = []
+        with self._reader() as conn:
+            if after is None or after[0] is not None:
+                keyset = ["(ts_us, logs.id) < (?, ?)"] if after else ["ts_us IS NOT NULL"]
+                items = self._fetch(conn, sql, where + keyset, params + (list(after) if after else []), "ts_us DESC, logs.id DESC", limit + 1)
+            if len(items) <= limit:
+                keyset = ["ts_us IS NULL"] + (["logs.id < ?"] if after and after[0] is None else [])
+                items += self._fetch(conn, sql, where + keyset, params + ([after[1]] if after and after[0] is None else []), "logs.id DESC", limit + 1 - len(items))
+
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = encode_cursor(items[-1]['ts_us'], items[-1]['id'])
+        return {'items': items, 'next_cursor': next_cursor}
 
 
-    def search(self, q: str = None, level: str = None, resource: str = None, tf_req_id: str = None, ts_from: str = None, ts_to: str = None, unread_only: bool = False, section: str = None, limit: int = 500) -> List[Dict]:
+    def iter_search(self, q: str = None, level: str = None, resource: str = None, tf_req_id: str = None, ts_from: str = None, ts_to: str = None, unread_only: bool = False, section: str = None, include_raw: bool = False, page_size: int = 5000, template_id: int = None) -> Iterator[List[Dict]]:
+        """Все результаты поиска (порядок order='ts') страницами по page_size, без общего лимита.
+
+        Каждая страница - отдельный короткий запрос по ключу (ts_us, id), поэтому память
+        не растет с размером выборки и соединение не занято между страницами.
+        """
+        cursor = None
+        while True:
+            page = self.search_page(q=q, level=level, resource=resource, tf_req_id=tf_req_id, ts_from=ts_from, ts_to=ts_to, unread_only=unread_only,
+                                    section=section, limit=page_size, cursor=cursor, include_raw=include_raw, template_id=template_id)
+            if page['items']:
+                yield page['items']
+            cursor = page['next_cursor']
+            if not cursor:
+                return
+
+
+    def _search_query(self, q, level, resource, tf_req_id, ts_from, ts_to, unread_only, section, order, include_raw=False, template_id=None) -> Tuple[str, List[str], List, bool]:
+        """SELECT ... FROM, список условий WHERE и их параметры для search_page"""
         where = []
         params = []
-        sql = "SELECT id, raw_json, ts, level, tf_req_id, tf_resource, section, text_excerpt, read_flag FROM logs"
-        
-        if q:
-            where.append("(raw_json LIKE ? OR text_excerpt LIKE ?)")
+        sql = f"SELECT {LOG_COLUMNS}{', logs.raw_json' if include_raw else ''} FROM logs"
+        match = self._fts_match(q) if q else None
+        ranked = order == 'rank' and match is not None
+
+        if ranked:
+            sql += " JOIN logs_fts ON logs_fts.rowid = logs.id"
+            where.append("logs_fts MATCH ?"); params.append(match)
+        elif match:
+            where.append("logs.id IN (SELECT rowid FROM logs_fts WHERE logs_fts MATCH ?)"); params.append(match)
+        elif q:
+            where.append(f"({RAW_TEXT_SQL} LIKE ? OR logs.text_excerpt LIKE ?)")
             params += [f"%{q}%", f"%{q}%"]
         if level:
             where.append("level = ?"); params.append(level)
@@ -73,44 +908,120 @@ class Storage:
         if tf_req_id:
             where.append("tf_req_id = ?"); params.append(tf_req_id)
         if ts_from:
-            where.append("ts >= ?"); params.append(ts_from)
+            where.append("ts_us >= ?"); params.append(parse_ts_filter(ts_from, 'ts_from'))
         if ts_to:
-            where.append("ts <= ?"); params.append(ts_to)
+            where.append("ts_us <= ?"); params.append(parse_ts_filter(ts_to, 'ts_to'))
         if section:  # Добавляем фильтр по секции
             where.append("section = ?"); params.append(section)
+        if template_id is not None:
+            where.append("template_id = ?"); params.append(template_id)
         if unread_only:
             where.append("read_flag = 0")
-        
+        return sql, where, params, ranked
+
+
+    def _fetch(self, conn: sqlite3.Connection, sql: str, where: List[str], params: List, order_by: str, limit: int) -> List[Dict]:
         if where:
             sql += " WHERE " + " AND ".join(where)
-
-        sql += " ORDER BY ts DESC NULLS LAST LIMIT ?"
-        params.append(limit)
-        cur = self.conn.cursor()
-        cur.execute(sql, params)
+        sql += f" ORDER BY {order_by} LIMIT ?"
+        cur = conn.cursor()
+        cur.execute(sql, params + [limit])
         rows = cur.fetchall()
         cols = [c[0] for c in cur.description]
-        return [dict(zip(cols, r)) for r in rows]
+        items = [dict(zip(cols, r)) for r in rows]
+        if 'raw_json' in cols:
+            for item in items:
+                item['raw_json'] = self.codec.decode(item['raw_json'])
+        return items
 
 
     def get_sections_summary(self) -> List[Dict]:
         """Получить сводку по секциям"""
-        cur = self.conn.cursor()
-        cur.execute("""
-            SELECT section, COUNT(*) as count, MIN(ts) as start_time, MAX(ts) as end_time
-            FROM logs 
-            WHERE section IS NOT NULL 
-            GROUP BY section
-            ORDER BY start_time
-        """)
-        rows = cur.fetchall()
-        return [{'section': r[0], 'count': r[1], 'start_time': r[2], 'end_time': r[3]} for r in rows]
+        with self._reader() as conn:
+            rows = conn.execute(f"SELECT section, count, start_us, end_us, {', '.join(SUMMARY_COUNTS)} FROM section_summary ORDER BY start_us").fetchall()
+        return [self._summary_row('section', r) for r in rows]
+
+
+    def get_requests_summary(self, tf_req_id: str = None, limit: int = 500) -> List[Dict]:
+        """Сводка по tf_req_id (сначала последние по времени начала); tf_req_id - только одна группа"""
+        sql = f"SELECT tf_req_id, count, start_us, end_us, {', '.join(SUMMARY_COUNTS)} FROM request_summary"
+        with self._reader() as conn:
+            if tf_req_id:
+                rows = conn.execute(sql + " WHERE tf_req_id = ?", (tf_req_id,)).fetchall()
+            else:
+                rows = conn.execute(sql + " ORDER BY start_us DESC LIMIT ?", (limit,)).fetchall()
+        return [self._summary_row('tf_req_id', r) for r in rows]
+
+
+    def get_traces(self, failed: bool = False, min_duration_ms: float = None, max_duration_ms: float = None, resource: str = None, http_status: int = None, order: str = 'duration', limit: int = 100) -> List[Dict]:
+        """Запросы по tf_req_id из индекса (request_summary): длительность, число строк, старший уровень, ресурс, код HTTP.
+
+        failed=True - только запросы с ошибками (строки error или код HTTP >= 400);
+        order: duration (сначала самые долгие), start, count, errors.
+        """
+        if order not in TRACE_ORDERS:
+            raise ValueError(f"Unknown order: {order}")
+        where = []
+        params = []
+        if failed:
+            where.append(TRACE_FAILED_SQL)
+        if min_duration_ms is not None:
+            where.append(f"{DURATION_SQL} >= ?"); params.append(int(min_duration_ms * 1000))
+        if max_duration_ms is not None:
+            where.append(f"{DURATION_SQL} <= ?"); params.append(int(max_duration_ms * 1000))
+        if resource:
+            where.append("tf_resource LIKE ?"); params.append(f"%{resource}%")
+        if http_status is not None:
+            where.append("http_status = ?"); params.append(http_status)
+        sql = f"SELECT tf_req_id, count, start_us, end_us, {', '.join(SUMMARY_COUNTS)}, tf_resource, http_status FROM request_summary"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        with self._reader() as conn:
+            rows = conn.execute(sql + f" ORDER BY {TRACE_ORDERS[order]} LIMIT ?", params + [limit]).fetchall()
+        return [self._trace_row(r) for r in rows]
+
+
+    @classmethod
+    def _trace_row(cls, r: Tuple) -> Dict:
+        row = cls._summary_row('tf_req_id', r[:4 + len(SUMMARY_COUNTS)])
+        levels = row['levels']
+        tf_resource, http_status = r[4 + len(SUMMARY_COUNTS):]
+        duration_us = r[3] - r[2] if r[2] is not None and r[3] is not None else None
+        row.update({
+            'duration_ms': duration_us / 1000 if duration_us is not None else None,
+            'max_level': next((lvl for lvl in SUMMARY_LEVELS + ['other'] if levels[lvl]), None),
+            'tf_resource': tf_resource,
+            'http_status': http_status,
+            'failed': levels['error'] > 0 or (http_status or 0) >= 400,
+        })
+        return row
+
+
+    def get_patterns(self, q: str = None, order: str = 'count', limit: int = 500) -> List[Dict]:
+        """Шаблоны строк со счетчиками и временем первой/последней строки; q - подстрока шаблона"""
+        if order not in PATTERN_ORDERS:
+            raise ValueError(f"Unknown order: {order}")
+        sql = "SELECT id, template, count, first_us, last_us FROM log_templates"
+        params = []
+        if q:
+            sql += " WHERE template LIKE ?"; params.append(f"%{q}%")
+        with self._reader() as conn:
+            rows = conn.execute(sql + f" ORDER BY {PATTERN_ORDERS[order]} LIMIT ?", params + [limit]).fetchall()
+        return [{'template_id': r[0], 'template': r[1], 'count': r[2], 'first_seen': format_ts_us(r[3]), 'last_seen': format_ts_us(r[4]),
+                 'first_us': r[3], 'last_us': r[4]} for r in rows]
+
+
+    @staticmethod
+    def _summary_row(key: str, r: Tuple) -> Dict:
+        return {key: r[0], 'count': r[1], 'start_time': format_ts_us(r[2]), 'end_time': format_ts_us(r[3]),
+                'start_us': r[2], 'end_us': r[3], 'levels': dict(zip(SUMMARY_LEVELS + ['other'], r[4:]))}
 
 
     def mark_read(self, ids: List[int]):
         if not ids:
             return
-        cur = self.conn.cursor()
         placeholders = ",".join(["?"] * len(ids))
-        cur.execute(f"UPDATE logs SET read_flag=1 WHERE id IN ({placeholders})", ids)
-        self.conn.commit()
\ No newline at end of file
+        with self._write_lock:
+            self.conn.execute(f"UPDATE logs SET read_flag=1 WHERE id IN ({placeholders})", ids)
+            self.conn.commit()
+            self._bump_generation()
\ No newline at end of file
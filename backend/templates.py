@@ -0,0 +1,112 @@
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+# Доля совпадающих слов, при которой строка относится к шаблону (как sim_th в Drain)
+TEMPLATE_SIMILARITY = float(os.getenv('TEMPLATE_SIMILARITY', 0.4))
+# Глубина дерева: длина строки + столько первых слов выбирают группу кандидатов
+TEMPLATE_PREFIX_TOKENS = int(os.getenv('TEMPLATE_PREFIX_TOKENS', 2))
+# Сколько разных слов может быть у узла дерева; остальные идут в общую ветку <*>
+TEMPLATE_MAX_CHILDREN = int(os.getenv('TEMPLATE_MAX_CHILDREN', 100))
+# Длиннее строки шаблон не строится: хвост длинных сообщений почти всегда уникален
+TEMPLATE_MAX_CHARS = 400
+
+WILDCARD = '<*>'
+
+# Заведомо переменные части заменяются до разбиения на слова, порядок важен.
+# Второй элемент - символ, без которого выражение не совпадет: по нему дорогой поиск пропускается
+MASKS = [
+    (re.compile(r'\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:?\d{2})?'), ':', '<TS>'),
+    (re.compile(r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b'), '-', '<UUID>'),
+    (re.compile(r'\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b'), '.', '<IP>'),
+    (re.compile(r'\b(?:0x[0-9a-fA-F]+|(?=[0-9a-fA-F]*\d)[0-9a-fA-F]{12,})\b'), '', '<HEX>'),
+    (re.compile(r'(?<![\w.])[-+]?\d+(?:\.\d+)?(?:ms|s|m|h)?(?![\w.])'), '', '<NUM>'),
+]
+# Все выражения выше требуют цифру
+_HAS_DIGIT = re.compile(r'\d').search
+
+
+def mask_message(message: str) -> List[str]:
+    """Слова сообщения с замененными числами, временем, адресами и идентификаторами"""
+    message = message[:TEMPLATE_MAX_CHARS]
+    if _HAS_DIGIT(message):
+        for rx, hint, token in MASKS:
+            if hint in message:
+                message = rx.sub(token, message)
+    return message.split()
+
+
+class TemplateMiner:
+    """Потоковое выделение шаблонов строк по алгоритму Drain.
+
+    Строка разбивается на слова; дерево по длине строки и первым словам выбирает небольшую группу
+    шаблонов, среди них берется самый похожий. Если похожих нет - заводится новый шаблон,
+    иначе слова, которыми строка отличается от шаблона, заменяются на <*>.
+    Состояние - только шаблоны, поэтому миллионы строк укладываются в сотни записей.
+    """
+
+    def __init__(self, similarity: float = TEMPLATE_SIMILARITY, prefix_tokens: int = TEMPLATE_PREFIX_TOKENS, max_children: int = TEMPLATE_MAX_CHILDREN):
+        self.similarity = similarity
+        self.prefix_tokens = prefix_tokens
+        self.max_children = max_children
+        self.templates: Dict[int, List[str]] = {}
+        self.root: Dict = {}
+        self.next_id = 1
+
+    def load(self, rows: Iterable[Tuple[int, str]]):
+        """Восстанавливает дерево по сохраненным шаблонам (id, template)"""
+        self.templates.clear()
+        self.root = {}
+        self.next_id = 1
+        for template_id, template in rows:
+            tokens = template.split()
+            self.templates[template_id] = tokens
+            self._leaf(tokens).append(template_id)
+            self.next_id = max(self.next_id, template_id + 1)
+
+    def _leaf(self, tokens: List[str]) -> List[int]:
+        node = self.root.setdefault(len(tokens), {})
+        for token in tokens[:self.prefix_tokens]:
+            # Слова с цифрами - почти наверняка параметры, по ним дерево не ветвится
+            if token != WILDCARD and any(c.isdigit() for c in token):
+                token = WILDCARD
+            if token not in node and len(node) >= self.max_children:
+                token = WILDCARD
+            node = node.setdefault(token, {})
+        return node.setdefault(None, [])
+
+    def _similarity(self, template: List[str], tokens: List[str]) -> Tuple[float, int]:
+        same = params = 0
+        for a, b in zip(template, tokens):
+            if a == WILDCARD:
+                params += 1
+            elif a == b:
+                same += 1
+        return same / len(tokens), params
+
+    def add(self, message: str) -> int:
+        """id шаблона строки; шаблон при этом может обобщиться"""
+        tokens = mask_message(message or '')
+        leaf = self._leaf(tokens)
+        best, best_sim, best_params = None, -1.0, -1
+        for template_id in leaf:
+            if not tokens:
+                best, best_sim = template_id, 1.0
+                break
+            sim, params = self._similarity(self.templates[template_id], tokens)
+            if sim > best_sim or (sim == best_sim and params > best_params):
+                best, best_sim, best_params = template_id, sim, params
+        if best is not None and (not tokens or best_sim >= self.similarity):
+            template = self.templates[best]
+            self.templates[best] = [a if a == b else WILDCARD for a, b in zip(template, tokens)]
+            return best
+        template_id = self.next_id
+        self.next_id += 1
+        self.templates[template_id] = tokens
+        leaf.append(template_id)
+        return template_id
+
+    def template(self, template_id: int) -> Optional[str]:
+        tokens = self.templates.get(template_id)
+        return None if tokens is None else ' '.join(tokens)
@@ -1,3 +1,12 @@
+// Время лога для шкалы: нормализованный ts_us (микросекунды эпохи); строка ts - только для подписи
+function hasTime(item) {
+    return item.ts_us !== null && item.ts_us !== undefined;
+}
+
+function logTime(item) {
+    return new Date(item.ts_us / 1000);
+}
+
 function renderGantt(data) {
     const container = document.getElementById('gantt-container');
     container.innerHTML = '<h3>Timeline Visualization</h3><div id="gantt-chart"></div>';
@@ -14,10 +23,10 @@ function renderGantt(data) {
     
     let row = 0;
     groups.forEach((items, reqId) => {
-        if (!items[0].ts) return;
+        if (!hasTime(items[0])) return;
         
         // Найти начало и конец для этой группы
-        const times = items.filter(i => i.ts).map(i => new Date(i.ts));
+        const times = items.filter(hasTime).map(logTime);
         if (times.length === 0) return;
         
         const minTime = Math.min(...times);
@@ -44,16 +53,16 @@ function renderGantt(data) {
         timelineDiv.style.cssText = `flex-grow: ${ganttScale}; position:relative; height:100%; flex-shrink: 1; width: 110%`;
         
         // Рассчитываем временные метки
-        const allTimes = data.filter(i => i.ts).map(i => new Date(i.ts));
+        const allTimes = data.filter(hasTime).map(logTime);
         const globalMin = Math.min(...allTimes);
         const globalMax = Math.max(...allTimes);
         const totalDuration = globalMax - globalMin;
         
         // Добавляем элементы для каждого лога в группе
         items.forEach(item => {
-            if (!item.ts) return;
+            if (!hasTime(item)) return;
             
-            const startTime = new Date(item.ts);
+            const startTime = logTime(item);
             const position = ((startTime - globalMin) / totalDuration) * 100;
             const width = 3; // ширина бара в %
             
@@ -161,7 +170,7 @@ function showLogDetailsModal(log) {
 
 // Функция загрузки JSON тел для лога
 function loadJsonBodiesForLog(logId, containerId) {
-    fetch(`/json_bodies/${logId}`)
+    fetch(withRun(`/json_bodies/${logId}`))
         .then(response => response.json())
         .then(bodies => {
             const container = document.getElementById(containerId);
@@ -200,7 +209,7 @@ function toggleReadFromGantt(id, button) {
     fetch('/mark_read', { 
         method: 'POST', 
         headers: {'Content-Type': 'application/json'}, 
-        body: JSON.stringify({ids:[id]}) 
+        body: JSON.stringify({ids:[id], run: runId()}) 
     })
     .then(response => response.json())
     .then(result => {
@@ -314,9 +323,9 @@ function renderGantt(data) {
 
     let row = 0;
     groups.forEach((items, reqId) => {
-        if (!items[0].ts) return;
+        if (!hasTime(items[0])) return;
 
-        const times = items.filter(i => i.ts).map(i => new Date(i.ts));
+        const times = items.filter(hasTime).map(logTime);
         if (times.length === 0) return;
 
         const groupDiv = document.createElement('div');
@@ -341,15 +350,15 @@ function renderGantt(data) {
             flex-shrink: 0; /* Не сжимать, если место заканчивается */
         `;
 
-        const allTimes = data.filter(i => i.ts).map(i => new Date(i.ts));
+        const allTimes = data.filter(hasTime).map(logTime);
         const globalMin = Math.min(...allTimes);
         const globalMax = Math.max(...allTimes);
         const totalDuration = globalMax - globalMin;
 
         items.forEach(item => {
-            if (!item.ts) return;
+            if (!hasTime(item)) return;
 
-            const startTime = new Date(item.ts);
+            const startTime = logTime(item);
             const position = ((startTime - globalMin) / totalDuration) * 100;
             const baseWidth = 3; 
             const scaledWidth = baseWidth * ganttScale; 
@@ -4,6 +4,7 @@ const unreadBtn = document.getElementById('btnUnread');
 const pluginBtn = document.getElementById('btnPlugins');
 const sectionsBtn = document.getElementById('btnSections');
 const sectionSelect = document.getElementById('section');
+const runSelect = document.getElementById('run');
 
 // Фильтры
 const qInput = document.getElementById('q');
@@ -17,10 +18,13 @@ let unreadOnly = true;
 let currentPluginFilter = null;
 let searchTimeout = null;
 let currentResults = [];
+let nextCursor = null; // курсор следующей страницы /search
+let liveSource = null; // подписка /live на новые строки под текущие фильтры
+const MAX_RESULTS = 5000; // столько строк держит выдача с учетом /live; более старые дочитываются через Load more
 let selectedAIModel = 'openai'; // Глобальная переменная для выбранной модели
 
 // Автоматический поиск
-[qInput, levelSelect, tf_req_idInput, tf_resourceInput, ts_fromInput, ts_toInput, sectionSelect]
+[qInput, levelSelect, tf_req_idInput, tf_resourceInput, ts_fromInput, ts_toInput, sectionSelect, runSelect]
     .forEach(element => {
         if (element.type === 'select-one' || element.type === 'select-multiple') {
             element.addEventListener('change', debouncedSearch);
@@ -41,13 +45,32 @@ uploadBtn.onclick = async () => {
         showNotification('Uploading logs...', 'info');
         const r = await fetch('/upload', { method: 'POST', body: fd });
         const j = await r.json();
-        showNotification(`Successfully inserted: ${j.inserted} logs`, 'success');
-        search();
+        if (!r.ok) throw new Error(j.detail || r.statusText);
+        waitForJob(j.job_id);
     } catch (error) {
         showNotification('Upload failed: ' + error.message, 'danger');
     }
 };
 
+// Загрузка идет в фоне: опрашиваем /jobs/{id}, пока задача не завершится
+async function waitForJob(jobId) {
+    const r = await fetch('/jobs/' + jobId);
+    const job = await r.json();
+    if (!r.ok) {
+        showNotification('Upload failed: ' + (job.detail || r.statusText), 'danger');
+        return;
+    }
+    if (job.status === 'done') {
+        showNotification(`Successfully inserted: ${job.lines} logs (${job.lines_per_sec || 0} lines/s)`, 'success');
+        loadRuns(job.run_id).then(search);
+    } else if (job.status === 'failed') {
+        showNotification(`Upload failed after ${job.lines} logs: ${job.errors.join('; ')}`, 'danger');
+        loadRuns(job.run_id).then(search);
+    } else {
+        setTimeout(() => waitForJob(jobId), 1000);
+    }
+}
+
 ganttBtn.onclick = () => showTimeline();
 pluginBtn.onclick = () => showPluginSelector();
 sectionsBtn.onclick = () => showSections();
@@ -74,8 +97,33 @@ function debouncedSearch() {
     searchTimeout = setTimeout(search, 500);
 }
 
-async function search() {
+// Список прогонов; без выбора сервер берет последний
+async function loadRuns(selectId) {
+    try {
+        const r = await fetch('/runs');
+        const runs = await r.json();
+        const current = selectId !== undefined ? String(selectId) : runSelect.value;
+        runSelect.innerHTML = runs.map(run =>
+            `<option value="${run.id}">#${run.id} ${escapeHtml(run.name || '')} (${run.lines})</option>`).join('');
+        if (runs.some(run => String(run.id) === current)) runSelect.value = current;
+    } catch (error) {
+        showNotification('Loading runs failed: ' + error.message, 'danger');
+    }
+}
+
+// id строк и JSON-тел уникальны только внутри прогона
+function withRun(url) {
+    if (!runSelect.value) return url;
+    return url + (url.includes('?') ? '&' : '?') + 'run=' + runSelect.value;
+}
+
+function runId() {
+    return runSelect.value ? Number(runSelect.value) : null;
+}
+
+function searchParams() {
     const params = new URLSearchParams();
+    if (runSelect.value) params.set('run', runSelect.value);
     if (qInput.value) params.set('q', qInput.value);
     if (levelSelect.value) params.set('level', levelSelect.value);
     if (tf_req_idInput.value) params.set('tf_req_id', tf_req_idInput.value);
@@ -84,19 +132,66 @@ async function search() {
     if (ts_toInput.value) params.set('ts_to', ts_toInput.value);
     if (sectionSelect.value) params.set('section', sectionSelect.value);
     if (unreadOnly) params.set('unread', '1');
-    
+    return params;
+}
+
+async function search() {
     try {
-        const r = await fetch('/search?' + params.toString());
-        const arr = await r.json();
+        const r = await fetch('/search?' + searchParams().toString());
+        const page = await r.json();
         document.getElementById('gantt-container').style.display = 'none';
-        currentResults = arr;
-        render(arr);
-        updateSummary(arr);
+        nextCursor = page.next_cursor;
+        currentResults = page.items;
+        render(page.items);
+        updateSummary(page.items);
+        subscribeLive();
     } catch (error) {
         showNotification('Search failed: ' + error.message, 'danger');
     }
 }
 
+// Новые строки приходят с сервера сами, без повторных запросов /search
+function subscribeLive() {
+    if (liveSource) liveSource.close();
+    const params = searchParams();
+    params.delete('unread'); // новые строки всегда непрочитанные
+    liveSource = new EventSource('/live?' + params.toString());
+    liveSource.addEventListener('logs', e => {
+        if (document.getElementById('gantt-container').style.display === 'block') return;
+        const rows = JSON.parse(e.data).reverse(); // сначала новые, как в /search
+        currentResults = rows.concat(currentResults);
+        if (currentResults.length > MAX_RESULTS) {
+            // Отброшенные старые строки не теряются: следующая страница начнется сразу после последней оставшейся
+            currentResults = currentResults.slice(0, MAX_RESULTS);
+            nextCursor = cursorAfter(currentResults[currentResults.length - 1]);
+        }
+        render(currentResults);
+    });
+    // Не успели получить часть строк - перечитываем выдачу целиком
+    liveSource.addEventListener('overflow', () => search());
+}
+
+// Курсор /search на строки после row (тот же формат, что отдает сервер: base64url от [ts_us, id])
+function cursorAfter(row) {
+    return btoa(JSON.stringify([row.ts_us ?? null, row.id])).replace(/\+/g, '-').replace(/\//g, '_');
+}
+
+// Следующая страница с теми же фильтрами
+async function loadMore() {
+    if (!nextCursor) return;
+    try {
+        const params = searchParams();
+        params.set('cursor', nextCursor);
+        const r = await fetch('/search?' + params.toString());
+        const page = await r.json();
+        nextCursor = page.next_cursor;
+        currentResults = currentResults.concat(page.items);
+        render(currentResults);
+    } catch (error) {
+        showNotification('Load more failed: ' + error.message, 'danger');
+    }
+}
+
 function updateSummary(arr) {
     const groups = groupBy(arr, it => it.tf_req_id || '__no__');
     const summary = document.getElementById('summary');
@@ -110,8 +205,9 @@ function updateSummary(arr) {
 }
 
 function showTimeline() {
-    fetch('/search?limit=1000')
+    fetch(withRun('/search?limit=1000'))
         .then(r => r.json())
+        .then(page => page.items)
         .then(arr => {
             document.getElementById('results').innerHTML = '';
             document.getElementById('gantt-container').style.display = 'block';
@@ -228,15 +324,18 @@ async function applyPluginFilter() {
             headers: {'Content-Type': 'application/json'},
             body: JSON.stringify({
                 filter_type: currentPluginFilter,
-                search_query: qInput.value
+                search_query: qInput.value,
+                run: runId()
             })
         });
         
         const result = await r.json();
         showNotification(result.summary, 'info');
         
-        const searchR = await fetch('/search?limit=1000');
-        const arr = await searchR.json();
+        const searchR = await fetch(withRun('/search?limit=1000'));
+        const page = await searchR.json();
+        const arr = page.items;
+        nextCursor = page.next_cursor;
         document.getElementById('gantt-container').style.display = 'none';
         currentResults = arr;
         render(arr);
@@ -249,7 +348,7 @@ async function applyPluginFilter() {
 async function showSections() {
     try {
         showNotification('Loading sections...', 'info');
-        const r = await fetch('/sections');
+        const r = await fetch(withRun('/sections'));
         const sections = await r.json();
         
         let html = '<div class="card"><div class="card-header"><h5 class="mb-0">Sections Summary</h5></div><div class="card-body">';
@@ -359,6 +458,7 @@ async function analyzeWithAI() {
         if (q) params.set('q', q);
         params.set('limit', '100');
         params.set('model', selectedAIModel); // Передаем выбранную модель
+        if (runSelect.value) params.set('run', runSelect.value);
         
         const r = await fetch(`/ai/analyze?${params.toString()}`);
         const analysis = await r.json();
@@ -613,6 +713,17 @@ function render(arr) {
         gdiv.appendChild(body);
         results.appendChild(gdiv);
     });
+
+    if (nextCursor) {
+        const more = document.createElement('div');
+        more.className = 'text-center mb-3';
+        more.innerHTML = `
+            <button class="btn btn-outline-primary" onclick="loadMore()" aria-label="Load more logs">
+                <i class="fas fa-angle-double-down me-1" aria-hidden="true"></i>Load More
+            </button>
+        `;
+        results.appendChild(more);
+    }
 }
 
 function getLogLevelClass(level) {
@@ -643,13 +754,14 @@ function escapeHtml(s) {
 async function expandJson(id) {
     try {
         showNotification('Loading JSON...', 'info');
-        const r = await fetch('/json_bodies/' + id);
+        const r = await fetch(withRun('/json_bodies/' + id));
         const arr = await r.json();
         
         if (!arr.length) {
-            // Ищем в текущих результатах
-            const currentLog = currentResults.find(log => log.id === id);
-            if (currentLog) {
+            // Тел нет - показываем исходную строку лога
+            const rawR = await fetch(withRun('/logs/' + id + '/raw'));
+            if (rawR.ok) {
+                const currentLog = await rawR.json();
                 const modal = createModal('JSON Content', 
                     `<pre class="bg-light p-3 rounded" style="max-height: 400px; overflow-y: auto;">${JSON.stringify(JSON.parse(currentLog.raw_json), null, 2)}</pre>`
                 );
@@ -713,7 +825,7 @@ async function toggleRead(id) {
         await fetch('/mark_read', { 
             method: 'POST', 
             headers: {'Content-Type': 'application/json'}, 
-            body: JSON.stringify({ids:[id]}) 
+            body: JSON.stringify({ids:[id], run: runId()}) 
         });
         
         const action = newReadStatus === 1 ? 'marked as read' : 'marked as unread';
@@ -728,7 +840,7 @@ async function toggleRead(id) {
 document.addEventListener('DOMContentLoaded', () => {
     window.groupStates = {};
     updateUnreadButton();
-    search();
+    loadRuns().then(search);
 
     loadAImodels();
 });
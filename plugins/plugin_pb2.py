@@ -24,23 +24,39 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0cplugin.proto\x12\x06plugin\"\xac\x01\n\nLogRequest\x12\x1e\n\x04logs\x18\x01 \x03(\x0b\x32\x10.plugin.LogEntry\x12\x13\n\x0b\x66ilter_type\x18\x02 \x01(\t\x12\x36\n\nparameters\x18\x03 \x03(\x0b\x32\".plugin.LogRequest.ParametersEntry\x1a\x31\n\x0fParametersEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\"\x92\x01\n\x08LogEntry\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x10\n\x08raw_json\x18\x02 \x01(\t\x12\n\n\x02ts\x18\x03 \x01(\t\x12\r\n\x05level\x18\x04 \x01(\t\x12\x11\n\ttf_req_id\x18\x05 \x01(\t\x12\x13\n\x0btf_resource\x18\x06 \x01(\t\x12\x0f\n\x07section\x18\x07 \x01(\t\x12\x14\n\x0ctext_excerpt\x18\x08 \x01(\t\"G\n\x0bLogResponse\x12\'\n\rfiltered_logs\x18\x01 \x03(\x0b\x32\x10.plugin.LogEntry\x12\x0f\n\x07summary\x18\x02 \x01(\t2F\n\x0cLogProcessor\x12\x36\n\x0bProcessLogs\x12\x12.plugin.LogRequest\x1a\x13.plugin.LogResponseb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0cplugin.proto\x12\x06plugin\"\x0f\n\rHealthRequest\"\x8c\x01\n\x0cWorkerHealth\x12\x0e\n\x06worker\x18\x01 \x01(\x05\x12\x0b\n\x03pid\x18\x02 \x01(\x05\x12\x0e\n\x06status\x18\x03 \x01(\t\x12\x10\n\x08requests\x18\x04 \x01(\x03\x12\x0e\n\x06\x65rrors\x18\x05 \x01(\x03\x12\x12\n\nuptime_sec\x18\x06 \x01(\x01\x12\x19\n\x11heartbeat_age_sec\x18\x07 \x01(\x01\"J\n\x0eHealthResponse\x12\x11\n\tserved_by\x18\x01 \x01(\x05\x12%\n\x07workers\x18\x02 \x03(\x0b\x32\x14.plugin.WorkerHealth\"&\n\x0f\x44\x65scribeRequest\x12\x13\n\x0b\x66ilter_type\x18\x01 \x01(\t\"\x1c\n\nPluginInfo\x12\x0e\n\x06\x66ields\x18\x01 \x03(\t\"\xa8\x01\n\x08LogBatch\x12\x1e\n\x04logs\x18\x01 \x03(\x0b\x32\x10.plugin.LogEntry\x12\x13\n\x0b\x66ilter_type\x18\x02 \x01(\t\x12\x34\n\nparameters\x18\x03 \x03(\x0b\x32 .plugin.LogBatch.ParametersEntry\x1a\x31\n\x0fParametersEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\"\xac\x01\n\nLogRequest\x12\x1e\n\x04logs\x18\x01 \x03(\x0b\x32\x10.plugin.LogEntry\x12\x13\n\x0b\x66ilter_type\x18\x02 \x01(\t\x12\x36\n\nparameters\x18\x03 \x03(\x0b\x32\".plugin.LogRequest.ParametersEntry\x1a\x31\n\x0fParametersEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\"\x92\x01\n\x08LogEntry\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x10\n\x08raw_json\x18\x02 \x01(\t\x12\n\n\x02ts\x18\x03 \x01(\t\x12\r\n\x05level\x18\x04 \x01(\t\x12\x11\n\ttf_req_id\x18\x05 \x01(\t\x12\x13\n\x0btf_resource\x18\x06 \x01(\t\x12\x0f\n\x07section\x18\x07 \x01(\t\x12\x14\n\x0ctext_excerpt\x18\x08 \x01(\t\"G\n\x0bLogResponse\x12\'\n\rfiltered_logs\x18\x01 \x03(\x0b\x32\x10.plugin.LogEntry\x12\x0f\n\x07summary\x18\x02 \x01(\t2\xf7\x01\n\x0cLogProcessor\x12\x36\n\x0bProcessLogs\x12\x12.plugin.LogRequest\x1a\x13.plugin.LogResponse\x12\x37\n\x08\x44\x65scribe\x12\x17.plugin.DescribeRequest\x1a\x12.plugin.PluginInfo\x12=\n\x10ProcessLogStream\x12\x10.plugin.LogBatch\x1a\x13.plugin.LogResponse(\x01\x30\x01\x12\x37\n\x06Health\x12\x15.plugin.HealthRequest\x1a\x16.plugin.HealthResponseb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'plugin_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
+  _globals['_LOGBATCH_PARAMETERSENTRY']._loaded_options = None
+  _globals['_LOGBATCH_PARAMETERSENTRY']._serialized_options = b'8\001'
   _globals['_LOGREQUEST_PARAMETERSENTRY']._loaded_options = None
   _globals['_LOGREQUEST_PARAMETERSENTRY']._serialized_options = b'8\001'
-  _globals['_LOGREQUEST']._serialized_start=25
-  _globals['_LOGREQUEST']._serialized_end=197
-  _globals['_LOGREQUEST_PARAMETERSENTRY']._serialized_start=148
-  _globals['_LOGREQUEST_PARAMETERSENTRY']._serialized_end=197
-  _globals['_LOGENTRY']._serialized_start=200
-  _globals['_LOGENTRY']._serialized_end=346
-  _globals['_LOGRESPONSE']._serialized_start=348
-  _globals['_LOGRESPONSE']._serialized_end=419
-  _globals['_LOGPROCESSOR']._serialized_start=421
-  _globals['_LOGPROCESSOR']._serialized_end=491
+  _globals['_HEALTHREQUEST']._serialized_start=24
+  _globals['_HEALTHREQUEST']._serialized_end=39
+  _globals['_WORKERHEALTH']._serialized_start=42
+  _globals['_WORKERHEALTH']._serialized_end=182
+  _globals['_HEALTHRESPONSE']._serialized_start=184
+  _globals['_HEALTHRESPONSE']._serialized_end=258
+  _globals['_DESCRIBEREQUEST']._serialized_start=260
+  _globals['_DESCRIBEREQUEST']._serialized_end=298
+  _globals['_PLUGININFO']._serialized_start=300
+  _globals['_PLUGININFO']._serialized_end=328
+  _globals['_LOGBATCH']._serialized_start=331
+  _globals['_LOGBATCH']._serialized_end=499
+  _globals['_LOGBATCH_PARAMETERSENTRY']._serialized_start=450
+  _globals['_LOGBATCH_PARAMETERSENTRY']._serialized_end=499
+  _globals['_LOGREQUEST']._serialized_start=502
+  _globals['_LOGREQUEST']._serialized_end=674
+  _globals['_LOGREQUEST_PARAMETERSENTRY']._serialized_start=450
+  _globals['_LOGREQUEST_PARAMETERSENTRY']._serialized_end=499
+  _globals['_LOGENTRY']._serialized_start=677
+  _globals['_LOGENTRY']._serialized_end=823
+  _globals['_LOGRESPONSE']._serialized_start=825
+  _globals['_LOGRESPONSE']._serialized_end=896
+  _globals['_LOGPROCESSOR']._serialized_start=899
+  _globals['_LOGPROCESSOR']._serialized_end=1146
 # @@protoc_insertion_point(module_scope)
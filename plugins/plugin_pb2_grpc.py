@@ -39,6 +39,21 @@ class LogProcessorStub(object):
                 request_serializer=plugin__pb2.LogRequest.SerializeToString,
                 response_deserializer=plugin__pb2.LogResponse.FromString,
                 _registered_method=True)
+        self.Describe = channel.unary_unary(
+                '/plugin.LogProcessor/Describe',
+                request_serializer=plugin__pb2.DescribeRequest.SerializeToString,
+                response_deserializer=plugin__pb2.PluginInfo.FromString,
+                _registered_method=True)
+        self.ProcessLogStream = channel.stream_stream(
+                '/plugin.LogProcessor/ProcessLogStream',
+                request_serializer=plugin__pb2.LogBatch.SerializeToString,
+                response_deserializer=plugin__pb2.LogResponse.FromString,
+                _registered_method=True)
+        self.Health = channel.unary_unary(
+                '/plugin.LogProcessor/Health',
+                request_serializer=plugin__pb2.HealthRequest.SerializeToString,
+                response_deserializer=plugin__pb2.HealthResponse.FromString,
+                _registered_method=True)
 
 
 class LogProcessorServicer(object):
@@ -50,6 +65,28 @@ class LogProcessorServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def Describe(self, request, context):
+        """Какие поля LogEntry нужны фильтру: остальные backend не читает из базы и не передает
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def ProcessLogStream(self, request_iterator, context):
+        """Логи идут пачками, отфильтрованные строки возвращаются по мере обработки;
+        последний ответ после закрытия входного потока содержит только summary
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def Health(self, request, context):
+        """Состояние всех процессов сервера плагинов (отвечает любой из них)
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_LogProcessorServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -58,6 +95,21 @@ def add_LogProcessorServicer_to_server(servicer, server):
                     request_deserializer=plugin__pb2.LogRequest.FromString,
                     response_serializer=plugin__pb2.LogResponse.SerializeToString,
             ),
+            'Describe': grpc.unary_unary_rpc_method_handler(
+                    servicer.Describe,
+                    request_deserializer=plugin__pb2.DescribeRequest.FromString,
+                    response_serializer=plugin__pb2.PluginInfo.SerializeToString,
+            ),
+            'ProcessLogStream': grpc.stream_stream_rpc_method_handler(
+                    servicer.ProcessLogStream,
+                    request_deserializer=plugin__pb2.LogBatch.FromString,
+                    response_serializer=plugin__pb2.LogResponse.SerializeToString,
+            ),
+            'Health': grpc.unary_unary_rpc_method_handler(
+                    servicer.Health,
+                    request_deserializer=plugin__pb2.HealthRequest.FromString,
+                    response_serializer=plugin__pb2.HealthResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'plugin.LogProcessor', rpc_method_handlers)
@@ -95,3 +147,84 @@ class LogProcessor(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def Describe(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/plugin.LogProcessor/Describe',
+            plugin__pb2.DescribeRequest.SerializeToString,
+            plugin__pb2.PluginInfo.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def ProcessLogStream(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(
+            request_iterator,
+            target,
+            '/plugin.LogProcessor/ProcessLogStream',
+            plugin__pb2.LogBatch.SerializeToString,
+            plugin__pb2.LogResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def Health(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/plugin.LogProcessor/Health',
+            plugin__pb2.HealthRequest.SerializeToString,
+            plugin__pb2.HealthResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
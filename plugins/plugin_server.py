@@ -2,7 +2,12 @@ import grpc
 from concurrent import futures
 import sys
 import os
+import time
 import signal
+import argparse
+import threading
+import multiprocessing
+from contextlib import contextmanager
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
@@ -13,80 +18,208 @@ try:
 except ImportError as e:
     print(f"Import error: {e}")
 
+# Порт сервера и число процессов: при PLUGIN_WORKERS > 1 процессы делят порт через SO_REUSEPORT,
+# и CPU-тяжелые фильтры работают на нескольких ядрах (в одном процессе их ограничивает GIL)
+PLUGIN_PORT = int(os.getenv('PLUGIN_PORT', 50051))
+PLUGIN_WORKERS = int(os.getenv('PLUGIN_WORKERS', 1))
+# Потоков gRPC в каждом процессе
+PLUGIN_THREADS = int(os.getenv('PLUGIN_THREADS', 10))
+# Сколько секунд даются идущим вызовам при остановке
+SHUTDOWN_GRACE = 5
+HEARTBEAT_INTERVAL = 1.0
+# Процесс без пульса дольше этого считается зависшим
+STALE_AFTER = 5.0
+
+# Слот процесса в общей памяти: pid, время старта, последний пульс, запросы, ошибки, состояние
+SLOT_FIELDS = 6
+STATUSES = ['starting', 'serving', 'stopping', 'dead']
+
+
+class WorkerStats:
+    """Состояние процессов в общей памяти (RawArray): каждый процесс пишет только свой слот,
+    а Health в любом процессе читает все слоты"""
+
+    def __init__(self, shared, worker):
+        self.shared = shared
+        self.worker = worker
+        self.base = worker * SLOT_FIELDS
+        self.lock = threading.Lock()
+
+    def start(self):
+        self.shared[self.base:self.base + SLOT_FIELDS] = [os.getpid(), time.time(), time.time(), 0, 0, 0]
+
+    def set_status(self, status):
+        self.shared[self.base + 5] = STATUSES.index(status)
+
+    def beat(self):
+        self.shared[self.base + 2] = time.time()
+
+    @contextmanager
+    def track(self):
+        with self.lock:
+            self.shared[self.base + 3] += 1
+        try:
+            yield
+        except Exception:
+            with self.lock:
+                self.shared[self.base + 4] += 1
+            raise
+
+    def snapshot(self):
+        now = time.time()
+        workers = []
+        for worker in range(len(self.shared) // SLOT_FIELDS):
+            pid, started, beat, requests, errors, status = self.shared[worker * SLOT_FIELDS:(worker + 1) * SLOT_FIELDS]
+            status = STATUSES[int(status)]
+            if status == 'serving' and now - beat > STALE_AFTER:
+                status = 'stale'
+            workers.append(plugin_pb2.WorkerHealth(
+                worker=worker, pid=int(pid), status=status, requests=int(requests), errors=int(errors),
+                uptime_sec=round(now - started, 3) if started else 0, heartbeat_age_sec=round(now - beat, 3) if beat else 0))
+        return workers
+
+
+# Поля, которые нужны каждому фильтру (кроме id); фильтру не из списка передаются все поля
+FILTER_FIELDS = {
+    'errors_only': ['level', 'text_excerpt'],
+    'warnings_only': ['level', 'text_excerpt'],
+    'group_by_resource': ['level', 'text_excerpt', 'tf_resource'],
+}
+
+
+def filter_entries(entries, filter_type):
+    # Пример фильтрации: только ошибки
+    if filter_type == "errors_only":
+        return [entry for entry in entries if entry.level == 'error']
+    elif filter_type == "warnings_only":
+        return [entry for entry in entries if entry.level == 'warning']
+    elif filter_type == "group_by_resource":
+        return list(entries)
+    else:
+        return list(entries)
+
+
 class LogProcessorServicer(plugin_pb2_grpc.LogProcessorServicer):
+    def __init__(self, stats):
+        self.stats = stats
+
     def ProcessLogs(self, request, context):
         print(f"Received request with {len(request.logs)} logs, filter: {request.filter_type}")
         
-        logs = []
-        for entry in request.logs:
-            log_dict = {
-                'id': entry.id,
-                'raw_json': entry.raw_json,
-                'ts': entry.ts,
-                'level': entry.level,
-                'tf_req_id': entry.tf_req_id,
-                'tf_resource': entry.tf_resource,
-                'section': entry.section,
-                'text_excerpt': entry.text_excerpt
-            }
-            logs.append(log_dict)
-        
-        # Пример фильтрации: только ошибки
-        if request.filter_type == "errors_only":
-            filtered = [log for log in logs if log.get('level') == 'error']
-        elif request.filter_type == "warnings_only":
-            filtered = [log for log in logs if log.get('level') == 'warning']
-        elif request.filter_type == "group_by_resource":
-            filtered = logs
-        else:
-            filtered = logs
+        with self.stats.track():
+            filtered = filter_entries(request.logs, request.filter_type)
         
         response = plugin_pb2.LogResponse()
-        for log in filtered:
-            entry = plugin_pb2.LogEntry(
-                id=log['id'],
-                raw_json=log['raw_json'],
-                ts=log['ts'],
-                level=log['level'],
-                tf_req_id=log['tf_req_id'],
-                tf_resource=log['tf_resource'],
-                section=log['section'],
-                text_excerpt=log['text_excerpt']
-            )
-            response.filtered_logs.append(entry)
+        response.filtered_logs.extend(filtered)
         
-        response.summary = f"Processed {len(logs)} logs, returned {len(filtered)} (filter: {request.filter_type})"
+        response.summary = f"Processed {len(request.logs)} logs, returned {len(filtered)} (filter: {request.filter_type})"
         print(f"Returning {len(filtered)} logs")
         return response
 
-# Глобальная переменная для сервера
-server_instance = None
+    def Describe(self, request, context):
+        fields = FILTER_FIELDS.get(request.filter_type)
+        return plugin_pb2.PluginInfo(fields=['id'] + fields if fields else [])
 
-def signal_handler(sig, frame):
-    print('Shutting down gRPC server...')
-    if server_instance:
-        server_instance.stop(5)  # Остановить за 5 секунд
-    sys.exit(0)
+    def ProcessLogStream(self, request_iterator, context):
+        filter_type = ''
+        total = returned = 0
+        with self.stats.track():
+            for batch in request_iterator:
+                filter_type = batch.filter_type or filter_type
+                filtered = filter_entries(batch.logs, filter_type)
+                total += len(batch.logs)
+                returned += len(filtered)
+                if filtered:
+                    yield plugin_pb2.LogResponse(filtered_logs=filtered)
+        print(f"Streamed {total} logs, returned {returned} (filter: {filter_type})")
+        yield plugin_pb2.LogResponse(summary=f"Processed {total} logs, returned {returned} (filter: {filter_type})")
+
+    def Health(self, request, context):
+        return plugin_pb2.HealthResponse(served_by=self.stats.worker, workers=self.stats.snapshot())
 
-def serve():
-    global server_instance
+
+def run_worker(worker, shared, port, threads, reuseport):
+    """Один процесс сервера; SIGINT/SIGTERM останавливают его, дав идущим вызовам SHUTDOWN_GRACE секунд"""
+    stats = WorkerStats(shared, worker)
+    stats.start()
+    stop = threading.Event()
+    
+    def signal_handler(sig, frame):
+        stop.set()
     
     # Регистрируем обработчик сигналов
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
     
-    server_instance = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
-    plugin_pb2_grpc.add_LogProcessorServicer_to_server(LogProcessorServicer(), server_instance)
-    server_instance.add_insecure_port('[::]:50051')
-    server_instance.start()
-    print("gRPC Plugin Server started on port 50051")
+    # Без reuseport занятый порт - ошибка, а не второй сервер на том же порту
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=threads), options=[('grpc.so_reuseport', 1 if reuseport else 0)])
+    plugin_pb2_grpc.add_LogProcessorServicer_to_server(LogProcessorServicer(stats), server)
+    if not server.add_insecure_port(f'[::]:{port}'):
+        raise RuntimeError(f"Cannot bind port {port}")
+    server.start()
+    stats.set_status('serving')
+    
+    while not stop.wait(HEARTBEAT_INTERVAL):
+        stats.beat()
+    
+    stats.set_status('stopping')
+    server.stop(SHUTDOWN_GRACE).wait()
+    stats.set_status('dead')
+
+
+def serve_workers(workers, port, threads):
+    """workers процессов на одном порту; упавший процесс перезапускается, по сигналу останавливаются все"""
+    # spawn: дочерние процессы не наследуют состояние gRPC родителя
+    ctx = multiprocessing.get_context('spawn')
+    shared = ctx.RawArray('d', workers * SLOT_FIELDS)
+    stop = threading.Event()
+    
+    def signal_handler(sig, frame):
+        stop.set()
+    
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+    
+    def start(worker):
+        process = ctx.Process(target=run_worker, args=(worker, shared, port, threads, True), name=f'plugin-worker-{worker}')
+        process.start()
+        return process
+    
+    processes = [start(worker) for worker in range(workers)]
+    print(f"gRPC Plugin Server started on port {port} with {workers} worker processes")
     print("Ready to accept connections... (Press Ctrl+C to stop)")
     
-    try:
-        server_instance.wait_for_termination()
-    except KeyboardInterrupt:
-        print("Server interrupted, shutting down...")
-        server_instance.stop(5)
+    while not stop.wait(1.0):
+        for worker, process in enumerate(processes):
+            if not process.is_alive():
+                print(f"⚠️  Worker {worker} (pid {process.pid}) exited with code {process.exitcode}, restarting")
+                shared[worker * SLOT_FIELDS + 5] = STATUSES.index('dead')
+                processes[worker] = start(worker)
+    
+    print('Shutting down gRPC server...')
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join(SHUTDOWN_GRACE + 5)
+        if process.is_alive():
+            print(f"⚠️  Worker {process.name} did not stop, killing")
+            process.kill()
+
+
+def serve(workers=PLUGIN_WORKERS, port=PLUGIN_PORT, threads=PLUGIN_THREADS):
+    if workers > 1:
+        serve_workers(workers, port, threads)
+        return
+    print(f"gRPC Plugin Server started on port {port}")
+    print("Ready to accept connections... (Press Ctrl+C to stop)")
+    run_worker(0, multiprocessing.RawArray('d', SLOT_FIELDS), port, threads, False)
+    print('Shutting down gRPC server...')
+
 
 if __name__ == '__main__':
-    serve()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="gRPC plugin server")
+    parser.add_argument('--workers', type=int, default=PLUGIN_WORKERS, help="server processes sharing the port (SO_REUSEPORT)")
+    parser.add_argument('--port', type=int, default=PLUGIN_PORT)
+    parser.add_argument('--threads', type=int, default=PLUGIN_THREADS, help="gRPC threads per process")
+    args = parser.parse_args()
+    serve(args.workers, args.port, args.threads)